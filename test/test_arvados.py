@@ -0,0 +1,139 @@
+import itertools
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from unittest import mock
+
+from wes_service import arvados_wes
+from wes_service.arvados_wes import ArvadosBackend, get_api
+from wes_service.util import LRUCache
+
+
+class ArvadosBackendTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        patches: list[Any] = [
+            mock.patch.dict(os.environ, {"ARVADOS_API_HOST": "arvados.example"}),
+            mock.patch.object(arvados_wes, "api_clients", LRUCache(8)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_api_clients(self) -> None:
+        """Clients are reused by later calls from the same thread with the same token."""
+        with mock.patch.object(
+            arvados_wes, "api_from_config", side_effect=lambda config: object()
+        ) as api_from_config:
+            assert get_api("token1") is get_api("token1")
+            assert get_api("token2") is not get_api("token1")
+            with ThreadPoolExecutor(1) as pool:
+                first = pool.submit(get_api, "token1").result()
+                assert pool.submit(get_api, "token1").result() is first
+            assert first is not get_api("token1")
+            assert api_from_config.call_count == 3
+
+    def test_list_runs(self) -> None:
+        """Pages of ListRuns are full and only hold arvados-cwl-runner runs."""
+        requests = [
+            {
+                "uuid": f"zzzzz-xvhdp-{i:015d}",
+                "command": (
+                    ["python", "arvados-cwl-runner"]
+                    if i in (1, 4)
+                    else ["arvados-cwl-runner", "--submit"]
+                ),
+                "container_uuid": f"zzzzz-dz642-{i:015d}",
+            }
+            for i in range(7)
+        ]
+        listed: list[list[Any]] = []
+
+        def list_requests(filters: list[Any], limit: int, **kwargs: Any) -> Any:
+            listed.append(filters)
+            items = [
+                cr
+                for cr in requests
+                if all(f[2] < cr["uuid"] for f in filters if f[:2] == ["uuid", ">"])
+            ]
+            return mock.Mock(**{"execute.return_value": {"items": items[:limit]}})
+
+        def list_containers(filters: list[Any], **kwargs: Any) -> Any:
+            items = [{"uuid": uuid, "state": "Running"} for uuid in filters[0][2]]
+            return mock.Mock(**{"execute.return_value": {"items": items}})
+
+        api = mock.Mock()
+        api.container_requests.return_value.list.side_effect = list_requests
+        api.containers.return_value.list.side_effect = list_containers
+        backend = ArvadosBackend([])
+        pages = []
+        page_token = None
+        with (
+            mock.patch.object(arvados_wes, "request_token", return_value="token"),
+            mock.patch.object(arvados_wes, "get_api", return_value=api),
+        ):
+            while page_token != "":
+                page = backend.ListRuns(page_size=2, page_token=page_token)
+                assert all(run["state"] == "RUNNING" for run in page["workflows"])
+                pages.append([run["run_id"][-1] for run in page["workflows"]])
+                page_token = page["next_page_token"]
+            assert pages == [["0", "2"], ["3", "5"], ["6"]]
+            assert ["command", "contains", "arvados-cwl-runner"] in listed[0]
+
+            backend.ListRuns(state_search="COMPLETE,CANCELED")
+            assert ["container.state", "in", ["Complete", "Cancelled"]] in listed[-1]
+            assert backend.ListRuns(state_search="UNKNOWN") == {
+                "workflows": [],
+                "next_page_token": "",
+            }
+
+    def test_concurrent_submissions(self) -> None:
+        """Bulk submissions are started a few at a time from a long-lived pool."""
+        backend = ArvadosBackend(
+            ["staging_dir=" + self.tmpdir.name, "max_concurrent_submissions=2"]
+        )
+        uuids = (f"zzzzz-xvhdp-{i:015d}" for i in itertools.count())
+        both_running = threading.Barrier(2, timeout=10)
+        submitted: list[tuple[str, str]] = []
+
+        def invoke_cwl_runner(cr_uuid: str, *args: Any) -> None:
+            submitted.append((cr_uuid, threading.current_thread().name))
+            if len(submitted) <= 2:
+                both_running.wait()
+
+        with (
+            mock.patch.object(
+                backend, "submission_env", return_value={"ARVADOS_API_TOKEN": "token"}
+            ),
+            mock.patch.object(arvados_wes, "get_api"),
+            mock.patch.object(
+                backend,
+                "create_container_request",
+                side_effect=lambda api: {"uuid": next(uuids)},
+            ),
+            mock.patch.object(
+                backend, "invoke_cwl_runner", side_effect=invoke_cwl_runner
+            ),
+        ):
+            response = backend.RunWorkflows(
+                workflow_url="https://example.org/wf.cwl",
+                workflow_type="CWL",
+                workflow_type_version="v1.2",
+                workflow_params="[{}, {}, {}]",
+            )
+            backend.submissions.shutdown(wait=True)
+
+        assert isinstance(response, dict)
+        assert sorted(cr_uuid for cr_uuid, _ in submitted) == response["run_ids"]
+        assert len(response["run_ids"]) == 3
+        assert all(name.startswith("wes-submit") for _, name in submitted)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from wes_service.attachment_store import AttachmentStore, file_digest
+
+
+class AttachmentStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = AttachmentStore(
+            os.path.join(self.tmpdir.name, "store"), max_size=10
+        )
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def stage(self, content: bytes, run: str) -> tuple[str, bool]:
+        rundir = os.path.join(self.tmpdir.name, run)
+        os.makedirs(rundir, exist_ok=True)
+        src = os.path.join(self.tmpdir.name, "upload")
+        with open(src, "wb") as f:
+            f.write(content)
+        dest = os.path.join(rundir, "wf.cwl")
+        return dest, self.store.materialize(src, file_digest(src), dest, rundir)
+
+    def test_deduplicate(self) -> None:
+        """Identical uploads share one inode."""
+        dest1, known1 = self.stage(b"12345", "run1")
+        dest2, known2 = self.stage(b"12345", "run2")
+        assert (known1, known2) == (False, True)
+        assert os.stat(dest1).st_ino == os.stat(dest2).st_ino
+        assert self.store.size() == 5
+        with open(dest2, "rb") as f:
+            assert f.read() == b"12345"
+
+    def test_evict(self) -> None:
+        """Unreferenced blobs are evicted, oldest first, beyond max_size."""
+        dest1, _ = self.stage(b"aaaaaa", "run1")
+        dest2, _ = self.stage(b"bbbbbb", "run2")
+        # Both blobs are still referenced.
+        assert self.store.size() == 12
+
+        self.store.release(os.path.dirname(dest1))
+        assert self.store.size() == 6
+        assert not os.path.exists(self.store.blob_path(file_digest(dest1)))
+        # The run keeps its copy.
+        with open(dest1, "rb") as f:
+            assert f.read() == b"aaaaaa"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from wes_service.events import EventStreamMiddleware
+from wes_service.run_index import RunIndex
+
+
+class EventStreamTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = RunIndex(os.path.join(self.tmpdir.name, "runs.sqlite"))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def collect(
+        self,
+        since: int | None,
+        changes: list[tuple[str, str]],
+        count: int,
+        states: set[str] | None = None,
+    ) -> list[str]:
+        """Open a stream, make changes to the index and return count messages."""
+        middleware = EventStreamMiddleware(None, self.index)  # type: ignore[arg-type]
+
+        async def receive() -> list[str]:
+            stream = middleware.stream(since, set(), states or set())
+            received: list[str] = []
+            async for message in stream:
+                received.append(message)
+                if len(received) == count:
+                    break
+            await stream.aclose()  # type: ignore[attr-defined]
+            return received
+
+        async def run() -> list[str]:
+            task = asyncio.create_task(asyncio.wait_for(receive(), 10))
+            await asyncio.sleep(0.2)
+            for run_id, state in changes:
+                self.index.set_state(run_id, state)
+            return await task
+
+        return asyncio.run(run())
+
+    def test_resume(self) -> None:
+        """Events after the cursor are replayed, then new events follow."""
+        self.index.add("run1", "QUEUED")
+        self.index.add("run2", "QUEUED")
+        received = self.collect(1, [("run2", "RUNNING")], 2)
+        assert received[0].startswith("id: 2\n")
+        assert '"run_id": "run2", "state": "QUEUED"' in received[0]
+        assert received[1].startswith("id: 3\n")
+        assert '"run_id": "run2", "state": "RUNNING"' in received[1]
+
+    def test_filter(self) -> None:
+        """Only new events matching the filters are sent."""
+        self.index.add("run1", "RUNNING")
+        self.index.add("run2", "QUEUED")
+        received = self.collect(
+            None,
+            [("run2", "INITIALIZING"), ("run2", "RUNNING"), ("run1", "COMPLETE")],
+            2,
+            states={"RUNNING", "COMPLETE"},
+        )
+        assert '"run_id": "run2", "state": "RUNNING"' in received[0]
+        assert '"run_id": "run1", "state": "COMPLETE"' in received[1]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,6 +11,7 @@ import pytest
 import requests
 
 from wes_client.util import WESClient
+from wes_service.layout import run_dir
 
 logging.basicConfig(level=logging.INFO)
 
@@ -177,9 +178,7 @@ class IntegrationTest(unittest.TestCase):
         """
         response = self.client.run(wf_input, json_input, workflow_attachment)
         assert "run_id" in response, str(response)
-        output_dir = os.path.abspath(
-            os.path.join("workflows", response["run_id"], "outdir")
-        )
+        output_dir = os.path.join(run_dir(response["run_id"]), "outdir")
         return os.path.join(output_dir, "md5sum.txt"), response["run_id"]
 
     def wait_for_finish(self, run_id: str, seconds: int = 120) -> str | None:
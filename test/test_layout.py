@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import unittest
+
+from wes_service.layout import iter_run_dirs, run_dir, shard_path
+from wes_service.migrate_layout import migrate
+from wes_service.run_index import RunIndex
+
+
+class LayoutTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "workflows")
+        os.makedirs(os.path.join(self.root, ".archive"))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_run_dir(self) -> None:
+        """New runs are sharded, runs in the flat layout are still found."""
+        sharded = run_dir("new", self.root)
+        assert sharded == shard_path(self.root, "new")
+        assert os.path.relpath(sharded, self.root).count(os.sep) == 2
+
+        os.makedirs(os.path.join(self.root, "old"))
+        assert run_dir("old", self.root) == os.path.join(self.root, "old")
+
+        os.makedirs(sharded)
+        assert {e.name for e in iter_run_dirs(self.root)} == {"new", "old"}
+
+    def test_migrate(self) -> None:
+        """Flat run directories are moved unless their run is still active."""
+        index = RunIndex(os.path.join(self.root, "runs.sqlite"))
+        for run_id, state in (
+            ("done", "COMPLETE"),
+            ("running", "RUNNING"),
+            ("canceling", "CANCELING"),
+            ("queued", "QUEUED"),
+        ):
+            os.makedirs(os.path.join(self.root, run_id, "outdir"))
+            index.add(run_id, state)
+        src = os.path.join(self.root, "done")
+        with open(os.path.join(src, "cwl.output.json"), "w") as f:
+            json.dump({"out": {"location": f"file://{src}/outdir/out.txt"}}, f)
+
+        assert migrate(self.root, index, dry_run=True) == 0
+        assert migrate(self.root, index) == 1
+
+        dest = shard_path(self.root, "done")
+        assert run_dir("done", self.root) == dest
+        with open(os.path.join(dest, "cwl.output.json")) as f:
+            assert json.load(f)["out"]["location"] == f"file://{dest}/outdir/out.txt"
+        for run_id in ("running", "canceling", "queued"):
+            assert run_dir(run_id, self.root) == os.path.join(self.root, run_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+
+from wes_service.log_scanner import LogScanner
+
+SIGNATURE = "Traceback (most recent call last)"
+
+
+class LogScannerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tmpdir.name, "stderr")
+        self.state = os.path.join(self.tmpdir.name, "stderr.scan")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def append(self, text: str) -> None:
+        with open(self.log, "a") as f:
+            f.write(text)
+
+    def scanner(self) -> LogScanner:
+        scanner = LogScanner(self.log, self.state, [SIGNATURE, "Killed"])
+        scanner.chunk_size = 16
+        return scanner
+
+    def offset(self) -> int:
+        with open(self.state) as f:
+            return int(json.load(f)["offset"])
+
+    def test_incremental(self) -> None:
+        """Only appended bytes are read, signatures split between scans are found."""
+        assert self.scanner().scan() is None
+        self.append("INFO starting\n" * 10)
+        assert self.scanner().scan() is None
+        assert self.offset() == 140
+
+        self.append("Traceback (most ")
+        assert self.scanner().scan() is None
+        self.append("recent call last):\n")
+        assert self.scanner().scan() == SIGNATURE
+        with open(self.log, "w") as f:
+            f.write("truncated\n")
+        assert self.scanner().scan() == SIGNATURE
+
+    def test_truncated(self) -> None:
+        """A log that was replaced is scanned again from the start."""
+        self.append("x" * 100)
+        assert self.scanner().scan() is None
+        os.unlink(self.log)
+        self.append("Killed\n")
+        assert self.scanner().scan() == "Killed"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from wes_service import metrics
+from wes_service.metrics import Counter, Histogram, Registry, instrument
+
+
+class MetricsTest(unittest.TestCase):
+    def test_counter(self) -> None:
+        registry = Registry()
+        counter = registry.register(Counter("c_total", "A counter.", ["op"]))
+        counter.inc(op='a"b')
+        counter.inc(2, op='a"b')
+        assert registry.render() == (
+            "# HELP c_total A counter.\n"
+            "# TYPE c_total counter\n"
+            'c_total{op="a\\"b"} 3\n'
+        )
+
+    def test_histogram(self) -> None:
+        """Buckets are cumulative and +Inf equals the count."""
+        histogram = Histogram("h", "A histogram.", buckets=[1, 2])
+        for value in (0.5, 1.5, 3):
+            histogram.observe(value)
+        assert list(histogram.samples()) == [
+            'h_bucket{le="1"} 1',
+            'h_bucket{le="2"} 2',
+            'h_bucket{le="+Inf"} 3',
+            "h_sum 5.0",
+            "h_count 3",
+        ]
+
+    def test_instrument(self) -> None:
+        """The response status of a handler is recorded."""
+
+        def handler(run_id: str) -> tuple[dict[str, str], int]:
+            return {"run_id": run_id}, 404
+
+        wrapped = instrument("TestOperation", handler)
+        assert wrapped(run_id="x") == ({"run_id": "x"}, 404)
+        assert 'wes_requests_total{operation="TestOperation",status="404"} 1' in (
+            metrics.REGISTRY.render()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
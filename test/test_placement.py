@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+from werkzeug.datastructures import FileStorage
+
+from wes_service.placement import VolumePlacement
+from wes_service.util import StagedFile, WESBackend
+
+
+class PlacementTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.volumes = [os.path.join(self.tmpdir.name, v) for v in ("a", "b")]
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_placement(self) -> None:
+        """Runs go on the volume of their attachments and are found there."""
+        placement = VolumePlacement(self.volumes, policy="free")
+        assert placement.choose() in self.volumes
+        assert placement.volume_of(os.path.join(self.volumes[1], "x")) == (
+            self.volumes[1]
+        )
+        assert placement.volume_of(self.volumes[1] + "x") is None
+
+        tempdir = tempfile.mkdtemp(dir=placement.staging_dir(self.volumes[1]))
+        workdir = placement.new_run_dir("run1", tempdir)
+        assert workdir.startswith(os.path.join(self.volumes[1], "workflows") + "/")
+        os.makedirs(workdir)
+        assert placement.find_run_dir("run1") == workdir
+
+        with self.assertRaises(ValueError):
+            VolumePlacement(self.volumes, policy="random")
+
+    def test_collect_on_volume(self) -> None:
+        """Attachments are collected on the volume they were received on."""
+        backend = WESBackend([f"volume={v}" for v in self.volumes])
+        path = os.path.join(backend.placement.staging_dir(self.volumes[0]) or "", "p")
+        stream = StagedFile(path)
+        stream.write(b"cwlVersion: v1.2\n")
+        stream.seek(0)
+        tempdir, body = backend.collect_attachments(
+            {
+                "workflow_url": "wf.cwl",
+                "workflow_params": "{}",
+                "workflow_attachment": [FileStorage(stream, "wf.cwl")],
+            }
+        )
+        stream.close()
+        assert backend.placement.volume_of(tempdir) == self.volumes[0]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import json
+import os
+import tarfile
+import tempfile
+import time
+import unittest
+from typing import Any
+
+from wes_service.retention import (
+    MAX_ARCHIVED_FILE_SIZE,
+    RunRetention,
+    read_archived_log,
+)
+from wes_service.run_index import RunIndex
+
+
+class RetentionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workflows = os.path.join(self.tmpdir.name, "workflows")
+        self.index = RunIndex(os.path.join(self.workflows, "runs.sqlite"))
+        self.removed: list[str] = []
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def make_run(self, run_id: str, state: str) -> None:
+        workdir = os.path.join(self.workflows, run_id)
+        os.makedirs(os.path.join(workdir, "outdir"))
+        os.makedirs(os.path.join(workdir, "toiljobstore", "jobs"))
+        with open(os.path.join(workdir, "outdir", "out.txt"), "w") as f:
+            f.write("output")
+        with open(os.path.join(workdir, "stderr"), "w") as f:
+            f.write("log of " + run_id)
+        with open(os.path.join(workdir, "tempdir.json"), "w") as f:
+            json.dump({"tempdir": "/staged/" + run_id}, f)
+        self.index.add(run_id, state)
+
+    def getlog(self, run_id: str) -> dict[str, Any]:
+        entry = self.index.get(run_id)
+        assert entry is not None
+        return {"run_id": run_id, "state": entry["state"], "outputs": {}}
+
+    def retention(self, **kwargs: Any) -> RunRetention:
+        return RunRetention(
+            self.index, self.workflows, self.getlog, self.removed.append, **kwargs
+        )
+
+    def test_archive(self) -> None:
+        """Finished runs are compacted into an archive which keeps their log."""
+        self.make_run("done", "COMPLETE")
+        self.make_run("running", "RUNNING")
+        with open(os.path.join(self.workflows, "done", "small"), "w") as f:
+            f.write("metadata")
+        with open(os.path.join(self.workflows, "done", "large"), "wb") as f:
+            f.truncate(MAX_ARCHIVED_FILE_SIZE + 1)
+        self.retention(archive_after=0.0).sweep()
+
+        entry = self.index.get("done")
+        assert entry is not None and entry["archive"]
+        assert entry["archive_size"] == os.stat(entry["archive"]).st_size
+        assert read_archived_log(entry["archive"]) == {
+            "run_id": "done",
+            "state": "COMPLETE",
+            "outputs": {},
+        }
+        with tarfile.open(entry["archive"]) as tar:
+            assert sorted(tar.getnames()) == ["log.json", "small", "tempdir.json"]
+        assert not os.path.exists(os.path.join(self.workflows, "done"))
+        assert os.path.exists(os.path.join(self.workflows, "running", "stderr"))
+        assert self.removed == ["/staged/done"]
+
+    def test_archive_failure(self) -> None:
+        """A run that cannot be archived does not hold up the others."""
+        self.make_run("broken", "COMPLETE")
+        self.make_run("done", "COMPLETE")
+        retention = self.retention(archive_after=0.0)
+        real_archive = retention.archive
+
+        def archive(run_id: str) -> None:
+            if run_id == "broken":
+                raise OSError("No space left on device")
+            real_archive(run_id)
+
+        retention.archive = archive  # type: ignore[method-assign]
+        retention.sweep()
+        broken, done = self.index.get("broken"), self.index.get("done")
+        assert broken is not None and not broken["archive"]
+        assert done is not None and done["archive"]
+
+    def test_keep_outputs(self) -> None:
+        self.make_run("done", "EXECUTOR_ERROR")
+        self.retention(min_free=1 << 60, keep_outputs=True).sweep()
+
+        workdir = os.path.join(self.workflows, "done")
+        assert os.listdir(workdir) == ["outdir"]
+        assert os.path.exists(os.path.join(workdir, "outdir", "out.txt"))
+
+    def test_delete(self) -> None:
+        """Archives are deleted by age, and oldest first beyond the size limit."""
+        for run_id in ("a", "b", "c"):
+            self.make_run(run_id, "COMPLETE")
+            time.sleep(0.01)
+        self.retention(archive_after=0.0).sweep()
+        archives = self.index.archived()
+        assert [a["run_id"] for a in archives] == ["a", "b", "c"]
+
+        self.retention(max_archive_size=self.index.archive_size() - 1).sweep()
+        assert self.index.get("a") is None
+        assert not os.path.exists(archives[0]["archive"])
+        assert self.index.state_counts() == {"COMPLETE": 2}
+
+        self.retention(delete_after=0.0).sweep()
+        assert self.index.archived() == []
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from wes_service.cwl_runner import CWLRunnerBackend, Workflow
+from wes_service.toil_wes import ToilBackend
+from wes_service.util import LRUCache
+
+
+class RunHandleTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+
+    def tearDown(self) -> None:
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_unknown_run(self) -> None:
+        """Unknown runs get a 404 and nothing is written for them."""
+        backend = CWLRunnerBackend(["runner=true"])
+        before = sorted(os.listdir("workflows"))
+        for response in (
+            backend.GetRunStatus("nope"),
+            backend.GetRunStatus("nope", wait=10),
+            backend.GetRunLog("nope"),
+            backend.CancelRun("nope"),
+        ):
+            assert isinstance(response, tuple) and response[1] == 404
+        assert sorted(os.listdir("workflows")) == before
+
+        Workflow("nope").getstatus()
+        assert sorted(os.listdir("workflows")) == before
+
+    def test_rejected_request(self) -> None:
+        """Invalid requests get a 400 and leave nothing behind."""
+        os.mkdir("staging")
+        backend = ToilBackend(["staging_dir=staging"])
+        before = sorted(os.listdir("workflows"))
+        response = backend.RunWorkflow(
+            workflow_url="https://example.org/wf.cwl",
+            workflow_type="CWL",
+            workflow_type_version="v9",
+            workflow_params="{}",
+        )
+        assert isinstance(response, tuple) and response[1] == 400
+        response = backend.RunWorkflow(
+            workflow_url="https://example.org/wf.cwl",
+            workflow_type="CWL",
+            workflow_type_version="v1.2",
+            workflow_params="{}",
+            workflow_engine_parameters="[1]",
+        )
+        assert isinstance(response, tuple) and response[1] == 400
+        response = backend.RunWorkflows(
+            workflow_url="https://example.org/wf.cwl",
+            workflow_type="CWL",
+            workflow_type_version="v9",
+            workflow_params="[{}, {}]",
+        )
+        assert isinstance(response, tuple) and response[1] == 400
+        assert os.listdir("staging") == []
+        assert sorted(os.listdir("workflows")) == before
+
+    def test_failed_request(self) -> None:
+        """Runs that fail to be queued leave nothing behind."""
+        os.mkdir("staging")
+        backend = CWLRunnerBackend(["runner=true", "staging_dir=staging"])
+        before = sorted(os.listdir("workflows"))
+        with mock.patch.object(Workflow, "queue", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                backend.RunWorkflow(
+                    workflow_url="https://example.org/wf.cwl",
+                    workflow_type="CWL",
+                    workflow_type_version="v1.2",
+                    workflow_params="{}",
+                )
+            with self.assertRaises(OSError):
+                backend.RunWorkflows(
+                    workflow_url="https://example.org/wf.cwl",
+                    workflow_type="CWL",
+                    workflow_type_version="v1.2",
+                    workflow_params="[{}, {}]",
+                )
+        assert os.listdir("staging") == []
+        assert sorted(os.listdir("workflows")) == before
+        assert backend.index.in_states(["QUEUED"]) == []
+
+    def test_log_keeps_claimed_run(self) -> None:
+        """Reading the log of a run being started does not queue it again."""
+        backend = CWLRunnerBackend(["runner=true"])
+        workdir = os.path.join("workflows", "run1")
+        backend.workflow("run1", workdir).queue({}, workdir)
+        backend.index.add("run1", "INITIALIZING")
+        backend.GetRunLog("run1")
+        assert backend.index.get_states(["run1"]) == {"run1": "INITIALIZING"}
+
+    def test_cancel_elsewhere(self) -> None:
+        """Runs on another host are left CANCELING for a server on that host."""
+        backend = CWLRunnerBackend(["runner=true"])
+        workdir = os.path.join("workflows", "run1")
+        backend.workflow("run1", workdir).queue({}, workdir)
+        backend.index.add("run1", "RUNNING")
+        monitor = {"host": "elsewhere", "pid": 1, "start_ticks": 0, "start_time": 0}
+        with open(os.path.join(workdir, "monitor.json"), "w") as f:
+            json.dump(monitor, f)
+        backend.CancelRun("run1")
+        time.sleep(0.5)
+        assert backend.index.get_states(["run1"]) == {"run1": "CANCELING"}
+        assert not backend.canceling
+
+        # The server on that host finishes the cancel.
+        monitor["host"] = socket.gethostname()
+        with open(os.path.join(workdir, "monitor.json"), "w") as f:
+            json.dump(monitor, f)
+        backend.resume_cancels()
+        deadline = time.monotonic() + 10
+        while backend.index.get_states(["run1"]) != {"run1": "CANCELED"}:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+    def test_lru_cache(self) -> None:
+        cache: LRUCache[str, int] = LRUCache(2)
+        cache.put("a", 1, token=1)
+        cache.put("b", 2)
+        assert cache.get("a", token=1) == 1
+        assert cache.get("a", token=2) is None
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a", token=1) == 1
+        cache.pop("a")
+        assert cache.get("a", token=1) is None
+
+    def test_lru_cache_ttl(self) -> None:
+        """Entries unused for ttl seconds are forgotten."""
+        cache: LRUCache[str, int] = LRUCache(2, ttl=1.0)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        time.sleep(0.6)
+        assert cache.get("a") == 1
+        time.sleep(0.6)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+
+
+if __name__ == "__main__":
+    unittest.main()
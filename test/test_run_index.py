@@ -0,0 +1,148 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from wes_service.run_index import KEEP_EVENTS, RunIndex
+
+
+class RunIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = RunIndex(os.path.join(self.tmpdir.name, "runs.sqlite"))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_paging(self) -> None:
+        """Pages are bounded by page_size and chained by next_page_token."""
+        for i in range(5):
+            self.index.add(f"run{i}", "QUEUED")
+
+        page, token = self.index.list_runs(2)
+        assert [r["run_id"] for r in page] == ["run0", "run1"]
+        page, token = self.index.list_runs(2, token)
+        assert [r["run_id"] for r in page] == ["run2", "run3"]
+        page, token = self.index.list_runs(2, token)
+        assert [r["run_id"] for r in page] == ["run4"]
+        assert token == ""
+
+    def test_state_search(self) -> None:
+        """Only runs in the requested states are listed."""
+        for i in range(4):
+            self.index.add(f"run{i}", "QUEUED")
+        assert self.index.set_state("run1", "COMPLETE")
+        assert not self.index.set_state("run1", "COMPLETE")
+        self.index.set_state("run3", "EXECUTOR_ERROR")
+
+        page, token = self.index.list_runs(10, states=["COMPLETE", "EXECUTOR_ERROR"])
+        assert [r["run_id"] for r in page] == ["run1", "run3"]
+        assert token == ""
+
+    def test_claim_next(self) -> None:
+        """Queued runs are claimed by priority without exceeding the limit."""
+        self.index.add("low", "QUEUED")
+        self.index.add("high", "QUEUED", priority=10)
+        self.index.add("normal", "QUEUED")
+
+        assert self.index.claim_next(2) == "high"
+        assert self.index.claim_next(2) == "low"
+        assert self.index.claim_next(2) is None
+        assert self.index.count(["INITIALIZING"]) == 2
+
+        self.index.set_state("high", "COMPLETE")
+        assert self.index.claim_next(2) == "normal"
+        assert self.index.claim_next() is None
+
+    def test_state_counts(self) -> None:
+        """State counts follow inserts and transitions."""
+        for i in range(3):
+            self.index.add(f"run{i}", "QUEUED")
+        self.index.add("run0", "RUNNING")
+        self.index.set_state("run1", "RUNNING")
+        self.index.set_state("run1", "RUNNING")
+        assert self.index.state_counts() == {"QUEUED": 2, "RUNNING": 1}
+        assert self.index.count(["QUEUED", "RUNNING"]) == 3
+
+        # Reopening an index without counts rebuilds them.
+        db = self.index._connect()
+        db.execute("DROP TABLE state_counts")
+        reopened = RunIndex(self.index.path)
+        assert reopened.state_counts() == {"QUEUED": 2, "RUNNING": 1}
+
+    def test_wait_for_change(self) -> None:
+        """Waiters are woken by a state change instead of the timeout."""
+        self.index.add("run1", "RUNNING")
+        timer = threading.Timer(0.2, self.index.set_state, ("run1", "COMPLETE"))
+        timer.start()
+        started = time.monotonic()
+        entry = self.index.wait_for_change("run1", "RUNNING", 30)
+        assert entry is not None and entry["state"] == "COMPLETE"
+        assert time.monotonic() - started < 10
+
+        entry = self.index.wait_for_change("run1", "COMPLETE", 0.1)
+        assert entry is not None and entry["state"] == "COMPLETE"
+
+    def test_wait_for_other_process(self) -> None:
+        """Changes made through another index are seen within poll_interval."""
+        self.index.add("run1", "RUNNING")
+        other = RunIndex(self.index.path)
+        timer = threading.Timer(0.2, other.set_state, ("run1", "COMPLETE"))
+        timer.start()
+        started = time.monotonic()
+        entry = self.index.wait_for_change("run1", "RUNNING", 30, poll_interval=0.1)
+        assert entry is not None and entry["state"] == "COMPLETE"
+        assert time.monotonic() - started < 10
+
+    def test_events(self) -> None:
+        """Every state transition is recorded as an event."""
+        self.index.add("run1", "QUEUED")
+        self.index.set_state("run1", "RUNNING")
+        self.index.set_state("run1", "RUNNING")
+        self.index.set_state("run1", "COMPLETE")
+        events = self.index.events_since(0)
+        assert [e["state"] for e in events] == ["QUEUED", "RUNNING", "COMPLETE"]
+        assert self.index.events_since(events[1]["seq"]) == events[2:]
+
+    def test_events_pruned(self) -> None:
+        """Only the latest KEEP_EVENTS events are kept."""
+        self.index.add_many([f"run{i}" for i in range(KEEP_EVENTS + 10)], "QUEUED")
+        first = self.index.events_since(0, limit=1)[0]["seq"]
+        assert first == self.index.last_event() - KEEP_EVENTS + 1
+
+    def test_get_states(self) -> None:
+        """States of many runs are returned at once, unknown ones are left out."""
+        for i in range(1200):
+            self.index.add(f"run{i}", "QUEUED")
+        self.index.set_state("run700", "RUNNING")
+        states = self.index.get_states([f"run{i}" for i in range(0, 1300, 100)])
+        assert len(states) == 12
+        assert states["run700"] == "RUNNING"
+        assert states["run1100"] == "QUEUED"
+
+    def test_conditional_transition(self) -> None:
+        """A transition restricted to some states leaves other runs alone."""
+        self.index.add("run1", "QUEUED")
+        assert not self.index.set_state("run1", "CANCELING", from_states=["RUNNING"])
+        assert self.index.set_state("run1", "CANCELED", from_states=["QUEUED"])
+        assert self.index.get_states(["run1"]) == {"run1": "CANCELED"}
+
+    def test_invalid_page_token(self) -> None:
+        with self.assertRaises(ValueError):
+            self.index.list_runs(10, "not-a-token")
+
+    def test_populate(self) -> None:
+        """Existing run directories are picked up once."""
+        workflows = os.path.join(self.tmpdir.name, "workflows")
+        for run_id in ("a", "b"):
+            os.makedirs(os.path.join(workflows, run_id))
+        self.index.populate(workflows, lambda run_id: "COMPLETE")
+
+        page, _ = self.index.list_runs(10)
+        assert {r["run_id"] for r in page} == {"a", "b"}
+        assert all(r["state"] == "COMPLETE" for r in page)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+
+from wes_service import metrics
+from wes_service.run_index import RunIndex
+from wes_service.run_monitor import (
+    cancel_state,
+    monitor_alive,
+    monitor_command,
+    observe_run,
+    pid_alive,
+    process_group_alive,
+    read_exit,
+    request_cancel,
+    run_log_times,
+    terminate,
+    write_monitor_info,
+)
+from wes_service.supervisor import get_supervisor
+
+
+class RunMonitorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workdir = self.tmpdir.name
+        self.index = RunIndex(os.path.join(self.workdir, "runs.sqlite"))
+        self.index.add("run1", "RUNNING")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_records_exit(self) -> None:
+        """The monitor records the exit status without help from its parent."""
+        cmd = monitor_command(
+            self.workdir, "run1", self.index, ["sh", "-c", "sleep 1; exit 2"]
+        )
+        proc = subprocess.Popen(cmd, start_new_session=True)
+        write_monitor_info(self.workdir, proc.pid)
+        assert monitor_alive(self.workdir)
+        assert read_exit(self.workdir) is None
+
+        proc.wait(timeout=30)
+        assert not monitor_alive(self.workdir)
+        exit_info = read_exit(self.workdir)
+        assert exit_info is not None
+        assert exit_info["exit_code"] == 2
+        entry = self.index.get("run1")
+        assert entry is not None and entry["state"] == "EXECUTOR_ERROR"
+
+        times = run_log_times(self.workdir)
+        assert "" < times["start_time"] <= times["end_time"]
+        assert times["resources"]["max_rss_bytes"] > 0
+        assert times["resources"]["cpu_user_seconds"] >= 0
+        before = metrics.RUN_DURATION.render()
+        observe_run(self.workdir)
+        assert metrics.RUN_DURATION.render() != before
+
+    def test_terminate(self) -> None:
+        """The whole process group is stopped, with SIGKILL if SIGTERM is ignored."""
+        ready = os.path.join(self.workdir, "ready")
+        cmd = monitor_command(
+            self.workdir,
+            "run1",
+            self.index,
+            ["sh", "-c", f"trap '' TERM; sleep 60 & touch {ready}; sleep 60"],
+        )
+        proc = subprocess.Popen(cmd, start_new_session=True)
+        write_monitor_info(self.workdir, proc.pid)
+        get_supervisor().watch(proc, lambda *args: None)
+        while not os.path.exists(ready):
+            time.sleep(0.05)
+        request_cancel(self.workdir)
+        assert cancel_state(self.workdir) == "CANCELING"
+
+        terminate(self.workdir, grace=0.5)
+        assert not process_group_alive(proc.pid)
+        exit_info = read_exit(self.workdir)
+        assert exit_info is not None and exit_info["exit_code"] == 137
+        assert cancel_state(self.workdir) == "CANCELED"
+
+    def test_pid_reuse(self) -> None:
+        """A different start time means the pid belongs to another process."""
+        proc = subprocess.Popen(["sleep", "5"])
+        try:
+            time.sleep(0.1)
+            assert pid_alive(proc.pid)
+            if os.path.isdir("/proc/self"):
+                assert not pid_alive(proc.pid, start_ticks=0)
+        finally:
+            proc.kill()
+            proc.wait()
+        assert not pid_alive(proc.pid)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import time
+import unittest
+
+from wes_service.util import WESBackend
+
+
+class EngineVersionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.runner = os.path.join(self.tmpdir.name, "runner")
+        self.write_runner("1.0")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def write_runner(self, version: str) -> None:
+        calls = os.path.join(self.tmpdir.name, "calls")
+        tmp = self.runner + ".new"
+        with open(tmp, "w") as f:
+            f.write(f"#!/bin/sh\necho x >> {calls}\necho {version} >&2\n")
+        os.chmod(tmp, 0o755)
+        os.replace(tmp, self.runner)
+
+    def calls(self) -> int:
+        with open(os.path.join(self.tmpdir.name, "calls")) as f:
+            return len(f.readlines())
+
+    def test_cached(self) -> None:
+        """The engine is only asked for its version once."""
+        backend = WESBackend([])
+        assert "1.0" in backend.engine_version(self.runner)
+        assert "1.0" in backend.engine_version(self.runner)
+        assert self.calls() == 1
+
+    def test_invalidated(self) -> None:
+        """Replacing the engine or expiry of the TTL invalidates the cache."""
+        backend = WESBackend([])
+        backend.engine_version(self.runner)
+        self.write_runner("2.0")
+        assert "2.0" in backend.engine_version(self.runner)
+        assert self.calls() == 2
+
+        backend = WESBackend(["service_info_ttl=0.1"])
+        backend.engine_version(self.runner)
+        time.sleep(0.2)
+        backend.engine_version(self.runner)
+        assert self.calls() == 4
+
+
+if __name__ == "__main__":
+    unittest.main()
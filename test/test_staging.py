@@ -0,0 +1,139 @@
+import io
+import os
+import tempfile
+import unittest
+from typing import Any
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from wes_service.cwl_runner import CWLRunnerBackend
+from wes_service.run_index import FINAL_STATES
+from wes_service.util import StagedFile, WESBackend, parse_size
+
+
+class StagingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_parse_size(self) -> None:
+        assert parse_size("512") == 512
+        assert parse_size("1.5K") == 1536
+        assert parse_size("20GB") == 20 << 30
+        assert parse_size("0") is None
+        assert parse_size(None) is None
+
+    def test_size_limit(self) -> None:
+        """Writing past the limit is refused while the file is received."""
+        with StagedFile(os.path.join(self.tmpdir.name, "part"), max_size=10) as f:
+            f.write(b"x" * 10)
+            with self.assertRaises(RequestEntityTooLarge):
+                f.write(b"x")
+
+    def test_rename_into_place(self) -> None:
+        """Staged attachments are moved, not copied, into the run directory."""
+        path = os.path.join(self.tmpdir.name, "part")
+        stream = StagedFile(path)
+        stream.write(b"cwlVersion: v1.2\n")
+        stream.seek(0)
+        backend = WESBackend(["staging_dir=" + self.tmpdir.name])
+        tempdir, body = backend.collect_attachments(
+            {
+                "workflow_url": "wf.cwl",
+                "workflow_params": "{}",
+                "workflow_attachment": [FileStorage(stream, "dir/wf.cwl")],
+            }
+        )
+        stream.close()
+
+        assert os.path.dirname(tempdir) == self.tmpdir.name
+        assert not os.path.exists(path)
+        with open(os.path.join(tempdir, "dir", "wf.cwl")) as f:
+            assert f.read() == "cwlVersion: v1.2\n"
+        assert body["workflow_url"] == "file://" + os.path.join(tempdir, "wf.cwl")
+
+    def test_staging_log(self) -> None:
+        """The size and throughput of staged attachments are in the run's stderr."""
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        self.addCleanup(os.chdir, cwd)
+        os.mkdir("staging")
+        backend = CWLRunnerBackend(["runner=true", "staging_dir=staging"])
+        stream = StagedFile(os.path.join("staging", "part"))
+        stream.write(b"cwlVersion: v1.2\n")
+        stream.seek(0)
+        args: dict[str, Any] = {
+            "workflow_url": "wf.cwl",
+            "workflow_params": "{}",
+            "workflow_attachment": [FileStorage(stream, "wf.cwl")],
+        }
+        response = backend.RunWorkflow(**args)
+        stream.close()
+
+        assert isinstance(response, dict)
+        log = backend.GetRunLog(response["run_id"])
+        assert isinstance(log, dict)
+        assert "Received attachment 'wf.cwl': 17 bytes" in log["run_log"]["stderr"]
+        assert backend.staging_logs == {}
+        status = backend.GetRunStatus(response["run_id"], wait=30, last_state="QUEUED")
+        while isinstance(status, dict) and status["state"] not in FINAL_STATES:
+            status = backend.GetRunStatus(
+                response["run_id"], wait=30, last_state=status["state"]
+            )
+
+    def test_refused_request(self) -> None:
+        """The attachments of a refused request are removed and released."""
+        staging = os.path.join(self.tmpdir.name, "staging")
+        os.mkdir(staging)
+        store = os.path.join(self.tmpdir.name, "store")
+        backend = WESBackend(["staging_dir=" + staging, "attachment_store=" + store])
+        with self.assertRaises(ValueError):
+            backend.collect_attachments(
+                {
+                    "workflow_url": "wf.cwl",
+                    "workflow_attachment": [
+                        FileStorage(io.BytesIO(b"cwlVersion: v1.2\n"), "wf.cwl")
+                    ],
+                }
+            )
+        assert os.listdir(staging) == []
+        assert backend.attachment_store is not None
+        refs = backend.attachment_store._connect().execute("SELECT * FROM refs")
+        assert refs.fetchall() == []
+
+    def test_bulk_submission(self) -> None:
+        """Each run of a bulk submission gets a hardlinked copy of the attachments."""
+        backend = WESBackend(["staging_dir=" + self.tmpdir.name, "max_bulk_runs=3"])
+        jsonl = FileStorage(io.BytesIO(b'{"n": 1}\n\n{"n": 2}\n'), "params.jsonl")
+        assert backend.collect_params_list({"workflow_params_jsonl": jsonl}) == [
+            {"n": 1},
+            {"n": 2},
+        ]
+        for bad in ("{}", "[]", "[1]", "[{}, {}, {}, {}]"):
+            with self.assertRaises(ValueError):
+                backend.collect_params_list({"workflow_params": bad})
+
+        args: dict[str, Any] = {"workflow_params": "[{}, {}]", "workflow_url": "wf.cwl"}
+        assert backend.collect_params_list(args) == [{}, {}]
+        args["workflow_attachment"] = [
+            FileStorage(io.BytesIO(b"cwlVersion: v1.2\n"), "wf.cwl")
+        ]
+        tempdir, body = backend.collect_attachments(dict(args, workflow_params="{}"))
+        rundir, run_body = backend.clone_attachments(tempdir, body, {"n": 1})
+        assert os.path.samefile(
+            os.path.join(tempdir, "wf.cwl"), os.path.join(rundir, "wf.cwl")
+        )
+        backend.remove_attachments(tempdir)
+
+        assert not os.path.exists(tempdir)
+        assert run_body["workflow_params"] == {"n": 1}
+        assert run_body["workflow_url"] == "file://" + os.path.join(rundir, "wf.cwl")
+        with open(os.path.join(rundir, "wf.cwl")) as f:
+            assert f.read() == "cwlVersion: v1.2\n"
+
+
+if __name__ == "__main__":
+    unittest.main()
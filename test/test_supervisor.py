@@ -0,0 +1,39 @@
+import subprocess
+import threading
+import unittest
+
+from wes_service.supervisor import ProcessSupervisor
+
+
+class ProcessSupervisorTest(unittest.TestCase):
+    def run_and_watch(self, cmd: list[str]) -> tuple[int, dict[str, float], bool]:
+        supervisor = ProcessSupervisor()
+        done = threading.Event()
+        result: list[tuple[int, dict[str, float]]] = []
+
+        def callback(exit_code: int, rusage: dict[str, float], end: float) -> None:
+            result.append((exit_code, rusage))
+            done.set()
+
+        proc = subprocess.Popen(cmd)
+        supervisor.watch(proc, callback)
+        assert done.wait(30)
+        exit_code, rusage = result[0]
+        assert proc.returncode == exit_code
+        return exit_code, rusage, supervisor.is_watching(proc.pid)
+
+    def test_exit_code(self) -> None:
+        """The exit code and resource usage are recorded when the child exits."""
+        exit_code, rusage, watching = self.run_and_watch(["sh", "-c", "exit 3"])
+        assert exit_code == 3
+        assert "utime" in rusage and "maxrss" in rusage
+        assert not watching
+
+    def test_signal(self) -> None:
+        """A child killed by a signal is reported as 128+signal."""
+        exit_code, _, _ = self.run_and_watch(["sh", "-c", "kill -9 $$"])
+        assert exit_code == 137
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import time
+import unittest
+
+from wes_service.run_index import RunIndex
+from wes_service.supervisor import get_supervisor
+from wes_service.toil_monitor import ToilMonitor
+from wes_service.toil_wes import FINALIZE_CLAIM_TIMEOUT, ToilWorkflow
+
+
+class ToilMonitorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = RunIndex(os.path.join(self.tmpdir.name, "runs.sqlite"))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_check(self) -> None:
+        """Finished runs are recorded, jobstores are checked at a bounded rate."""
+        self.index.add("run1", "RUNNING")
+        self.index.add("run2", "COMPLETE")
+        calls: list[tuple[str, bool]] = []
+        states = {"run1": "RUNNING"}
+
+        def getstate(run_id: str, check_jobstore: bool) -> str:
+            calls.append((run_id, check_jobstore))
+            return states[run_id]
+
+        finished: list[str] = []
+        monitor = ToilMonitor(
+            self.index, getstate, finished.append, jobstore_interval=3600
+        )
+        monitor.check()
+        monitor.check()
+        assert calls == [("run1", False), ("run1", False)]
+
+        monitor.jobstore_interval = 0
+        states["run1"] = "COMPLETE"
+        generation = self.index.generation()
+        monitor.check()
+        assert calls[-1] == ("run1", True)
+        assert self.index.get_states(["run1"]) == {"run1": "COMPLETE"}
+        assert self.index.generation() != generation
+        assert finished == ["run1"]
+        monitor.check()
+        assert len(calls) == 3 and finished == ["run1"]
+
+    def test_getstate(self) -> None:
+        """The state of a run is found without starting any process."""
+        workdir = os.path.join(self.tmpdir.name, "run1")
+        os.makedirs(workdir)
+        workflow = ToilWorkflow("run1", workdir=workdir)
+        with open(workflow.jobstorefile, "w") as f:
+            f.write(workflow.jobstore_default)
+        assert workflow.getstate() == ("INITIALIZING", -1)
+        with open(workflow.errfile, "w") as f:
+            f.write("INFO running\n")
+        assert workflow.getstate() == ("RUNNING", -1)
+        with open(os.path.join(workdir, "exit.json"), "w") as f:
+            json.dump({"exit_code": 0, "end_time": 0, "rusage": {}}, f)
+        assert workflow.getstate() == ("COMPLETE", 0)
+
+    def test_queued_log(self) -> None:
+        """Runs that never started have a log."""
+        workdir = os.path.join(self.tmpdir.name, "run1")
+        workflow = ToilWorkflow("run1", workdir=workdir)
+        workflow.queue(
+            {"workflow_type": "CWL", "workflow_type_version": "v1.2"}, workdir
+        )
+        log = workflow.getlog()
+        assert log["state"] == "QUEUED" and log["run_log"]["exit_code"] == -1
+        assert log["run_log"]["start_time"] == log["run_log"]["end_time"] == ""
+
+    def test_legacy_times(self) -> None:
+        """Runs started by older versions report their recorded times."""
+        workdir = os.path.join(self.tmpdir.name, "run1")
+        workflow = ToilWorkflow("run1", workdir=workdir)
+        workflow.queue(
+            {"workflow_type": "CWL", "workflow_type_version": "v1.2"}, workdir
+        )
+        with open(os.path.join(workdir, "starttime"), "w") as f:
+            f.write("0.5")
+        with open(os.path.join(workdir, "endtime"), "w") as f:
+            f.write("60.25")
+        run_log = workflow.getlog()["run_log"]
+        assert run_log["start_time"] == "1970-01-01T00:00:00Z"
+        assert run_log["end_time"] == "1970-01-01T00:01:00Z"
+
+    def test_call_cmd(self) -> None:
+        """The runner is started without forking the server and reaped on exit."""
+        self.index.add("run1", "RUNNING")
+        workdir = os.path.join(self.tmpdir.name, "run1")
+        os.makedirs(workdir)
+        workflow = ToilWorkflow("run1", self.index, workdir)
+        with open(workflow.jobstorefile, "w") as f:
+            f.write(workflow.jobstore_default)
+        pid = workflow.call_cmd(["sh", "-c", "exit 3"], workdir)
+        while get_supervisor().is_watching(pid):
+            time.sleep(0.01)
+        assert self.index.get_states(["run1"]) == {"run1": "EXECUTOR_ERROR"}
+        assert workflow.getstate() == ("EXECUTOR_ERROR", 255)
+
+    def test_outputs(self) -> None:
+        """Outputs are cleaned up and listed once, with their checksums."""
+        workdir = os.path.join(self.tmpdir.name, "run1")
+        workflow = ToilWorkflow("run1", workdir=workdir)
+        os.makedirs(os.path.join(workflow.outdir, "sub"))
+        os.makedirs(os.path.join(workflow.outdir, "out_tmpdir1"))
+        with open(workflow.jobstorefile, "w") as f:
+            f.write(workflow.jobstore_default)
+        with open(os.path.join(workflow.outdir, "sub", "a.txt"), "w") as f:
+            f.write("hello\n")
+        outputs = workflow.outputs()
+        assert not os.path.exists(os.path.join(workflow.outdir, "out_tmpdir1"))
+        assert outputs == {
+            os.path.join("sub", "a.txt"): {
+                "location": os.path.join(workflow.outdir, "sub", "a.txt"),
+                "size": 6,
+                "checksum": "sha1$f572d396fae9206628714fb2ce00f72e94f2258f",
+                "class": "File",
+            }
+        }
+        with open(workflow.manifestfile) as f:
+            assert json.load(f)[os.path.join("sub", "a.txt")]["location"] == (
+                os.path.join("sub", "a.txt")
+            )
+        os.unlink(os.path.join(workflow.outdir, "sub", "a.txt"))
+        assert workflow.outputs() == outputs
+        assert not os.path.exists(workflow.finalizingfile)
+
+    def test_claim_finalize(self) -> None:
+        """Outputs are listed by one process, or by another once it died."""
+        workdir = os.path.join(self.tmpdir.name, "run1")
+        os.makedirs(workdir)
+        workflow = ToilWorkflow("run1", workdir=workdir)
+        assert workflow.claim_finalize()
+        assert not workflow.claim_finalize()
+        assert workflow.finalize() is None
+
+        dead = subprocess.Popen(["true"])
+        dead.wait()
+        with open(workflow.finalizingfile, "w") as f:
+            json.dump(
+                {"host": socket.gethostname(), "pid": dead.pid, "start_ticks": 1}, f
+            )
+        assert workflow.claim_finalize()
+
+        # A process on another host cannot be checked, only its claim's age.
+        with open(workflow.finalizingfile, "w") as f:
+            json.dump({"host": "elsewhere", "pid": 1, "start_ticks": 1}, f)
+        assert not workflow.claim_finalize()
+        old = time.time() - FINALIZE_CLAIM_TIMEOUT - 1
+        os.utime(workflow.finalizingfile, (old, old))
+        assert workflow.claim_finalize()
+        with open(workflow.manifestfile, "w") as f:
+            json.dump({}, f)
+        os.unlink(workflow.finalizingfile)
+        assert not workflow.claim_finalize()
+        assert not os.path.exists(workflow.finalizingfile)
+
+
+if __name__ == "__main__":
+    unittest.main()
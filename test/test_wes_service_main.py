@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from wes_service.wes_service_main import get_parser, setup
+
+
+class ApiTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+
+    def tearDown(self) -> None:
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_run_statuses_limit(self) -> None:
+        """At most 1000 runs are looked up by one x-status request."""
+        app = setup(get_parser().parse_args(["--opt", "runner=true"]))
+        with app.test_client() as client:
+            response = client.post(
+                "/ga4gh/wes/v1/x-status", json={"run_ids": ["run1"] * 1000}
+            )
+            assert response.status_code == 200
+            assert len(response.json()["runs"]) == 1000
+            response = client.post(
+                "/ga4gh/wes/v1/x-status", json={"run_ids": ["run1"] * 1001}
+            )
+            assert response.status_code == 400
+
+    def test_events_documented(self) -> None:
+        """The event stream is in the API, and refused by backends without it."""
+        args = get_parser().parse_args(["--backend", "wes_service.arvados_wes"])
+        with mock.patch.dict(os.environ, {"ARVADOS_API_HOST": "arvados.example"}):
+            app = setup(args)
+        with app.test_client() as client:
+            response = client.get("/ga4gh/wes/v1/x-events")
+            assert response.status_code == 501
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -244,20 +244,37 @@ class WESClient:
         )
         return wes_response(postresult)
 
-    def list_runs(self) -> dict[str, Any]:
+    def list_runs(
+        self,
+        page_size: int | None = None,
+        page_token: str | None = None,
+        state_search: str | None = None,
+    ) -> dict[str, Any]:
         """
         List the workflows, this endpoint will list the workflows
         in order of oldest to newest. There is no guarantee of
         live updates as the user traverses the pages, the behavior
         should be decided (and documented) by each implementation.
 
+        :param page_size: The preferred number of workflow runs to return.
+        :param page_token: The next_page_token of the previous page, if any.
+        :param state_search: Comma separated list of states to filter on.
         :param str auth: String to send in the auth header.
         :param proto: Schema where the server resides (http, https)
         :param host: Port where the post request will be sent and the wes server listens at (default 8080)
         :return: The body of the get result as a dictionary.
         """
+        params: dict[str, Any] = {}
+        if page_size is not None:
+            params["page_size"] = page_size
+        if page_token:
+            params["page_token"] = page_token
+        if state_search:
+            params["state_search"] = state_search
         postresult = requests.get(  # nosec B113
-            f"{self.proto}://{self.host}/ga4gh/wes/v1/runs", headers=self.auth
+            f"{self.proto}://{self.host}/ga4gh/wes/v1/runs",
+            headers=self.auth,
+            params=params,
         )
         return wes_response(postresult)
 
@@ -286,6 +303,31 @@ class WESClient:
         )
         return wes_response(postresult)
 
+    def run_many(
+        self,
+        wf: str,
+        params_list: list[dict[str, Any]],
+        attachments: list[str] | None,
+    ) -> dict[str, Any]:
+        """
+        Run a workflow once for each set of parameters, uploading the attachments once.
+
+        :param wf: A local/http/https path to a cwl/wdl/python workflow file.
+        :param params_list: The inputs of each run.
+        :param list attachments: A list of local paths to files that will be uploaded to the server.
+
+        :return: The body of the post result as a dictionary, with the ids of the runs.
+        """
+        attachments = list(expand_globs(attachments))
+        parts, files = build_wes_request(wf, json.dumps(params_list), attachments)
+        postresult = requests.post(  # nosec B113
+            f"{self.proto}://{self.host}/ga4gh/wes/v1/x-runs",
+            data=parts,
+            files=files,
+            headers=self.auth,
+        )
+        return wes_response(postresult)
+
     def cancel(self, run_id: str) -> dict[str, Any]:
         """
         Cancel a running workflow.
@@ -318,18 +360,43 @@ class WESClient:
         )
         return wes_response(postresult)
 
-    def get_run_status(self, run_id: str) -> dict[str, Any]:
+    def get_run_status(
+        self, run_id: str, wait: int | None = None, last_state: str | None = None
+    ) -> dict[str, Any]:
         """
         Get quick status info about a running workflow.
 
         :param run_id: String (typically a uuid) identifying the run.
+        :param wait: Ask the server to wait up to this many seconds for the
+            state to change from last_state before responding.
+        :param last_state: The state last seen by the caller.
         :param str auth: String to send in the auth header.
         :param proto: Schema where the server resides (http, https)
         :param host: Port where the post request will be sent and the wes server listens at (default 8080)
         :return: The body of the get result as a dictionary.
         """
+        params: dict[str, Any] = {}
+        if wait is not None:
+            params["wait"] = wait
+        if last_state is not None:
+            params["last_state"] = last_state
         postresult = requests.get(  # nosec B113
             f"{self.proto}://{self.host}/ga4gh/wes/v1/runs/{run_id}/status",
             headers=self.auth,
+            params=params,
+        )
+        return wes_response(postresult)
+
+    def get_run_statuses(self, run_ids: list[str]) -> dict[str, Any]:
+        """
+        Get quick status info about many workflows in one request.
+
+        :param run_ids: The run ids of the workflows.
+        :return: The body of the post result as a dictionary.
+        """
+        postresult = requests.post(  # nosec B113
+            f"{self.proto}://{self.host}/ga4gh/wes/v1/x-status",
+            json={"run_ids": run_ids},
+            headers=self.auth,
         )
         return wes_response(postresult)
@@ -88,9 +88,7 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
     client = WESClient({"auth": auth, "proto": args.proto, "host": args.host})
 
     if args.list:
-        response = (
-            client.list_runs()
-        )  # how to include: page_token=args.page, page_size=args.page_size ?
+        response = client.list_runs(page_size=args.page_size, page_token=args.page)
         json.dump(response, sys.stdout, indent=4)
         return 0
 
@@ -137,8 +135,12 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
 
     r = client.get_run_status(run_id=r["run_id"])
     while r["state"] in ("QUEUED", "INITIALIZING", "RUNNING"):
-        time.sleep(8)
-        r = client.get_run_status(run_id=r["run_id"])
+        started = time.time()
+        last_state = r["state"]
+        r = client.get_run_status(run_id=r["run_id"], wait=60, last_state=last_state)
+        if r["state"] == last_state:
+            # The server may not support waiting, don't poll too often.
+            time.sleep(max(0, 8 - (time.time() - started)))
 
     logging.info("State is %s", r["state"])
 
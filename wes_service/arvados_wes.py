@@ -1,6 +1,7 @@
 """Arvados backed for the WES service."""
 
 import functools
+import hashlib
 import json
 import logging
 import os
@@ -9,6 +10,7 @@ import subprocess  # nosec B404
 import tempfile
 import threading
 from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, cast
 
 import arvados  # type: ignore[import-untyped]
@@ -17,32 +19,109 @@ import arvados.errors  # type: ignore[import-untyped]
 import arvados.util  # type: ignore[import-untyped]
 import connexion  # type: ignore[import-untyped]
 
-from wes_service.util import WESBackend, visit
+from wes_service import metrics
+from wes_service.util import LRUCache, WESBackend, parse_state_search, visit
 
 
 class MissingAuthorization(Exception):
     pass
 
 
+# Arvados API clients by token and thread, see get_api.
+api_clients: LRUCache[tuple[str, int], Any] = LRUCache(256, ttl=300)
+
+
+def api_from_config(apiconfig: dict[str, str]) -> arvados.api.api:
+    """Create an Arvados API object which records its round-trips in the metrics."""
+    # The discovery document is kept in the user's cache directory, so
+    # that new clients do not fetch it again.
+    api = arvados.api_from_config(version="v1", apiconfig=apiconfig, cache=True)
+    http = api._http
+    request = http.request
+
+    def timed_request(uri: str, method: str = "GET", *args: Any, **kwargs: Any) -> Any:
+        with metrics.ARVADOS_API_CALLS.time(method=method):
+            return request(uri, method, *args, **kwargs)
+
+    http.request = timed_request
+    return api
+
+
+def request_token() -> str:
+    """Return the Arvados token the current request was made with."""
+    if not connexion.request.headers.get("Authorization"):
+        raise MissingAuthorization()
+    authtoken = cast(str, connexion.request.headers["Authorization"])
+    if not authtoken.startswith("Bearer ") or authtoken.startswith("OAuth2 "):
+        raise ValueError("Authorization token must start with 'Bearer '")
+    return authtoken[7:]
+
+
 def get_api(authtoken: str | None = None) -> arvados.api.api:
-    """Retrieve an Arvados API object."""
-    if authtoken is None:
-        if not connexion.request.headers.get("Authorization"):
-            raise MissingAuthorization()
-        authtoken = connexion.request.headers["Authorization"]
-        if not authtoken.startswith("Bearer ") or authtoken.startswith("OAuth2 "):
-            raise ValueError("Authorization token must start with 'Bearer '")
-        authtoken = authtoken[7:]
-    return arvados.api_from_config(
-        version="v1",
-        apiconfig={
-            "ARVADOS_API_HOST": os.environ["ARVADOS_API_HOST"],
-            "ARVADOS_API_TOKEN": authtoken,
-            "ARVADOS_API_HOST_INSECURE": os.environ.get(
-                "ARVADOS_API_HOST_INSECURE", "false"
-            ),  # NOQA
-        },
+    """
+    Retrieve an Arvados API object.
+
+    Clients are reused, with their connections, by later requests made
+    with the same token.  A client must not be used by two threads at
+    once, so each thread has its own.  The token is only kept hashed in
+    the key of the cache.
+    """
+    apiconfig = {
+        "ARVADOS_API_HOST": os.environ["ARVADOS_API_HOST"],
+        "ARVADOS_API_TOKEN": authtoken or request_token(),
+        "ARVADOS_API_HOST_INSECURE": os.environ.get(
+            "ARVADOS_API_HOST_INSECURE", "false"
+        ),  # NOQA
+    }
+    key = (
+        hashlib.sha256(json.dumps(apiconfig, sort_keys=True).encode()).hexdigest(),
+        threading.get_ident(),
     )
+    api = api_clients.get(key)
+    if api is None:
+        api = api_from_config(apiconfig)
+        api_clients.put(key, api)
+    return api
+
+
+# Container uuids per listing of containers, and listings made at once.
+LIST_CHUNK_SIZE = 100
+LIST_WORKERS = 8
+
+
+def list_containers(
+    authtoken: str,
+    uuids: list[str],
+    select: list[str],
+    executor: ThreadPoolExecutor | None = None,
+) -> list[dict[str, Any]]:
+    """
+    List the containers with the given uuids, LIST_CHUNK_SIZE at a time.
+
+    With executor, the chunks are listed concurrently on its threads.
+    """
+
+    def list_chunk(chunk: list[str]) -> list[dict[str, Any]]:
+        return cast(
+            list[dict[str, Any]],
+            get_api(authtoken)
+            .containers()
+            .list(
+                filters=[["uuid", "in", chunk]],
+                select=select,
+                limit=len(chunk),
+                count="none",
+            )
+            .execute()["items"],
+        )
+
+    # Keep the filters, which are sent in the query string, reasonably short.
+    chunks = [
+        uuids[i : i + LIST_CHUNK_SIZE] for i in range(0, len(uuids), LIST_CHUNK_SIZE)
+    ]
+    if executor is None or len(chunks) <= 1:
+        return [c for chunk in chunks for c in list_chunk(chunk)]
+    return [c for containers in executor.map(list_chunk, chunks) for c in containers]
 
 
 statemap = {
@@ -53,6 +132,8 @@ statemap = {
     "Cancelled": "CANCELED",
 }
 
+FINAL_CONTAINER_STATES = ("Complete", "Cancelled")
+
 
 def catch_exceptions(orig_func: Callable[..., Any]) -> Callable[..., Any]:
     """Catch uncaught exceptions and turn them into http errors"""
@@ -86,21 +167,49 @@ def catch_exceptions(orig_func: Callable[..., Any]) -> Callable[..., Any]:
 
 
 class ArvadosBackend(WESBackend):
-    """Arvados backend for the WES Service."""
+    """
+    Arvados backend for the WES Service.
+
+    Options:
+
+    api_cache_size: Arvados API clients kept for reuse (default 256)
+    api_cache_ttl: seconds an unused API client is kept (default 300)
+    run_cache_size: logs of finished runs kept in memory (default 64)
+    max_concurrent_submissions: arvados-cwl-runner processes started at
+        once (default 4)
+
+    API clients are cached per thread, so the concurrent API calls and
+    the submissions are made from long-lived thread pools, whose threads
+    keep reusing their clients.
+    """
+
+    def __init__(self, opts: list[str]) -> None:
+        """Parse options, size the caches and create the thread pools."""
+        super().__init__(opts)
+        api_clients.maxsize = int(self.getopt("api_cache_size", default="256") or 0)
+        api_clients.ttl = float(self.getopt("api_cache_ttl", default="300") or 0)
+        self.run_logs: LRUCache[str, dict[str, Any]] = LRUCache(
+            int(self.getopt("run_cache_size", default="64") or 0)
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=LIST_WORKERS, thread_name_prefix="wes-arvados"
+        )
+        self.submissions = ThreadPoolExecutor(
+            max_workers=int(self.getopt("max_concurrent_submissions") or 4),
+            thread_name_prefix="wes-submit",
+        )
 
     def GetServiceInfo(self) -> dict[str, Any]:
         """Report metadata about this WES endpoint."""
-        stdout, stderr = subprocess.Popen(  # nosec B603
-            [shutil.which("arvados-cwl-runner") or "arvados-cwl-runner", "--version"],
-            stderr=subprocess.PIPE,
-        ).communicate()
         return {
             "workflow_type_versions": {
                 "CWL": {"workflow_type_version": ["v1.0", "v1.1", "v1.2"]}
             },
             "supported_wes_versions": ["0.3.0", "1.0.0"],
             "supported_filesystem_protocols": ["http", "https", "keep"],
-            "workflow_engine_versions": {"arvados-cwl-runner": str(stderr)},
+            "workflow_engine_versions": {
+                "arvados-cwl-runner": self.engine_version("arvados-cwl-runner")
+            },
             "default_workflow_engine_parameters": [],
             "system_state_counts": {},
             "auth_instructions_url": "http://doc.arvados.org/user/reference/api-tokens.html",
@@ -114,46 +223,77 @@ class ArvadosBackend(WESBackend):
         page_token: str | None = None,
         state_search: Any = None,
     ) -> dict[str, Any]:
-        """List the known workflow runs."""
-        api = get_api()
-
-        paging = []
-        if page_token:
-            paging = [["uuid", ">", page_token]]
-
-        requests = (
-            api.container_requests()
-            .list(
-                filters=[
-                    ["requesting_container_uuid", "=", None],
-                    ["container_uuid", "!=", None],
-                ]
-                + paging,
-                select=["uuid", "command", "container_uuid"],
-                order=["uuid"],
-                limit=page_size,
+        """
+        List the known workflow runs.
+
+        Requests whose command mentions arvados-cwl-runner and, with
+        state_search, whose container is in one of the requested states
+        are listed by the API server.  It cannot match on the first word
+        of the command alone, so requests that merely mention
+        arvados-cwl-runner are dropped here and more are listed until the
+        page is full.  The states of the containers are then looked up
+        concurrently.
+        """
+        authtoken = request_token()
+        api = get_api(authtoken)
+        page_size = self.get_page_size(page_size)
+
+        filters = [
+            ["requesting_container_uuid", "=", None],
+            ["container_uuid", "!=", None],
+            ["command", "contains", "arvados-cwl-runner"],
+        ]
+        states = parse_state_search(state_search)
+        if states is not None:
+            container_states = [c for c, s in statemap.items() if s in states]
+            if not container_states:
+                return {"workflows": [], "next_page_token": ""}
+            filters.append(["container.state", "in", container_states])
+
+        runs: list[dict[str, Any]] = []
+        after = page_token
+        while True:
+            requests = (
+                api.container_requests()
+                .list(
+                    filters=filters + ([["uuid", ">", after]] if after else []),
+                    select=["uuid", "command", "container_uuid"],
+                    order=["uuid"],
+                    limit=page_size,
+                    count="none",
+                )
+                .execute()["items"]
             )
-            .execute()["items"]
-        )
-        containers = (
-            api.containers()
-            .list(
-                filters=[["uuid", "in", [w["container_uuid"] for w in requests]]],
-                select=["uuid", "state"],
+            runs.extend(
+                [
+                    cr
+                    for cr in requests
+                    if cr["command"] and cr["command"][0] == "arvados-cwl-runner"
+                ][: page_size - len(runs)]
             )
-            .execute()["items"]
-        )
-
-        uuidmap = {c["uuid"]: statemap[c["state"]] for c in containers}
-
-        workflow_list = [
-            {"run_id": cr["uuid"], "state": uuidmap.get(cr["container_uuid"])}
-            for cr in requests
-            if cr["command"] and cr["command"][0] == "arvados-cwl-runner"
-        ]
+            if len(runs) == page_size:
+                next_page_token = runs[-1]["uuid"]
+                break
+            if len(requests) < page_size:
+                next_page_token = ""
+                break
+            after = requests[-1]["uuid"]
+
+        uuidmap = {
+            c["uuid"]: statemap[c["state"]]
+            for c in list_containers(
+                authtoken,
+                [cr["container_uuid"] for cr in runs],
+                ["uuid", "state"],
+                self.executor,
+            )
+        }
         return {
-            "workflows": workflow_list,
-            "next_page_token": workflow_list[-1]["run_id"] if workflow_list else "",
+            "workflows": [
+                {"run_id": cr["uuid"], "state": uuidmap.get(cr["container_uuid"])}
+                for cr in runs
+            ],
+            "next_page_token": next_page_token,
         }
 
     def log_for_run(
@@ -176,18 +316,11 @@ class ArvadosBackend(WESBackend):
         workflow_url: str,
         workflow_params: Any,
         env: dict[str, str],
-        project_uuid: str,
+        project_uuid: str | None,
         tempdir: str,
     ) -> None:
         """Submit the workflow using `arvados-cwl-runner`."""
-        api = arvados.api_from_config(
-            version="v1",
-            apiconfig={
-                "ARVADOS_API_HOST": env["ARVADOS_API_HOST"],
-                "ARVADOS_API_TOKEN": env["ARVADOS_API_TOKEN"],
-                "ARVADOS_API_HOST_INSECURE": env["ARVADOS_API_HOST_INSECURE"],  # NOQA
-            },
-        )
+        api = get_api(env["ARVADOS_API_TOKEN"])
 
         try:
             with tempfile.NamedTemporaryFile(
@@ -229,6 +362,7 @@ class ArvadosBackend(WESBackend):
                     cr_uuid, "Executing %s" % cmd, env["ARVADOS_API_TOKEN"]
                 )
 
+                metrics.SUBPROCESS_STARTS.inc(command="arvados-cwl-runner")
                 proc = subprocess.Popen(  # nosec B603
                     cmd,
                     env=env,
@@ -248,6 +382,8 @@ class ArvadosBackend(WESBackend):
 
             if tempdir:
                 shutil.rmtree(tempdir)
+                if self.attachment_store is not None:
+                    self.attachment_store.release(tempdir)
 
         except subprocess.CalledProcessError as e:
             api.container_requests().update(
@@ -259,9 +395,8 @@ class ArvadosBackend(WESBackend):
                 },
             ).execute()
 
-    @catch_exceptions
-    def RunWorkflow(self, **args: str) -> tuple[dict[str, Any], int] | dict[str, Any]:
-        """Submit the workflow run request."""
+    def submission_env(self) -> dict[str, str]:
+        """Return the environment for arvados-cwl-runner with the caller's token."""
         if not connexion.request.headers.get("Authorization"):
             raise MissingAuthorization()
 
@@ -269,7 +404,7 @@ class ArvadosBackend(WESBackend):
         if authtoken.startswith("Bearer ") or authtoken.startswith("OAuth2 "):
             authtoken = authtoken[7:]
 
-        env = {
+        return {
             "PATH": os.environ["PATH"],
             "ARVADOS_API_HOST": os.environ["ARVADOS_API_HOST"],
             "ARVADOS_API_TOKEN": authtoken,
@@ -278,9 +413,10 @@ class ArvadosBackend(WESBackend):
             ),  # NOQA
         }
 
-        api = get_api()
-
-        cr = (
+    def create_container_request(self, api: Any) -> dict[str, Any]:
+        """Create the Uncommitted container request which stands for a run."""
+        return cast(
+            dict[str, Any],
             api.container_requests()
             .create(
                 body={
@@ -293,9 +429,28 @@ class ArvadosBackend(WESBackend):
                     }
                 }
             )
-            .execute()
+            .execute(),
         )
 
+    def cancel_container_request(self, api: Any, cr_uuid: str) -> None:
+        """Cancel a container request whose submission failed."""
+        api.container_requests().update(
+            uuid=cr_uuid,
+            body={
+                "container_request": {
+                    "name": "Cancelled container request",
+                    "priority": 0,
+                }
+            },
+        ).execute()
+
+    @catch_exceptions
+    def RunWorkflow(self, **args: str) -> tuple[dict[str, Any], int] | dict[str, Any]:
+        """Submit the workflow run request."""
+        env = self.submission_env()
+        api = get_api()
+        cr = self.create_container_request(api)
+
         try:
             tempdir, body = self.collect_attachments(args, cr["uuid"])
 
@@ -306,32 +461,18 @@ class ArvadosBackend(WESBackend):
             if workflow_engine_parameters:
                 project_uuid = workflow_engine_parameters.get("project_uuid")
 
-            threading.Thread(
-                target=self.invoke_cwl_runner,
-                args=(
-                    cr["uuid"],
-                    body["workflow_url"],
-                    body["workflow_params"],
-                    env,
-                    project_uuid,
-                    tempdir,
-                ),
-            ).start()
+            self.submissions.submit(
+                self.invoke_cwl_runner,
+                cr["uuid"],
+                body["workflow_url"],
+                body["workflow_params"],
+                env,
+                project_uuid,
+                tempdir,
+            )
         except ValueError as e:
             self.log_for_run(cr["uuid"], "Bad request: " + str(e))
-            cr = (
-                api.container_requests()
-                .update(
-                    uuid=cr["uuid"],
-                    body={
-                        "container_request": {
-                            "name": "Cancelled container request",
-                            "priority": 0,
-                        }
-                    },
-                )
-                .execute()
-            )
+            self.cancel_container_request(api, cr["uuid"])
             return {"msg": str(e), "status_code": 400}, 400
         except Exception as e:
             logging.exception("Error")
@@ -339,41 +480,111 @@ class ArvadosBackend(WESBackend):
                 cr["uuid"],
                 "An exception ocurred while handling your request: " + str(e),
             )
-            cr = (
-                api.container_requests()
-                .update(
-                    uuid=cr["uuid"],
-                    body={
-                        "container_request": {
-                            "name": "Cancelled container request",
-                            "priority": 0,
-                        }
-                    },
-                )
-                .execute()
-            )
+            self.cancel_container_request(api, cr["uuid"])
             return {"msg": str(e), "status_code": 500}, 500
         else:
             return {"run_id": cr["uuid"]}
 
     @catch_exceptions
-    def GetRunLog(self, run_id: str) -> dict[str, str]:
-        """Get the log for a particular workflow run."""
+    def RunWorkflows(self, **args: Any) -> tuple[dict[str, Any], int] | dict[str, Any]:
+        """Submit one run of the workflow for each set of parameters."""
+        env = self.submission_env()
+        try:
+            params_list = self.collect_params_list(args)
+        except ValueError as e:
+            return {"msg": str(e), "status_code": 400}, 400
+
         api = get_api()
+        cr_uuids = [self.create_container_request(api)["uuid"] for _ in params_list]
+        runs = []
+        try:
+            tempdir, body = self.collect_attachments(
+                dict(args, workflow_params="{}"), cr_uuids[0]
+            )
+            try:
+                for cr_uuid, workflow_params in zip(cr_uuids, params_list):
+                    rundir, run_body = self.clone_attachments(
+                        tempdir, body, workflow_params
+                    )
+                    runs.append((cr_uuid, rundir, run_body))
+            finally:
+                self.remove_attachments(tempdir)
+        except Exception as e:
+            if isinstance(e, ValueError):
+                status, msg = 400, "Bad request: " + str(e)
+            else:
+                logging.exception("Error")
+                status = 500
+                msg = "An exception ocurred while handling your request: " + str(e)
+            for cr_uuid in cr_uuids:
+                self.log_for_run(cr_uuid, msg)
+                self.cancel_container_request(api, cr_uuid)
+            for _, rundir, _ in runs:
+                self.remove_attachments(rundir)
+            return {"msg": str(e), "status_code": status}, status
+
+        workflow_engine_parameters = cast(
+            dict[str, Any], body.get("workflow_engine_parameters", {})
+        )
+        project_uuid = None
+        if workflow_engine_parameters:
+            project_uuid = workflow_engine_parameters.get("project_uuid")
+
+        # arvados-cwl-runner is started a few runs at a time rather than
+        # with one thread per run.
+        for cr_uuid, rundir, run_body in runs:
+            self.submissions.submit(
+                self.invoke_cwl_runner,
+                cr_uuid,
+                run_body["workflow_url"],
+                run_body["workflow_params"],
+                env,
+                project_uuid,
+                rundir,
+            )
+        return {"run_ids": cr_uuids}
 
+    @catch_exceptions
+    def GetRunLog(self, run_id: str) -> dict[str, Any]:
+        """
+        Get the log for a particular workflow run.
+
+        The container, the child requests and containers and the outputs
+        are fetched concurrently.  The log of a finished run is cached;
+        the container request is still fetched on every call, so that
+        only callers allowed to read the run get its log.
+        """
+        authtoken = request_token()
+        api = get_api(authtoken)
         request = api.container_requests().get(uuid=run_id).execute()
+        # The URLs of the logs are made from the URL of the request.
+        token = (request["modified_at"], connexion.request.url)
+        log = self.run_logs.get(run_id, token)
+        if log is not None:
+            return log
+
+        outputs = self.executor.submit(
+            self.read_outputs, authtoken, request["output_uuid"]
+        )
         if request["container_uuid"]:
-            container = (
-                api.containers().get(uuid=request["container_uuid"]).execute()
-            )  # NOQA
+            container_f = self.executor.submit(
+                lambda: get_api(authtoken)
+                .containers()
+                .get(uuid=request["container_uuid"])
+                .execute()
+            )
             task_reqs = arvados.util.list_all(
                 api.container_requests().list,
-                filters=[["requesting_container_uuid", "=", container["uuid"]]],
+                filters=[["requesting_container_uuid", "=", request["container_uuid"]]],
+                select=["uuid", "name", "command", "container_uuid"],
             )
-            tasks = arvados.util.list_all(
-                api.containers().list,
-                filters=[["uuid", "in", [tr["container_uuid"] for tr in task_reqs]]],
+            tasks = list_containers(
+                authtoken,
+                [tr["container_uuid"] for tr in task_reqs if tr["container_uuid"]],
+                ["uuid", "started_at", "finished_at", "exit_code", "log"],
+                self.executor,
             )
+            container = container_f.result()
             containers_map = {c["uuid"]: c for c in tasks}
             containers_map[container["uuid"]] = container
         else:
@@ -382,30 +593,9 @@ class ArvadosBackend(WESBackend):
                 "exit_code": None,
                 "log": None,
             }
-            tasks = []
             containers_map = {}
             task_reqs = []
-
-        outputobj = {}
-        if request["output_uuid"]:
-            c = arvados.collection.CollectionReader(
-                request["output_uuid"], api_client=api
-            )
-            with c.open("cwl.output.json") as f:
-                try:
-                    outputobj = json.load(f)
-                except ValueError:
-                    pass
-
-                def keepref(d: Any) -> None:
-                    if isinstance(d, dict) and "location" in d:
-                        d["location"] = "{}c={}/_/{}".format(
-                            api._resourceDesc["keepWebServiceUrl"],
-                            c.portable_data_hash(),
-                            d["location"],
-                        )  # NOQA
-
-                visit(outputobj, keepref)
+        outputobj = outputs.result()
 
         def log_object(cr: dict[str, Any]) -> dict[str, Any]:
             if cr["container_uuid"]:
@@ -442,7 +632,7 @@ class ArvadosBackend(WESBackend):
 
             return r
 
-        return {
+        log = {
             "run_id": request["uuid"],
             "request": {
                 "workflow_url": "",
@@ -455,6 +645,33 @@ class ArvadosBackend(WESBackend):
             "task_logs": [log_object(t) for t in task_reqs],
             "outputs": outputobj,
         }
+        if request["state"] == "Final" and container["state"] in FINAL_CONTAINER_STATES:
+            self.run_logs.put(run_id, log, token)
+        return log
+
+    def read_outputs(self, authtoken: str, output_uuid: str | None) -> Any:
+        """Return the outputs of a run, with their locations in keep-web."""
+        if not output_uuid:
+            return {}
+        api = get_api(authtoken)
+        outputobj = {}
+        c = arvados.collection.CollectionReader(output_uuid, api_client=api)
+        with c.open("cwl.output.json") as f:
+            try:
+                outputobj = json.load(f)
+            except ValueError:
+                pass
+
+            def keepref(d: Any) -> None:
+                if isinstance(d, dict) and "location" in d:
+                    d["location"] = "{}c={}/_/{}".format(
+                        api._resourceDesc["keepWebServiceUrl"],
+                        c.portable_data_hash(),
+                        d["location"],
+                    )  # NOQA
+
+            visit(outputobj, keepref)
+        return outputobj
 
     @catch_exceptions
     def CancelRun(self, run_id: str) -> dict[str, Any]:  # NOQA
@@ -466,8 +683,14 @@ class ArvadosBackend(WESBackend):
         return {"run_id": request["uuid"]}
 
     @catch_exceptions
-    def GetRunStatus(self, run_id: str) -> dict[str, Any]:
-        """Determine the status for a given run."""
+    def GetRunStatus(
+        self, run_id: str, wait: Any = None, last_state: str | None = None
+    ) -> dict[str, Any]:
+        """
+        Determine the status for a given run.
+
+        Long-polling is not supported, wait and last_state are ignored.
+        """
         api = get_api()
         request = api.container_requests().get(uuid=run_id).execute()
         if request["container_uuid"]:
@@ -480,6 +703,48 @@ class ArvadosBackend(WESBackend):
             container = {"state": "Queued"}
         return {"run_id": request["uuid"], "state": statemap[container["state"]]}
 
+    @catch_exceptions
+    def GetRunStatuses(self, body: dict[str, Any]) -> dict[str, Any]:
+        """Determine the status of many runs with one listing per resource type."""
+        api = get_api()
+        run_ids = body["run_ids"]
+        requests: dict[str, dict[str, Any]] = {}
+        containers: dict[str, str] = {}
+        # Keep the filters, which are sent in the query string, reasonably short.
+        for i in range(0, len(run_ids), 500):
+            for cr in arvados.util.list_all(
+                api.container_requests().list,
+                filters=[["uuid", "in", run_ids[i : i + 500]]],
+                select=["uuid", "container_uuid", "priority"],
+            ):
+                requests[cr["uuid"]] = cr
+        container_uuids = [
+            cr["container_uuid"] for cr in requests.values() if cr["container_uuid"]
+        ]
+        for i in range(0, len(container_uuids), 500):
+            for c in arvados.util.list_all(
+                api.containers().list,
+                filters=[["uuid", "in", container_uuids[i : i + 500]]],
+                select=["uuid", "state"],
+            ):
+                containers[c["uuid"]] = c["state"]
+
+        runs = []
+        for run_id in run_ids:
+            cr = requests.get(run_id)
+            if cr is None:
+                state = "UNKNOWN"
+            elif cr["container_uuid"]:
+                state = statemap.get(
+                    containers.get(cr["container_uuid"], ""), "UNKNOWN"
+                )
+            elif cr["priority"] == 0:
+                state = "CANCELED"
+            else:
+                state = "QUEUED"
+            runs.append({"run_id": run_id, "state": state})
+        return {"runs": runs}
+
 
 def dynamic_logs(run_id: str, logstream: str) -> str:
     """Retrienve logs, chasing down the container logs as well."""
@@ -0,0 +1,209 @@
+"""Content-addressed store for workflow attachments."""
+
+import errno
+import hashlib
+import os
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    ref TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (ref, digest)
+);
+CREATE INDEX IF NOT EXISTS blobs_lru ON blobs (refcount, last_used);
+CREATE INDEX IF NOT EXISTS refs_digest ON refs (digest);
+"""
+
+
+def file_digest(path: str) -> str:
+    """Return the sha256 digest of the file at path."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _link_or_copy(src: str, dest: str) -> None:
+    """Hardlink src to dest, copying if they are on different filesystems."""
+    try:
+        os.link(src, dest)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+            raise
+        shutil.copyfile(src, dest)
+        os.chmod(dest, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+
+class AttachmentStore:
+    """
+    Attachments stored once per sha256 digest and hardlinked into runs.
+
+    Each run directory that links a blob holds a reference to it, keyed
+    by the path of the directory.  Blobs are read-only, because every
+    run linking a blob shares the same inode.  Blobs which are no longer
+    referenced are kept for later submissions and evicted, least
+    recently used first, once the store grows beyond max_size bytes.
+    """
+
+    def __init__(self, root: str, max_size: int | None = None) -> None:
+        """Open (and create if needed) the store in root."""
+        self.root = root
+        self.max_size = max_size
+        self.path = os.path.join(root, "store.sqlite")
+        self._local = threading.local()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return the connection for the calling thread."""
+        db: sqlite3.Connection | None = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def blob_path(self, digest: str) -> str:
+        """Return where the blob with digest is stored."""
+        return os.path.join(self.root, "blobs", digest[:2], digest[2:])
+
+    def materialize(self, src: str, digest: str, dest: str, ref: str) -> bool:
+        """
+        Place the content of src, which has the given digest, at dest.
+
+        If the store already has the blob, src is discarded, otherwise
+        it becomes the blob.  dest is then linked to the blob and ref
+        takes a reference on it.  Returns True if the blob was already
+        stored.
+        """
+        blob = self.blob_path(digest)
+        db = self._connect()
+        # Blob files are created and removed with the write lock held so
+        # that eviction cannot race with a submission of the same content.
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            known = (
+                db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+                is not None
+            )
+            if not known:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                _link_or_copy(src, blob)
+                os.chmod(blob, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                db.execute(
+                    "INSERT INTO blobs (digest, size, last_used) VALUES (?, ?, ?)",
+                    (digest, os.stat(blob).st_size, time.time()),
+                )
+            else:
+                db.execute(
+                    "UPDATE blobs SET last_used = ? WHERE digest = ?",
+                    (time.time(), digest),
+                )
+            if (
+                db.execute(
+                    "INSERT OR IGNORE INTO refs (ref, digest) VALUES (?, ?)",
+                    (ref, digest),
+                ).rowcount
+                > 0
+            ):
+                db.execute(
+                    "UPDATE blobs SET refcount = refcount + 1 WHERE digest = ?",
+                    (digest,),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        if os.path.lexists(dest):
+            os.unlink(dest)
+        _link_or_copy(blob, dest)
+        if src != dest:
+            os.unlink(src)
+        if not known:
+            self.evict()
+        return known
+
+    def share(self, ref: str, new_ref: str) -> None:
+        """Take a reference for new_ref on every blob referenced by ref."""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "UPDATE blobs SET refcount = refcount + 1 WHERE digest IN "
+                "(SELECT digest FROM refs WHERE ref = ? EXCEPT "
+                "SELECT digest FROM refs WHERE ref = ?)",
+                (ref, new_ref),
+            )
+            db.execute(
+                "INSERT OR IGNORE INTO refs (ref, digest) "
+                "SELECT ?, digest FROM refs WHERE ref = ?",
+                (new_ref, ref),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def release(self, ref: str) -> None:
+        """Drop the references held by ref, e.g. when a run directory is removed."""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "UPDATE blobs SET refcount = refcount - 1 "
+                "WHERE digest IN (SELECT digest FROM refs WHERE ref = ?)",
+                (ref,),
+            )
+            db.execute("DELETE FROM refs WHERE ref = ?", (ref,))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self.evict()
+
+    def size(self) -> int:
+        """Return the total size of the stored blobs."""
+        row = self._connect().execute("SELECT total(size) FROM blobs").fetchone()
+        return int(row[0])
+
+    def evict(self) -> int:
+        """Remove unreferenced blobs until the store fits in max_size; returns bytes freed."""
+        if not self.max_size:
+            return 0
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        freed = 0
+        try:
+            excess = self.size() - self.max_size
+            for digest, size in db.execute(
+                "SELECT digest, size FROM blobs WHERE refcount <= 0 "
+                "ORDER BY last_used"
+            ).fetchall():
+                if freed >= excess:
+                    break
+                db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                try:
+                    os.unlink(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                freed += size
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return freed
@@ -1,21 +1,66 @@
 import json
 import os
+import shutil
 import subprocess  # nosec B404
-import uuid
 from typing import Any, cast
 
+from wes_service import metrics
+from wes_service.layout import run_dir
+from wes_service.local_backend import LocalBackend
+from wes_service.run_index import RunIndex
+from wes_service.run_monitor import (
+    cancel_state,
+    monitor_alive,
+    monitor_command,
+    observe_run,
+    read_exit,
+    record_lost_exit,
+    run_log_times,
+    terminate,
+    write_monitor_info,
+)
+from wes_service.supervisor import get_supervisor
 from wes_service.util import WESBackend
 
 
 class Workflow:
-    def __init__(self, run_id: str) -> None:
-        """Construct a workflow runner."""
+    def __init__(
+        self, run_id: str, index: RunIndex | None = None, workdir: str | None = None
+    ) -> None:
+        """Construct a handle on a run; nothing is written until it is queued."""
         super().__init__()
         self.run_id = run_id
-        self.workdir = os.path.join(os.getcwd(), "workflows", self.run_id)
+        self.index = index
+        self.workdir = workdir or run_dir(self.run_id)
         self.outdir = os.path.join(self.workdir, "outdir")
-        if not os.path.exists(self.outdir):
-            os.makedirs(self.outdir)
+
+    def queue(self, request: dict[str, Any], tempdir: str) -> None:
+        """Persist the request so that the run can be started later."""
+        os.makedirs(self.outdir, exist_ok=True)
+        with open(os.path.join(self.workdir, "request.json"), "w") as f:
+            json.dump(request, f)
+        with open(os.path.join(self.workdir, "queued"), "w") as f:
+            json.dump({"tempdir": tempdir}, f)
+
+    def start(self, opts: WESBackend) -> None:
+        """Start a queued run."""
+        with open(os.path.join(self.workdir, "request.json")) as f:
+            request = json.load(f)
+        with open(os.path.join(self.workdir, "queued")) as f:
+            tempdir = json.load(f)["tempdir"]
+        if cancel_state(self.workdir):
+            return
+        self.run(request, tempdir, opts)
+        # Keep track of the staged attachments for the retention policy.
+        os.replace(
+            os.path.join(self.workdir, "queued"),
+            os.path.join(self.workdir, "tempdir.json"),
+        )
+        if self.index is not None:
+            self.index.set_state(self.run_id, "RUNNING", from_states=["INITIALIZING"])
+        if cancel_state(self.workdir):
+            # Canceled while it was starting.
+            self.cancel()
 
     def run(
         self, request: dict[str, str], tempdir: str, opts: WESBackend
@@ -52,7 +97,8 @@ class Workflow:
         )  # Will always be local path to descriptor cwl, or url.
 
         output = open(os.path.join(self.workdir, "cwl.output.json"), "w")
-        stderr = open(os.path.join(self.workdir, "stderr"), "w")
+        # Appended to what was logged while staging the attachments.
+        stderr = open(os.path.join(self.workdir, "stderr"), "a")
 
         runner = cast(str, opts.getopt("runner", default="cwl-runner"))
         extra = opts.getoptlist("extra")
@@ -73,19 +119,48 @@ class Workflow:
 
         # build args and run
         command_args: list[str] = [runner] + extra2 + [workflow_url, jsonpath]
+        metrics.SUBPROCESS_STARTS.inc(command=os.path.basename(runner))
         proc = subprocess.Popen(  # nosec B603
-            command_args, stdout=output, stderr=stderr, close_fds=True, cwd=tempdir
+            monitor_command(self.workdir, self.run_id, self.index, command_args),
+            stdout=output,
+            stderr=stderr,
+            close_fds=True,
+            cwd=tempdir,
+            start_new_session=True,
         )
         output.close()
         stderr.close()
-        with open(os.path.join(self.workdir, "pid"), "w") as pid:
-            pid.write(str(proc.pid))
+        write_monitor_info(self.workdir, proc.pid)
+        get_supervisor().watch(proc, self.record_exit)
 
         return self.getstatus()
 
+    def record_exit(
+        self, exit_code: int, rusage: dict[str, float], end_time: float
+    ) -> None:
+        """
+        Reap the run monitor.
+
+        The monitor records the exit status of the runner itself, this
+        only records a failure if the monitor died without doing so.
+        """
+        if read_exit(self.workdir) is None:
+            record_lost_exit(self.workdir, exit_code or 255, rusage, end_time)
+            if self.index is not None:
+                self.index.set_state(
+                    self.run_id, cancel_state(self.workdir) or "EXECUTOR_ERROR"
+                )
+        elif self.index is not None:
+            # The monitor has updated the index, wake up anyone waiting for it.
+            self.index.notify()
+        observe_run(self.workdir)
+
     def getstate(self) -> tuple[str, int]:
         """
-        Returns RUNNING, -1
+        Returns QUEUED, -1
+                RUNNING, -1
+                CANCELING, -1
+                CANCELED, the exit code if it exited
                 COMPLETE, 0
                 or
                 EXECUTOR_ERROR, 255
@@ -93,13 +168,30 @@ class Workflow:
         state = "RUNNING"
         exit_code = -1
 
+        canceled = cancel_state(self.workdir)
+        if canceled is not None:
+            exit_info = read_exit(self.workdir)
+            return canceled, exit_info["exit_code"] if exit_info else exit_code
+
         exitcode_file = os.path.join(self.workdir, "exit_code")
         pid_file = os.path.join(self.workdir, "pid")
 
-        if os.path.exists(exitcode_file):
+        exit_info = read_exit(self.workdir)
+        if exit_info is not None:
+            exit_code = exit_info["exit_code"]
+        elif (alive := monitor_alive(self.workdir)) is not None:
+            if not alive:
+                # The monitor writes exit.json before it exits, check again
+                # in case it exited after the first check.
+                exit_info = read_exit(self.workdir)
+                exit_code = exit_info["exit_code"] if exit_info else 255
+        elif os.path.exists(os.path.join(self.workdir, "queued")):
+            return "QUEUED", exit_code
+        elif os.path.exists(exitcode_file):
             with open(exitcode_file) as f:
                 exit_code = int(f.read())
         elif os.path.exists(pid_file):
+            # Started by an older version, without a monitor.
             with open(pid_file) as pid_fh:
                 pid = int(pid_fh.read())
             try:
@@ -133,8 +225,10 @@ class Workflow:
         with open(os.path.join(self.workdir, "request.json")) as f:
             request = json.load(f)
 
-        with open(os.path.join(self.workdir, "stderr")) as f:
-            stderr = f.read()
+        stderr = ""
+        if os.path.exists(os.path.join(self.workdir, "stderr")):
+            with open(os.path.join(self.workdir, "stderr")) as f:
+                stderr = f.read()
 
         outputobj = {}
         if state == "COMPLETE":
@@ -148,80 +242,48 @@ class Workflow:
             "state": state,
             "run_log": {
                 "cmd": [""],
-                "start_time": "",
-                "end_time": "",
                 "stdout": "",
                 "stderr": stderr,
                 "exit_code": exit_code,
+                **run_log_times(self.workdir),
             },
             "task_logs": [],
             "outputs": outputobj,
         }
 
-    def cancel(self) -> None:
-        """Cancel the workflow, if possible."""
+    def cancel(self, grace: float = 10.0) -> bool:
+        """
+        Stop the processes of the run and remove its partial outputs.
+
+        Returns False if they run on another host, from where the run
+        must be canceled.
+        """
+        if not terminate(self.workdir, grace):
+            return False
+        shutil.rmtree(self.outdir, ignore_errors=True)
+        return True
+
 
+class CWLRunnerBackend(LocalBackend):
+    def workflow(self, run_id: str, workdir: str | None = None) -> Workflow:
+        """Return the object representing run_id."""
+        return Workflow(run_id, self.index, workdir or self.run_dir(run_id))
 
-class CWLRunnerBackend(WESBackend):
     def GetServiceInfo(self) -> dict[str, Any]:
         """Report metadata about this WES endpoint."""
         runner = cast(str, self.getopt("runner", default="cwl-runner"))
-        stdout, stderr = subprocess.Popen(  # nosec B603
-            [runner, "--version"], stderr=subprocess.PIPE
-        ).communicate()
         r = {
             "workflow_type_versions": {
                 "CWL": {"workflow_type_version": ["v1.0", "v1.1", "v1.2"]}
             },
             "supported_wes_versions": ["0.3.0", "1.0.0"],
             "supported_filesystem_protocols": ["file", "http", "https"],
-            "workflow_engine_versions": {"cwl-runner": str(stderr)},
-            "system_state_counts": {},
+            "workflow_engine_versions": {"cwl-runner": self.engine_version(runner)},
+            "system_state_counts": self.index.state_counts(),
             "tags": {},
         }
         return r
 
-    def ListRuns(
-        self, page_size: Any = None, page_token: Any = None, state_search: Any = None
-    ) -> dict[str, Any]:
-        """List the known workflow runs."""
-        # FIXME #15 results don't page
-        if not os.path.exists(os.path.join(os.getcwd(), "workflows")):
-            return {"workflows": [], "next_page_token": ""}
-        wf = []
-        for entry in os.listdir(os.path.join(os.getcwd(), "workflows")):
-            if os.path.isdir(os.path.join(os.getcwd(), "workflows", entry)):
-                wf.append(Workflow(entry))
-
-        workflows = [{"run_id": w.run_id, "state": w.getstate()[0]} for w in wf]  # NOQA
-        return {"workflows": workflows, "next_page_token": ""}
-
-    def RunWorkflow(self, **args: str) -> dict[str, str]:
-        """Submit the workflow run request."""
-        tempdir, body = self.collect_attachments(args)
-
-        run_id = uuid.uuid4().hex
-        job = Workflow(run_id)
-
-        job.run(body, tempdir, self)
-        return {"run_id": run_id}
-
-    def GetRunLog(self, run_id: str) -> dict[str, Any]:
-        """Get the log for a particular workflow run."""
-        job = Workflow(run_id)
-        return job.getlog()
-
-    def CancelRun(self, run_id: str) -> dict[str, str]:
-        """Cancel a submitted run."""
-        job = Workflow(run_id)
-        job.cancel()
-        return {"run_id": run_id}
-
-    def GetRunStatus(self, run_id: str) -> dict[str, str]:
-        """Determine the status for a given run."""
-        job = Workflow(run_id)
-        return job.getstatus()
-
 
 def create_backend(app: Any, opts: list[str]) -> CWLRunnerBackend:
     """Instantiate the cwl-runner backend."""
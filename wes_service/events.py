@@ -0,0 +1,211 @@
+"""
+Server-Sent Events stream of run state transitions.
+
+State transitions are recorded in the events table of the run index by
+triggers, whichever process makes them.  One EventBroadcaster thread
+per server process reads new events from the index and hands them to
+every connected client, so the cost of following the runs does not
+grow with the number of clients.  Clients resume after a disconnect
+by sending the id of the last event they received in the
+``Last-Event-ID`` header (or the ``cursor`` query parameter).
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections.abc import AsyncIterator
+from typing import Any
+from urllib.parse import parse_qs
+
+from starlette.responses import Response, StreamingResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from wes_service.run_index import RunIndex
+from wes_service.util import parse_state_search
+
+EVENTS_PATH = "/ga4gh/wes/v1/x-events"
+
+
+class Subscription:
+    """The events waiting to be sent to one client."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int) -> None:
+        """Create a queue of events to be consumed on loop."""
+        self.loop = loop
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(max_pending)
+        self.overflowed = False
+
+    def put(self, event: dict[str, Any]) -> None:
+        """Queue an event; called on the event loop."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client is too slow, it will have to reconnect and resume.
+            self.overflowed = True
+
+
+class EventBroadcaster:
+    """
+    Read new events from the index and pass them to the subscriptions.
+
+    The broadcaster wakes up when the index is changed by this process,
+    and every poll_interval seconds to pick up changes made by others.
+    """
+
+    def __init__(
+        self,
+        index: RunIndex,
+        poll_interval: float = 1.0,
+        max_pending: int = 10000,
+    ) -> None:
+        """Start following the index."""
+        self.index = index
+        self.poll_interval = poll_interval
+        self.max_pending = max_pending
+        self.last_seq = index.last_event()
+        self._lock = threading.Lock()
+        self._subscriptions: set[Subscription] = set()
+        self._thread = threading.Thread(
+            target=self._loop, name="wes-events", daemon=True
+        )
+        self._thread.start()
+
+    def subscribe(self) -> Subscription:
+        """Start receiving new events on the running event loop."""
+        subscription = Subscription(asyncio.get_running_loop(), self.max_pending)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop receiving events."""
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _loop(self) -> None:
+        generation = self.index.generation()
+        while True:
+            try:
+                self.broadcast()
+            except Exception:
+                logging.exception("Failed to broadcast run events")
+            generation = self.index.wait_for_notify(generation, self.poll_interval)
+
+    def broadcast(self) -> None:
+        """Pass the events recorded since the last call to every subscription."""
+        while events := self.index.events_since(self.last_seq):
+            self.last_seq = events[-1]["seq"]
+            with self._lock:
+                subscriptions = list(self._subscriptions)
+            for subscription in subscriptions:
+                for event in events:
+                    subscription.loop.call_soon_threadsafe(subscription.put, event)
+
+
+def format_event(event: dict[str, Any]) -> str:
+    """Format an event as a Server-Sent Event."""
+    data = json.dumps(
+        {"run_id": event["run_id"], "state": event["state"], "time": event["time"]}
+    )
+    return f"id: {event['seq']}\nevent: state\ndata: {data}\n\n"
+
+
+class EventStreamMiddleware:
+    """Serve EVENTS_PATH as a stream, pass every other request on to app."""
+
+    def __init__(self, app: ASGIApp, index: RunIndex, keepalive: float = 15.0) -> None:
+        """Wrap app; the broadcaster is started with the first stream."""
+        self.app = app
+        self.index = index
+        self.keepalive = keepalive
+        self._broadcaster: EventBroadcaster | None = None
+
+    @property
+    def broadcaster(self) -> EventBroadcaster:
+        """The broadcaster for the index."""
+        if self._broadcaster is None:
+            self._broadcaster = EventBroadcaster(self.index)
+        return self._broadcaster
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Stream events, or call the wrapped app."""
+        if scope["type"] != "http" or scope["path"] != EVENTS_PATH:
+            await self.app(scope, receive, send)
+            return
+        if scope["method"] != "GET":
+            await Response(status_code=405, headers={"Allow": "GET"})(
+                scope, receive, send
+            )
+            return
+        query = parse_qs(scope["query_string"].decode())
+        headers = dict(scope["headers"])
+        cursor = (
+            headers.get(b"last-event-id", b"").decode()
+            or (query.get("cursor") or [""])[0]
+        )
+        run_ids = {r for v in query.get("run_id", []) for r in v.split(",") if r}
+        states = parse_state_search(",".join(query.get("state_search", [])))
+        try:
+            since = int(cursor) if cursor else None
+        except ValueError:
+            await Response(
+                json.dumps({"msg": f"Invalid cursor {cursor!r}", "status_code": 400}),
+                status_code=400,
+                media_type="application/json",
+            )(scope, receive, send)
+            return
+
+        response = StreamingResponse(
+            self.stream(since, run_ids, set(states or ())),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+        await response(scope, receive, send)
+
+    async def stream(
+        self, since: int | None, run_ids: set[str], states: set[str]
+    ) -> AsyncIterator[str]:
+        """
+        Yield the events after since (or from now on) which match the filters.
+
+        Events still in the index are replayed first, then new events are
+        sent as they are broadcast.
+        """
+        broadcaster = self.broadcaster
+        subscription = broadcaster.subscribe()
+        loop = asyncio.get_running_loop()
+        try:
+            last_seq = since if since is not None else broadcaster.last_seq
+            while since is not None:
+                events = await loop.run_in_executor(
+                    None, self.index.events_since, last_seq
+                )
+                if not events:
+                    break
+                for event in events:
+                    if self._matches(event, run_ids, states):
+                        yield format_event(event)
+                    last_seq = event["seq"]
+
+            while not subscription.overflowed:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), self.keepalive
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event["seq"] <= last_seq:
+                    continue
+                last_seq = event["seq"]
+                if self._matches(event, run_ids, states):
+                    yield format_event(event)
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    @staticmethod
+    def _matches(event: dict[str, Any], run_ids: set[str], states: set[str]) -> bool:
+        return (not run_ids or event["run_id"] in run_ids) and (
+            not states or event["state"] in states
+        )
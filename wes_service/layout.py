@@ -0,0 +1,54 @@
+"""
+Sharded layout of the run directories.
+
+Each run lives in ``workflows/ab/cd/<run_id>``, where ``abcd`` are the
+first hex digits of the sha256 of the run id, so that directories stay
+small however many runs are kept.  Runs created before the layout was sharded stay in
+``workflows/<run_id>`` and are still found there until they are moved
+with ``wes-migrate-layout``.
+"""
+
+import hashlib
+import os
+import re
+from collections.abc import Iterator
+
+SHARD = re.compile("^[0-9a-f]{2}$")
+
+
+def default_root() -> str:
+    """Return the directory holding the run directories."""
+    return os.path.join(os.getcwd(), "workflows")
+
+
+def shard_path(root: str, name: str) -> str:
+    """Return the sharded location of name under root."""
+    digest = hashlib.sha256(name.encode()).hexdigest()
+    return os.path.join(root, digest[:2], digest[2:4], name)
+
+
+def run_dir(run_id: str, root: str | None = None) -> str:
+    """Return the directory of run_id, in the flat layout if it was not migrated."""
+    root = root or default_root()
+    sharded = shard_path(root, run_id)
+    if not os.path.isdir(sharded):
+        flat = os.path.join(root, run_id)
+        if os.path.isdir(flat):
+            return flat
+    return sharded
+
+
+def iter_run_dirs(root: str) -> Iterator[os.DirEntry[str]]:
+    """Yield the run directories under root, in both layouts."""
+    with os.scandir(root) as it:
+        for entry in it:
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            if not SHARD.match(entry.name):
+                yield entry
+                continue
+            with os.scandir(entry.path) as level2:
+                for shard in level2:
+                    if shard.is_dir() and SHARD.match(shard.name):
+                        with os.scandir(shard.path) as runs:
+                            yield from (r for r in runs if r.is_dir())
@@ -0,0 +1,445 @@
+"""Shared run bookkeeping for the backends that run workflows on this host."""
+
+import abc
+import logging
+import os
+import shutil
+import threading
+import uuid
+from typing import Any, Protocol, cast
+
+from wes_service.layout import SHARD, default_root
+from wes_service.retention import RunRetention, read_archived_log
+from wes_service.run_index import ACTIVE_STATES, FINAL_STATES, RunIndex
+from wes_service.run_monitor import monitor_elsewhere, request_cancel, withdraw_cancel
+from wes_service.scheduler import QueueFull, RunScheduler
+from wes_service.util import (
+    LRUCache,
+    WESBackend,
+    parse_duration,
+    parse_size,
+    parse_state_search,
+)
+
+
+class LocalWorkflow(Protocol):
+    """The interface of a single run of a local backend."""
+
+    run_id: str
+    workdir: str
+
+    def queue(self, request: dict[str, Any], tempdir: str) -> None:
+        """Persist the request so that the run can be started later."""
+
+    def start(self, opts: WESBackend) -> None:
+        """Start a queued run."""
+
+    def getstate(self) -> tuple[str, int]:
+        """Return the state and exit code of the run."""
+
+    def getstatus(self) -> dict[str, Any]:
+        """Report the current status."""
+
+    def getlog(self) -> dict[str, Any]:
+        """Dump the log."""
+
+    def cancel(self, grace: float = 10.0) -> bool:
+        """Stop the processes of the run and clean up after them, if on this host."""
+
+
+class LocalBackend(WESBackend, abc.ABC):
+    """
+    Base class for backends that run workflows on this host.
+
+    Runs are recorded in a RunIndex and started by a RunScheduler.
+    Options:
+
+    run_index: path of the index database (default workflows/runs.sqlite)
+    max_concurrent_runs: runs allowed to be initializing or running at once
+    max_queued_runs: runs allowed to wait in the queue before submissions
+        are refused with 503
+    queue_retry_after: the Retry-After (seconds) sent with that 503
+    max_status_wait: longest GetRunStatus long-poll, in seconds (default 60)
+    max_status_waiters: GetRunStatus requests allowed to wait at once,
+        others answer immediately (default 4)
+    retention_archive_after: age (e.g. 30d) after which finished runs are
+        compacted into an archive
+    retention_delete_after: age after which archived runs are deleted
+    retention_max_archive_size: total size of archives above which the
+        oldest archived runs are deleted
+    retention_min_free: free space on the workflows filesystem below which
+        finished runs are archived early, oldest first
+    retention_keep_outputs: leave the outdir of archived runs in place
+    retention_interval: seconds between retention sweeps (default 3600)
+    archive_dir: where archives are kept (default workflows/.archive)
+    run_cache_size: run directories and logs of finished runs kept in
+        memory (default 1024)
+    cancel_grace_period: seconds canceled runs are given to exit after
+        SIGTERM before they are killed (default 10)
+    """
+
+    def __init__(self, opts: list[str]) -> None:
+        """Parse options, open the run index and start the scheduler."""
+        super().__init__(opts)
+        workflows_dir = default_root()
+        cache_size = int(self.getopt("run_cache_size", default="1024") or 0)
+        self.run_dirs: LRUCache[str, str] = LRUCache(cache_size)
+        self.run_logs: LRUCache[str, dict[str, Any]] = LRUCache(cache_size)
+        self.index = RunIndex(
+            cast(
+                str,
+                self.getopt(
+                    "run_index", default=os.path.join(workflows_dir, "runs.sqlite")
+                ),
+            )
+        )
+        if self.index.is_empty():
+            for volume in [None, *self.placement.volumes]:
+                self.index.populate(
+                    self.placement.workflows_dir(volume),
+                    lambda run_id: self.workflow(run_id).getstate()[0],
+                )
+        # What was logged while staging the attachments of a submission,
+        # until it is written to the stderr of its runs.
+        self.staging_logs: dict[str, list[str]] = {}
+        # Runs this process is stopping the processes of.
+        self.canceling: set[str] = set()
+        self.canceling_lock = threading.Lock()
+        self.scheduler = RunScheduler(
+            self.index,
+            self.start_run,
+            max_active=int(self.getopt("max_concurrent_runs", default="0") or 0),
+            max_queued=int(self.getopt("max_queued_runs", default="0") or 0),
+            retry_after=int(self.getopt("queue_retry_after", default="60") or 60),
+            poll=self.resume_cancels,
+        )
+        self.max_status_wait = float(self.getopt("max_status_wait", default="60") or 0)
+        # Every waiting request holds one of the server's worker threads.
+        self.status_waiters = threading.BoundedSemaphore(
+            int(self.getopt("max_status_waiters", default="4") or 0)
+        )
+        self.cancel_grace_period = float(
+            self.getopt("cancel_grace_period", default="10") or 0
+        )
+        self.retention = self.setup_retention(workflows_dir)
+
+    def setup_retention(self, workflows_dir: str) -> RunRetention | None:
+        """Start applying the retention policy, if one is configured."""
+        archive_after = parse_duration(self.getopt("retention_archive_after"))
+        delete_after = parse_duration(self.getopt("retention_delete_after"))
+        max_archive_size = parse_size(self.getopt("retention_max_archive_size"))
+        min_free = parse_size(self.getopt("retention_min_free"))
+        if not (archive_after or delete_after or max_archive_size or min_free):
+            return None
+        retention = RunRetention(
+            self.index,
+            workflows_dir,
+            lambda run_id: self.workflow(run_id).getlog(),
+            self.remove_attachments,
+            find_run=self.run_dir,
+            archive_dir=self.getopt("archive_dir"),
+            archive_after=archive_after,
+            delete_after=delete_after,
+            max_archive_size=max_archive_size,
+            min_free=min_free,
+            keep_outputs=self.getopt("retention_keep_outputs", default="false")
+            in ("true", "1", "yes"),
+            interval=float(self.getopt("retention_interval", default="3600") or 3600),
+        )
+        retention.start()
+        return retention
+
+    @abc.abstractmethod
+    def workflow(self, run_id: str, workdir: str | None = None) -> LocalWorkflow:
+        """Return the object representing run_id, in workdir if it is a new run."""
+
+    def log_for_run(self, run_id: str | None, message: str) -> None:
+        """Report the log for a given run, and keep it for the run's stderr."""
+        super().log_for_run(run_id, message)
+        if run_id is not None:
+            self.staging_logs.setdefault(run_id, []).append(message)
+
+    def write_staging_log(self, workdir: str, lines: list[str]) -> None:
+        """Add what was logged while staging the attachments of a run to its stderr."""
+        if lines:
+            with open(os.path.join(workdir, "stderr"), "a") as f:
+                f.writelines(line + "\n" for line in lines)
+
+    def run_dir(self, run_id: str) -> str:
+        """Return the directory of an existing run."""
+        path = self.run_dirs.get(run_id)
+        if path is None:
+            path = self.placement.find_run_dir(run_id)
+            # Runs in the flat layout may still be moved to their shard.
+            if SHARD.match(os.path.basename(os.path.dirname(path))):
+                self.run_dirs.put(run_id, path)
+        return path
+
+    def not_found(self, run_id: str) -> tuple[dict[str, Any], int]:
+        """Return the response for an unknown run."""
+        return {"msg": f"Workflow run {run_id!r} not found", "status_code": 404}, 404
+
+    def start_run(self, run_id: str) -> None:
+        """Start a run claimed from the queue."""
+        self.workflow(run_id).start(self)
+
+    def get_priority(self, body: dict[str, Any]) -> int:
+        """Return the priority requested in workflow_engine_parameters."""
+        params = body.get("workflow_engine_parameters") or {}
+        if not isinstance(params, dict):
+            raise ValueError("'workflow_engine_parameters' must be a JSON object")
+        try:
+            return int(params.get("priority", 0))
+        except (TypeError, ValueError):
+            raise ValueError(
+                "'priority' in workflow_engine_parameters must be an integer"
+            ) from None
+
+    def ListRuns(
+        self, page_size: Any = None, page_token: Any = None, state_search: Any = None
+    ) -> dict[str, Any] | tuple[dict[str, Any], int]:
+        """List the known workflow runs."""
+        try:
+            workflows, next_page_token = self.index.list_runs(
+                self.get_page_size(page_size),
+                page_token,
+                parse_state_search(state_search),
+            )
+        except ValueError as e:
+            return {"msg": str(e), "status_code": 400}, 400
+        return {"workflows": workflows, "next_page_token": next_page_token}
+
+    def RunWorkflow(
+        self, **args: str
+    ) -> dict[str, str] | tuple[dict[str, Any], int, dict[str, str]]:
+        """Queue the workflow run request."""
+        try:
+            self.scheduler.check_admission()
+        except QueueFull as e:
+            return (
+                {"msg": str(e), "status_code": 503},
+                503,
+                {"Retry-After": str(e.retry_after)},
+            )
+        run_id = uuid.uuid4().hex
+        try:
+            tempdir, body = self.collect_attachments(args, run_id)
+        except ValueError as e:
+            return {"msg": str(e), "status_code": 400}, 400, {}
+        finally:
+            staging_log = self.staging_logs.pop(run_id, [])
+        workdir = self.placement.new_run_dir(run_id, tempdir)
+        try:
+            priority = self.get_priority(body)
+            self.workflow(run_id, workdir).queue(body, tempdir)
+            self.write_staging_log(workdir, staging_log)
+            self.index.add(run_id, "QUEUED", priority=priority)
+        except BaseException as e:
+            shutil.rmtree(workdir, ignore_errors=True)
+            self.remove_attachments(tempdir)
+            if isinstance(e, ValueError):
+                return {"msg": str(e), "status_code": 400}, 400, {}
+            raise
+        self.scheduler.wake()
+        return {"run_id": run_id}
+
+    def RunWorkflows(
+        self, **args: Any
+    ) -> dict[str, Any] | tuple[dict[str, Any], int, dict[str, str]]:
+        """Queue one run of the workflow for each set of parameters."""
+        try:
+            params_list = self.collect_params_list(args)
+            self.scheduler.check_admission(len(params_list))
+        except ValueError as e:
+            return {"msg": str(e), "status_code": 400}, 400, {}
+        except QueueFull as e:
+            return (
+                {"msg": str(e), "status_code": 503},
+                503,
+                {"Retry-After": str(e.retry_after)},
+            )
+        # The attachments are staged once for all the runs.
+        batch_id = uuid.uuid4().hex
+        try:
+            tempdir, body = self.collect_attachments(
+                dict(args, workflow_params="{}"), batch_id
+            )
+        except ValueError as e:
+            return {"msg": str(e), "status_code": 400}, 400, {}
+        finally:
+            staging_log = self.staging_logs.pop(batch_id, [])
+        try:
+            priority = self.get_priority(body)
+        except ValueError as e:
+            self.remove_attachments(tempdir)
+            return {"msg": str(e), "status_code": 400}, 400, {}
+        # Every run gets its own hardlinked copy of the attachments.
+        run_ids = []
+        created: list[tuple[str, str]] = []
+        try:
+            for workflow_params in params_list:
+                run_id = uuid.uuid4().hex
+                rundir, run_body = self.clone_attachments(
+                    tempdir, body, workflow_params
+                )
+                workdir = self.placement.new_run_dir(run_id, rundir)
+                created.append((workdir, rundir))
+                self.workflow(run_id, workdir).queue(run_body, rundir)
+                self.write_staging_log(workdir, staging_log)
+                run_ids.append(run_id)
+            self.index.add_many(run_ids, "QUEUED", priority=priority)
+        except BaseException as e:
+            # None of the runs is submitted.
+            for workdir, rundir in created:
+                shutil.rmtree(workdir, ignore_errors=True)
+                self.remove_attachments(rundir)
+            if isinstance(e, ValueError):
+                return {"msg": str(e), "status_code": 400}, 400, {}
+            raise
+        finally:
+            self.remove_attachments(tempdir)
+
+        self.scheduler.wake()
+        return {"run_ids": run_ids}
+
+    def CancelRun(self, run_id: str) -> dict[str, str] | tuple[dict[str, Any], int]:
+        """
+        Cancel a run.
+
+        A queued run is canceled at once.  An active run is recorded as
+        CANCELING, which frees its slot right away, and its processes are
+        stopped and cleaned up in the background before it is recorded
+        as CANCELED.  That is done by a server on the host the run's
+        processes are on.
+        """
+        entry = self.index.get(run_id)
+        if entry is None:
+            return self.not_found(run_id)
+        if entry["state"] in FINAL_STATES or entry["state"] == "CANCELING":
+            return {"run_id": run_id}
+        job = self.workflow(run_id)
+        # Recorded first, so that the run is not started or reported as
+        # failed once it is being canceled.
+        request_cancel(job.workdir)
+        if self.index.set_state(run_id, "CANCELED", from_states=["QUEUED"]):
+            return {"run_id": run_id}
+        if not self.index.set_state(run_id, "CANCELING", from_states=ACTIVE_STATES):
+            # It finished in the meantime.
+            withdraw_cancel(job.workdir)
+            return {"run_id": run_id}
+        self.scheduler.wake()
+        self.start_cancel(job)
+        return {"run_id": run_id}
+
+    def start_cancel(self, job: LocalWorkflow) -> None:
+        """Stop the processes of a run being canceled in the background."""
+        with self.canceling_lock:
+            if job.run_id in self.canceling:
+                return
+            self.canceling.add(job.run_id)
+        threading.Thread(
+            target=self.finish_cancel,
+            args=(job,),
+            name=f"wes-cancel-{job.run_id}",
+            daemon=True,
+        ).start()
+
+    def finish_cancel(self, job: LocalWorkflow) -> None:
+        """
+        Stop the processes of a canceled run and record it as CANCELED.
+
+        A run whose processes are on another host is left CANCELING, for
+        the server on that host to finish canceling it.
+        """
+        try:
+            try:
+                if not job.cancel(self.cancel_grace_period):
+                    logging.info(
+                        "Workflow %s: running on another host, left CANCELING",
+                        job.run_id,
+                    )
+                    return
+            except Exception:
+                logging.exception("Workflow %s: failed to cancel", job.run_id)
+            self.index.set_state(job.run_id, "CANCELED")
+        finally:
+            with self.canceling_lock:
+                self.canceling.discard(job.run_id)
+
+    def resume_cancels(self) -> None:
+        """Finish canceling the runs on this host that were canceled elsewhere."""
+        for run_id in self.index.in_states(["CANCELING"]):
+            if run_id in self.canceling:
+                continue
+            job = self.workflow(run_id)
+            if not monitor_elsewhere(job.workdir):
+                self.start_cancel(job)
+
+    def GetRunLog(self, run_id: str) -> dict[str, Any] | tuple[dict[str, Any], int]:
+        """Get the log for a particular workflow run."""
+        entry = self.index.get(run_id)
+        if entry is None:
+            return self.not_found(run_id)
+        # The log of a finished run only changes when it is archived.
+        token = (entry["state"], entry["updated"], entry["archive"])
+        log = self.run_logs.get(run_id, token)
+        if log is not None:
+            return log
+        if entry["archive"]:
+            log = read_archived_log(entry["archive"])
+        else:
+            log = self.workflow(run_id).getlog()
+            # A run that is being started still looks queued on disk.
+            self.index.set_state(run_id, log["state"], from_states=["RUNNING"])
+        if entry["state"] in FINAL_STATES and log["state"] == entry["state"]:
+            self.run_logs.put(run_id, log, token)
+        return log
+
+    def GetRunStatus(
+        self, run_id: str, wait: Any = None, last_state: str | None = None
+    ) -> dict[str, Any] | tuple[dict[str, Any], int]:
+        """
+        Determine the status for a given run.
+
+        With wait, block for up to that many seconds until the state is
+        different from last_state (by default, the current state).
+        """
+        status = self.run_status(run_id)
+        if status is None:
+            return self.not_found(run_id)
+        if not wait or (last_state is not None and status["state"] != last_state):
+            return status
+        if not self.status_waiters.acquire(blocking=False):
+            return status
+        try:
+            self.index.wait_for_change(
+                run_id,
+                last_state or status["state"],
+                min(float(wait), self.max_status_wait),
+            )
+        finally:
+            self.status_waiters.release()
+        return self.run_status(run_id) or self.not_found(run_id)
+
+    def GetRunStatuses(self, body: dict[str, Any]) -> dict[str, Any]:
+        """Report the state of many runs, as recorded in the index."""
+        run_ids = body["run_ids"]
+        states = self.index.get_states(run_ids)
+        return {
+            "runs": [
+                {"run_id": run_id, "state": states.get(run_id, "UNKNOWN")}
+                for run_id in run_ids
+            ]
+        }
+
+    def run_status(self, run_id: str) -> dict[str, Any] | None:
+        """Return the current status of a run, None if it is unknown."""
+        entry = self.index.get(run_id)
+        if entry is None:
+            return None
+        if entry["state"] != "RUNNING":
+            # Queued, initializing and finished runs are tracked in the index.
+            return {"run_id": run_id, "state": entry["state"]}
+        status = self.workflow(run_id).getstatus()
+        self.index.set_state(run_id, status["state"], from_states=["RUNNING"])
+        return status
@@ -0,0 +1,72 @@
+"""Incremental search of growing log files for failure signatures."""
+
+import json
+import os
+from collections.abc import Sequence
+
+from wes_service.util import atomic_write
+
+
+class LogScanner:
+    """
+    Look for signatures in a log file, reading each byte only once.
+
+    The offset reached and any signature found are saved in state_path,
+    so that the next scan, possibly by another process, only reads what
+    was appended since.  If the log is replaced or truncated it is
+    scanned again from the start.
+    """
+
+    chunk_size = 1 << 20
+
+    def __init__(self, path: str, state_path: str, signatures: Sequence[str]) -> None:
+        """Scan the log at path for any of signatures."""
+        self.path = path
+        self.state_path = state_path
+        self.signatures = [s.encode() for s in signatures]
+        # Bytes scanned again so that a signature split across two
+        # scans is still found.
+        self.overlap = max((len(s) for s in self.signatures), default=1) - 1
+
+    def _load(self) -> dict[str, object]:
+        try:
+            with open(self.state_path) as f:
+                state: dict[str, object] = json.load(f)
+                return state
+        except (OSError, ValueError):
+            return {}
+
+    def scan(self) -> str | None:
+        """Return the first signature found in the log so far, or None."""
+        state = self._load()
+        if state.get("found") is not None:
+            return str(state["found"])
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            st = os.fstat(f.fileno())
+            offset = state.get("offset", 0)
+            if not isinstance(offset, int) or state.get("inode") != st.st_ino:
+                offset = 0
+            if offset > st.st_size:
+                offset = 0
+            if offset == st.st_size:
+                return None
+            f.seek(max(0, offset - self.overlap))
+            found = None
+            tail = b""
+            while found is None and (chunk := f.read(self.chunk_size)):
+                data = tail + chunk
+                for signature in self.signatures:
+                    if signature in data:
+                        found = signature.decode()
+                        break
+                tail = data[-self.overlap :] if self.overlap else b""
+            offset = f.tell()
+        atomic_write(
+            self.state_path,
+            json.dumps({"inode": st.st_ino, "offset": offset, "found": found}),
+        )
+        return found
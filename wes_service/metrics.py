@@ -0,0 +1,255 @@
+"""
+Process-wide metrics in the Prometheus text exposition format.
+
+The metrics are served at ``/metrics``.  Only counters, gauges and
+histograms are implemented, which is all the service needs, so the
+server does not depend on a Prometheus client library.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any, TypeVar
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], **extra: str) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        (n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in pairs
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in escaped) + "}"
+
+
+class Metric:
+    """A named metric with optional labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        """Describe the metric; it is reported once it has a value."""
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], Any] = {}
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def samples(self) -> Iterator[str]:
+        """Yield the sample lines of the metric."""
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+    def render(self) -> str:
+        """Return the metric in the text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increment the counter for labels."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down."""
+
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increment the gauge for labels."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        """Decrement the gauge for labels."""
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Observations counted in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        """Describe the histogram and its bucket upper bounds."""
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation for labels."""
+        key = self._key(labels)
+        with self._lock:
+            # The last slot counts observations above the largest bound.
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        """Yield the bucket, sum and count lines of the histogram."""
+        with self._lock:
+            values = {k: (list(c), t) for k, (c, t) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labels, key, le=le)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    """A set of metrics rendered together."""
+
+    def __init__(self) -> None:
+        """Create an empty registry."""
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: M) -> M:
+        """Add metric to the registry and return it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Return all metrics in the text exposition format."""
+        return "".join(m.render() for m in self.metrics)
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(
+    Counter(
+        "wes_requests_total",
+        "WES API requests by operationId and response status.",
+        ["operation", "status"],
+    )
+)
+REQUEST_DURATION = REGISTRY.register(
+    Histogram(
+        "wes_request_duration_seconds",
+        "Time spent handling WES API requests.",
+        ["operation"],
+    )
+)
+REQUESTS_IN_PROGRESS = REGISTRY.register(
+    Gauge(
+        "wes_requests_in_progress",
+        "WES API requests being handled.",
+        ["operation"],
+    )
+)
+SUBPROCESS_STARTS = REGISTRY.register(
+    Counter(
+        "wes_subprocess_starts_total",
+        "Subprocesses started by the server.",
+        ["command"],
+    )
+)
+ATTACHMENT_BYTES = REGISTRY.register(
+    Counter(
+        "wes_attachment_bytes_staged_total",
+        "Bytes of workflow attachments staged.",
+    )
+)
+RUN_CPU_SECONDS = REGISTRY.register(
+    Counter(
+        "wes_run_cpu_seconds_total",
+        "CPU time used by the engines of finished runs and the processes they waited for.",
+        ["mode"],
+    )
+)
+RUN_MAX_RSS = REGISTRY.register(
+    Histogram(
+        "wes_run_max_rss_bytes",
+        "Largest resident set size of a process of each finished run.",
+        buckets=[2**n for n in range(26, 38)],
+    )
+)
+RUN_BLOCK_IO = REGISTRY.register(
+    Counter(
+        "wes_run_block_io_operations_total",
+        "Block I/O operations of the engines of finished runs.",
+        ["direction"],
+    )
+)
+RUN_DURATION = REGISTRY.register(
+    Histogram(
+        "wes_run_duration_seconds",
+        "Wall-clock time from the start of the engine of a run to its exit.",
+        buckets=(60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400, 259200),
+    )
+)
+ARVADOS_API_CALLS = REGISTRY.register(
+    Histogram(
+        "wes_arvados_api_request_duration_seconds",
+        "Round-trips to the Arvados API server.",
+        ["method"],
+    )
+)
+
+
+def instrument(operation: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap the handler of a WES operation to record its metrics."""
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        REQUESTS_IN_PROGRESS.inc(operation=operation)
+        status = "500"
+        try:
+            with REQUEST_DURATION.time(operation=operation):
+                result = func(*args, **kwargs)
+            if isinstance(result, tuple) and len(result) > 1:
+                status = str(result[1])
+            else:
+                status = "200"
+            return result
+        finally:
+            REQUESTS_IN_PROGRESS.dec(operation=operation)
+            REQUESTS.inc(operation=operation, status=status)
+
+    return wrapper
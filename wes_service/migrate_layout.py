@@ -0,0 +1,76 @@
+"""Move run directories from the flat layout of older versions to the sharded layout."""
+
+import argparse
+import logging
+import os
+import sys
+
+from wes_service.layout import SHARD, default_root, shard_path
+from wes_service.run_index import ACTIVE_STATES, RunIndex
+from wes_service.util import atomic_write
+
+# Runs whose directory is, or is about to be, in use by another process:
+# their runner, their run monitor or the thread canceling them.
+_IN_USE = ("QUEUED", *ACTIVE_STATES, "CANCELING")
+
+
+def migrate(root: str, index: RunIndex | None = None, dry_run: bool = False) -> int:
+    """
+    Move the run directories in the flat layout to their shard.
+
+    Runs which the index lists as queued, active or being canceled are
+    left alone, since they are still written to in the old location.
+    Paths to the old location in cwl.output.json and in the Toil
+    jobstore file are rewritten.  Returns the number of runs moved.
+    """
+    moved = 0
+    with os.scandir(root) as it:
+        flat = [
+            e.name
+            for e in it
+            if e.is_dir() and not e.name.startswith(".") and not SHARD.match(e.name)
+        ]
+    for run_id in flat:
+        entry = index.get(run_id) if index is not None else None
+        if entry is not None and entry["state"] in _IN_USE:
+            logging.info("Workflow %s: still %s, not moved", run_id, entry["state"])
+            continue
+        src = os.path.join(root, run_id)
+        dest = shard_path(root, run_id)
+        logging.info("Moving %s to %s", src, dest)
+        if dry_run:
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.rename(src, dest)
+        for name in ("cwl.output.json", "jobstore"):
+            path = os.path.join(dest, name)
+            if os.path.exists(path):
+                with open(path) as f:
+                    content = f.read()
+                atomic_write(path, content.replace(src + "/", dest + "/"))
+        moved += 1
+    return moved
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Move the run directories to the sharded layout."""
+    parser = argparse.ArgumentParser(
+        description="Move workflow run directories to the sharded layout."
+    )
+    parser.add_argument("workflows_dir", nargs="?", default=default_root())
+    parser.add_argument(
+        "--run-index", help="Path of the run index (default workflows_dir/runs.sqlite)"
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    logging.basicConfig(level=logging.INFO)
+    index_path = args.run_index or os.path.join(args.workflows_dir, "runs.sqlite")
+    index = RunIndex(index_path) if os.path.exists(index_path) else None
+    moved = migrate(args.workflows_dir, index, args.dry_run)
+    logging.info("Moved %d run directories", moved)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
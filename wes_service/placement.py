@@ -0,0 +1,129 @@
+"""
+Placement of runs across several volumes.
+
+With volumes configured, each run is placed on one of them: its
+attachments are staged in ``<volume>/staging`` and its run directory
+is created under ``<volume>/workflows``, so that staged files are
+renamed or hardlinked into place, never copied.  The volume is chosen
+by free space and by how busy its block device currently is.  Runs are
+found again by looking for their directory on every volume.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+
+from wes_service.layout import default_root, run_dir
+
+POLICIES = ("balanced", "free", "load")
+
+
+class VolumePlacement:
+    """Choose the volume of new runs and find the volume of existing ones."""
+
+    def __init__(
+        self,
+        volumes: list[str],
+        staging_dir: str | None = None,
+        policy: str = "balanced",
+        sample_interval: float = 1.0,
+    ) -> None:
+        """
+        Set up placement on volumes.
+
+        :param volumes: Root directories of the volumes; if empty, runs
+            stay in the working directory of the server and attachments
+            are staged in staging_dir.
+        :param staging_dir: Where to stage attachments without volumes
+            (default: the system temp dir).
+        :param policy: "free" picks the volume with the most free space,
+            "load" the least busy one, "balanced" weighs free space by
+            idle time.
+        :param sample_interval: Seconds during which a measure of the
+            volumes is reused.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"placement must be one of {', '.join(POLICIES)}")
+        self.volumes = [os.path.abspath(v) for v in volumes]
+        self.default_staging_dir = staging_dir
+        self.policy = policy
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._io_ticks: dict[str, tuple[float, int]] = {}
+        self._scores: dict[str, float] = {}
+        self._sampled = 0.0
+        for volume in self.volumes:
+            os.makedirs(self.workflows_dir(volume), exist_ok=True)
+            os.makedirs(os.path.join(volume, "staging"), exist_ok=True)
+
+    def workflows_dir(self, volume: str | None) -> str:
+        """Return the directory holding the run directories on volume."""
+        return os.path.join(volume, "workflows") if volume else default_root()
+
+    def staging_dir(self, volume: str | None) -> str | None:
+        """Return the directory attachments are staged in on volume."""
+        return os.path.join(volume, "staging") if volume else self.default_staging_dir
+
+    def volume_of(self, path: str) -> str | None:
+        """Return the volume holding path, None if it is on none of them."""
+        path = os.path.abspath(path)
+        for volume in self.volumes:
+            if path == volume or path.startswith(volume + os.sep):
+                return volume
+        return None
+
+    def choose(self) -> str | None:
+        """Return the volume to place a new run on."""
+        if len(self.volumes) < 2:
+            return self.volumes[0] if self.volumes else None
+        with self._lock:
+            now = time.monotonic()
+            if now - self._sampled >= self.sample_interval:
+                self._scores = {v: self._score(v) for v in self.volumes}
+                self._sampled = now
+            return max(self.volumes, key=lambda v: self._scores[v])
+
+    def new_run_dir(self, run_id: str, tempdir: str) -> str:
+        """Return the directory for a new run, on the volume of its staged attachments."""
+        return run_dir(run_id, self.workflows_dir(self.volume_of(tempdir)))
+
+    def find_run_dir(self, run_id: str) -> str:
+        """Return the directory of an existing run, on whichever volume it is."""
+        for volume in self.volumes:
+            path = run_dir(run_id, self.workflows_dir(volume))
+            if os.path.isdir(path):
+                return path
+        return run_dir(run_id)
+
+    def _score(self, volume: str) -> float:
+        try:
+            free = shutil.disk_usage(volume).free
+        except OSError:
+            logging.exception("Cannot get the free space of %s", volume)
+            return -1.0
+        idle = 1.0 - self._busy(volume)
+        if self.policy == "free":
+            return float(free)
+        if self.policy == "load":
+            # Free space only breaks ties between equally busy volumes.
+            return idle + free / 2**80
+        return free * idle
+
+    def _busy(self, volume: str) -> float:
+        """Return the fraction of time the device of volume was busy since the last call."""
+        st_dev = os.stat(volume).st_dev
+        stat = f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}/stat"
+        try:
+            with open(stat) as f:
+                io_ticks = int(f.read().split()[9])
+        except (OSError, IndexError, ValueError):
+            # Not a block device (e.g. NFS) or not Linux.
+            return 0.0
+        now = time.monotonic()
+        last = self._io_ticks.get(volume)
+        self._io_ticks[volume] = (now, io_ticks)
+        if last is None or now <= last[0]:
+            return 0.0
+        return min(1.0, max(0.0, (io_ticks - last[1]) / 1000 / (now - last[0])))
@@ -0,0 +1,253 @@
+"""
+Retention of finished runs for the local backends.
+
+The runners never remove their run directories.  With a retention
+policy, finished runs are compacted: the small metadata files of the
+run directory, with the final run log, are packed into one compressed
+archive, the rest of the directory (job store, outputs) and the staged
+attachments are deleted, and the index records where the archive is so
+that GetRunLog can be answered from it.  Archives are deleted in turn
+once they are older than a second age limit, or when together they
+take more space than allowed.
+"""
+
+import io
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from wes_service.layout import run_dir, shard_path
+from wes_service.run_index import RunIndex
+
+ARCHIVE_LOG = "log.json"
+
+# Not archived: large, and of no use once the run has finished, or
+# already in the run log.
+_EXCLUDE = ("outdir", "toiljobstore", "stderr")
+
+# Larger files are left out of archives, which are meant for the small
+# files describing a run.
+MAX_ARCHIVED_FILE_SIZE = 1 << 20
+
+
+def _small_files(info: tarfile.TarInfo) -> tarfile.TarInfo | None:
+    if info.isfile() and info.size > MAX_ARCHIVED_FILE_SIZE:
+        logging.info("Not archiving %s (%d bytes)", info.name, info.size)
+        return None
+    return info
+
+
+def archive_run(workdir: str, log: dict[str, Any], path: str) -> int:
+    """
+    Pack the run log and the small files of workdir into a gzipped tarball at path.
+
+    Returns the size of the archive.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".archive")
+    try:
+        with os.fdopen(fd, "wb") as f, tarfile.open(fileobj=f, mode="w:gz") as tar:
+            data = json.dumps(log).encode()
+            info = tarfile.TarInfo(ARCHIVE_LOG)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+            for name in sorted(os.listdir(workdir)):
+                if name not in _EXCLUDE:
+                    tar.add(
+                        os.path.join(workdir, name), arcname=name, filter=_small_files
+                    )
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return os.stat(path).st_size
+
+
+def read_archived_log(path: str) -> dict[str, Any]:
+    """Return the run log stored in the archive at path."""
+    with tarfile.open(path) as tar:
+        f = tar.extractfile(ARCHIVE_LOG)
+        if f is None:
+            raise ValueError(f"No {ARCHIVE_LOG} in {path}")
+        with f:
+            log: dict[str, Any] = json.load(f)
+    return log
+
+
+class RunRetention:
+    """
+    Apply the retention policy to finished runs from a background thread.
+
+    Every server process sharing the index may run a sweeper, runs
+    archived by another process are skipped.
+    """
+
+    def __init__(
+        self,
+        index: RunIndex,
+        workflows_dir: str,
+        getlog: Callable[[str], dict[str, Any]],
+        remove_attachments: Callable[[str], None],
+        find_run: Callable[[str], str] | None = None,
+        archive_dir: str | None = None,
+        archive_after: float | None = None,
+        delete_after: float | None = None,
+        max_archive_size: int | None = None,
+        min_free: int | None = None,
+        keep_outputs: bool = False,
+        interval: float = 3600.0,
+    ) -> None:
+        """
+        Set up the policy; call start to begin applying it.
+
+        :param index: The run index.
+        :param workflows_dir: The directory holding the run directories.
+        :param getlog: Returns the final run log of a run.
+        :param remove_attachments: Removes the staged attachments of a run.
+        :param find_run: Returns the directory of a run (default: its
+            directory under workflows_dir).
+        :param archive_dir: Where archives are written (default
+            workflows_dir/.archive).
+        :param archive_after: Seconds after which finished runs are archived.
+        :param delete_after: Seconds after which archived runs are deleted.
+        :param max_archive_size: Total size of archives above which the
+            oldest are deleted.
+        :param min_free: Bytes of free space on the filesystem of
+            workflows_dir below which finished runs are archived early,
+            oldest first.
+        :param keep_outputs: Leave the outdir of archived runs in place.
+        :param interval: Seconds between sweeps.
+        """
+        self.index = index
+        self.workflows_dir = workflows_dir
+        self.getlog = getlog
+        self.remove_attachments = remove_attachments
+        self.find_run = find_run or (lambda run_id: run_dir(run_id, workflows_dir))
+        self.archive_dir = archive_dir or os.path.join(workflows_dir, ".archive")
+        self.archive_after = archive_after
+        self.delete_after = delete_after
+        self.max_archive_size = max_archive_size
+        self.min_free = min_free
+        self.keep_outputs = keep_outputs
+        self.interval = interval
+        self._thread = threading.Thread(
+            target=self._loop, name="wes-retention", daemon=True
+        )
+
+    def start(self) -> None:
+        """Sweep now and then every interval seconds."""
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                logging.exception("Failed to apply the run retention policy")
+            time.sleep(self.interval)
+
+    def sweep(self) -> None:
+        """Archive and delete the runs due according to the policy."""
+        if self.archive_after is not None:
+            self.archive_all(time.time() - self.archive_after)
+        if self.min_free:
+            min_free = self.min_free
+            self.archive_all(time.time(), lambda: self.free_space() < min_free)
+
+        if self.delete_after is not None:
+            while archived := self.index.archived(time.time() - self.delete_after):
+                for entry in archived:
+                    self.delete(entry["run_id"], entry["archive"])
+        if self.max_archive_size:
+            excess = self.index.archive_size() - self.max_archive_size
+            while excess > 0 and (archived := self.index.archived()):
+                for entry in archived:
+                    if excess <= 0:
+                        break
+                    self.delete(entry["run_id"], entry["archive"])
+                    excess -= entry["archive_size"] or 0
+
+    def archive_all(
+        self, before: float, needed: Callable[[], bool] | None = None
+    ) -> None:
+        """
+        Archive the runs finished before the given time, oldest first.
+
+        With needed, stop as soon as it returns False.  A run that fails
+        to be archived is skipped until the next sweep.
+        """
+        after = None
+        while batch := self.index.archivable(before, after=after):
+            for entry in batch:
+                if needed is not None and not needed():
+                    return
+                try:
+                    self.archive(entry["run_id"])
+                except Exception:
+                    logging.exception("Workflow %s: failed to archive", entry["run_id"])
+            after = (batch[-1]["updated"], batch[-1]["run_id"])
+
+    def free_space(self) -> int:
+        """Return the free space on the filesystem of the run directories."""
+        return shutil.disk_usage(self.workflows_dir).free
+
+    def archive(self, run_id: str) -> None:
+        """Compact a finished run into an archive."""
+        workdir = self.find_run(run_id)
+        path = shard_path(self.archive_dir, run_id) + ".tar.gz"
+        if not os.path.isdir(workdir):
+            # Removed by hand, there is nothing left to keep.
+            self.index.remove(run_id)
+            return
+        try:
+            log = self.getlog(run_id)
+        except Exception:
+            # Keep what can be kept rather than retrying forever.
+            logging.exception("Workflow %s: failed to read the run log", run_id)
+            entry = self.index.get(run_id) or {}
+            log = {
+                "run_id": run_id,
+                "request": {},
+                "state": entry.get("state", "UNKNOWN"),
+                "run_log": {},
+                "task_logs": [],
+                "outputs": {},
+            }
+        size = archive_run(workdir, log, path)
+        if not self.index.set_archive(run_id, path, size):
+            # Archived by another server process meanwhile.
+            return
+
+        tempdir = os.path.join(workdir, "tempdir.json")
+        if os.path.exists(tempdir):
+            with open(tempdir) as f:
+                self.remove_attachments(json.load(f)["tempdir"])
+        if self.keep_outputs and os.path.isdir(os.path.join(workdir, "outdir")):
+            for name in os.listdir(workdir):
+                if name != "outdir":
+                    p = os.path.join(workdir, name)
+                    if os.path.isdir(p) and not os.path.islink(p):
+                        shutil.rmtree(p, ignore_errors=True)
+                    else:
+                        os.unlink(p)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+        logging.info("Workflow %s: archived to %s (%d bytes)", run_id, path, size)
+
+    def delete(self, run_id: str, path: str) -> None:
+        """Delete an archived run and forget it."""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(self.find_run(run_id), ignore_errors=True)
+        self.index.remove(run_id)
+        logging.info("Workflow %s: deleted", run_id)
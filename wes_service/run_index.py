@@ -0,0 +1,470 @@
+"""Persistent index of workflow runs for the local backends."""
+
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from wes_service.layout import iter_run_dirs
+
+FINAL_STATES = ("COMPLETE", "EXECUTOR_ERROR", "SYSTEM_ERROR", "CANCELED")
+
+ACTIVE_STATES = ("INITIALIZING", "RUNNING")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Columns added after the first version of the index, with their definition.
+_COLUMNS = {
+    "priority": "INTEGER NOT NULL DEFAULT 0",
+    "archive": "TEXT",
+    "archive_size": "INTEGER",
+}
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS runs_state ON runs (state, seq);
+CREATE INDEX IF NOT EXISTS runs_queue ON runs (state, priority DESC, seq);
+CREATE INDEX IF NOT EXISTS runs_updated ON runs (updated);
+"""
+
+# Number of runs in each state, kept up to date by triggers so that
+# counting runs does not have to scan the index.
+_STATE_COUNTS = """
+CREATE TABLE IF NOT EXISTS state_counts (
+    state TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS runs_count_insert AFTER INSERT ON runs
+BEGIN
+    INSERT INTO state_counts (state, count) VALUES (NEW.state, 1)
+        ON CONFLICT (state) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS runs_count_update AFTER UPDATE OF state ON runs
+WHEN OLD.state != NEW.state
+BEGIN
+    UPDATE state_counts SET count = count - 1 WHERE state = OLD.state;
+    INSERT INTO state_counts (state, count) VALUES (NEW.state, 1)
+        ON CONFLICT (state) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS runs_count_delete AFTER DELETE ON runs
+BEGIN
+    UPDATE state_counts SET count = count - 1 WHERE state = OLD.state;
+END;
+"""
+
+# Number of the latest events kept for clients resuming a stream.
+KEEP_EVENTS = 100000
+
+# State transitions of all runs, in order, for clients following them.
+# Older events are dropped as new ones are recorded, whether or not any
+# server process is streaming them.
+_EVENTS = f"""
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    time REAL NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS events_prune AFTER INSERT ON events
+BEGIN
+    DELETE FROM events WHERE seq <= NEW.seq - {KEEP_EVENTS};
+END;
+CREATE TRIGGER IF NOT EXISTS runs_event_insert AFTER INSERT ON runs
+BEGIN
+    INSERT INTO events (run_id, state, time)
+        VALUES (NEW.run_id, NEW.state, NEW.updated);
+END;
+CREATE TRIGGER IF NOT EXISTS runs_event_update AFTER UPDATE OF state ON runs
+WHEN OLD.state != NEW.state
+BEGIN
+    INSERT INTO events (run_id, state, time)
+        VALUES (NEW.run_id, NEW.state, NEW.updated);
+END;
+"""
+
+_RECOUNT = """
+DELETE FROM state_counts;
+INSERT INTO state_counts (state, count) SELECT state, count(*) FROM runs GROUP BY state;
+"""
+
+
+class RunIndex:
+    """
+    SQLite-backed index of run ids and their last known state.
+
+    The index lives next to the run directories so that every server
+    process sharing ``workflows/`` sees the same list.  ``ListRuns`` is
+    answered from here with a bounded query instead of scanning the
+    run directories.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open (and create if needed) the index database at path."""
+        self.path = path
+        self._local = threading.local()
+        self._changed = threading.Condition()
+        self._generation = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = self._connect()
+        db.executescript(_SCHEMA)
+        columns = {row["name"] for row in db.execute("PRAGMA table_info(runs)")}
+        for name, definition in _COLUMNS.items():
+            if name not in columns:
+                db.execute(f"ALTER TABLE runs ADD COLUMN {name} {definition}")
+        db.executescript(_INDEXES)
+        recount = (
+            db.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'state_counts'"
+            ).fetchone()
+            is None
+        )
+        db.executescript(
+            "BEGIN IMMEDIATE;"
+            + _STATE_COUNTS
+            + _EVENTS
+            + (_RECOUNT if recount else "")
+            + "COMMIT;"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return the connection for the calling thread."""
+        db: sqlite3.Connection | None = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            # Connections must not be shared with a forked child.
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def is_empty(self) -> bool:
+        """Return True if no run has been recorded yet."""
+        return self._connect().execute("SELECT 1 FROM runs LIMIT 1").fetchone() is None
+
+    def add(
+        self,
+        run_id: str,
+        state: str,
+        created: float | None = None,
+        priority: int = 0,
+    ) -> None:
+        """Record a new run; existing entries are left untouched."""
+        now = time.time()
+        cur = self._connect().execute(
+            "INSERT OR IGNORE INTO runs (run_id, state, created, updated, priority) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (run_id, state, created if created is not None else now, now, priority),
+        )
+        if cur.rowcount > 0:
+            self.notify()
+
+    def add_many(self, run_ids: Iterable[str], state: str, priority: int = 0) -> None:
+        """Record new runs in one transaction."""
+        now = time.time()
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT OR IGNORE INTO runs (run_id, state, created, updated, priority) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(run_id, state, now, now, priority) for run_id in run_ids],
+            )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        self.notify()
+
+    def set_state(
+        self, run_id: str, state: str, from_states: Iterable[str] | None = None
+    ) -> bool:
+        """
+        Record a state transition, returning True if the state changed.
+
+        With from_states, the transition only happens from one of them.
+        """
+        query = "UPDATE runs SET state = ?, updated = ? WHERE run_id = ? AND state != ?"
+        args: list[Any] = [state, time.time(), run_id, state]
+        if from_states is not None:
+            from_states = list(from_states)
+            query += " AND state IN (%s)" % ",".join("?" * len(from_states))
+            args.extend(from_states)
+        cur = self._connect().execute(query, args)
+        if cur.rowcount > 0:
+            self.notify()
+            return True
+        return False
+
+    def notify(self) -> None:
+        """
+        Wake up threads waiting for a state change.
+
+        Called after every change made through this object.  Changes
+        made by another process, such as a run monitor, are seen by
+        waiters when somebody calls this, or at their next poll.
+        """
+        with self._changed:
+            self._generation += 1
+            self._changed.notify_all()
+
+    def wait_for_change(
+        self, run_id: str, last_state: str, timeout: float, poll_interval: float = 1.0
+    ) -> dict[str, Any] | None:
+        """
+        Return the entry for run_id once its state is not last_state.
+
+        Blocks for at most timeout seconds, after which the unchanged
+        entry is returned.  Changes made through this object are seen at
+        once, those made by other processes within poll_interval seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            generation = self.generation()
+            entry = self.get(run_id)
+            remaining = deadline - time.monotonic()
+            if entry is None or entry["state"] != last_state or remaining <= 0:
+                return entry
+            self.wait_for_notify(generation, min(remaining, poll_interval))
+
+    def generation(self) -> int:
+        """Return a number which changes whenever notify is called."""
+        with self._changed:
+            return self._generation
+
+    def wait_for_notify(self, generation: int, timeout: float) -> int:
+        """Wait until the generation is no longer generation, or timeout."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._generation != generation, timeout)
+            return self._generation
+
+    def events_since(self, seq: int, limit: int = 1000) -> list[dict[str, Any]]:
+        """Return the state transitions recorded after the event seq."""
+        return [
+            dict(row)
+            for row in self._connect().execute(
+                "SELECT seq, run_id, state, time FROM events WHERE seq > ? "
+                "ORDER BY seq LIMIT ?",
+                (seq, limit),
+            )
+        ]
+
+    def last_event(self) -> int:
+        """Return the seq of the latest event, 0 if there is none."""
+        row = self._connect().execute("SELECT max(seq) FROM events").fetchone()
+        return int(row[0] or 0)
+
+    def count(self, states: Iterable[str]) -> int:
+        """Return the number of runs in one of states."""
+        states = list(states)
+        row = (
+            self._connect()
+            .execute(
+                "SELECT total(count) FROM state_counts WHERE state IN (%s)"
+                % ",".join("?" * len(states)),
+                states,
+            )
+            .fetchone()
+        )
+        return int(row[0])
+
+    def state_counts(self) -> dict[str, int]:
+        """Return the number of runs in each state, for system_state_counts."""
+        return {
+            row["state"]: row["count"]
+            for row in self._connect().execute(
+                "SELECT state, count FROM state_counts WHERE count > 0"
+            )
+        }
+
+    def claim_next(self, max_active: int = 0) -> str | None:
+        """
+        Move the next queued run to INITIALIZING and return its run_id.
+
+        Runs are taken by descending priority, then in submission order.
+        Returns None if nothing is queued, or if max_active runs (when
+        non-zero) are already initializing or running.  The check and
+        the update happen in one transaction, so concurrent server
+        processes never exceed the limit or claim the same run twice.
+        """
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = None
+            if not max_active or self.count(ACTIVE_STATES) < max_active:
+                row = db.execute(
+                    "SELECT run_id FROM runs WHERE state = 'QUEUED' "
+                    "ORDER BY priority DESC, seq LIMIT 1"
+                ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE runs SET state = 'INITIALIZING', updated = ? "
+                    "WHERE run_id = ?",
+                    (time.time(), row["run_id"]),
+                )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        if row is None:
+            return None
+        self.notify()
+        return str(row["run_id"])
+
+    def get(self, run_id: str) -> dict[str, Any] | None:
+        """Return the index entry for run_id, or None if it is unknown."""
+        row = (
+            self._connect()
+            .execute("SELECT * FROM runs WHERE run_id = ?", (run_id,))
+            .fetchone()
+        )
+        return dict(row) if row is not None else None
+
+    def get_states(self, run_ids: Iterable[str]) -> dict[str, str]:
+        """Return the state of each of run_ids found in the index."""
+        run_ids = list(run_ids)
+        states: dict[str, str] = {}
+        db = self._connect()
+        # Stay below SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions.
+        for i in range(0, len(run_ids), 500):
+            chunk = run_ids[i : i + 500]
+            for row in db.execute(
+                "SELECT run_id, state FROM runs WHERE run_id IN (%s)"
+                % ",".join("?" * len(chunk)),
+                chunk,
+            ):
+                states[row["run_id"]] = row["state"]
+        return states
+
+    def in_states(self, states: Iterable[str]) -> list[str]:
+        """Return the run_ids of all runs in one of states, oldest first."""
+        states = list(states)
+        return [
+            row["run_id"]
+            for row in self._connect().execute(
+                "SELECT run_id FROM runs WHERE state IN (%s) ORDER BY seq"
+                % ",".join("?" * len(states)),
+                states,
+            )
+        ]
+
+    def list_runs(
+        self,
+        page_size: int,
+        page_token: str | None = None,
+        states: Iterable[str] | None = None,
+    ) -> tuple[list[dict[str, str]], str]:
+        """
+        Return one page of runs, oldest first, and the token for the next page.
+
+        :param page_size: The maximum number of runs to return.
+        :param page_token: The token returned with the previous page, if any.
+        :param states: Only return runs in one of these states.
+        :raises ValueError: if page_token is not a token issued by this index.
+        """
+        where = []
+        args: list[Any] = []
+        if page_token:
+            try:
+                where.append("seq > ?")
+                args.append(int(page_token))
+            except ValueError:
+                raise ValueError(f"Invalid page_token {page_token!r}") from None
+        if states is not None:
+            states = list(states)
+            where.append("state IN (%s)" % ",".join("?" * len(states)))
+            args.extend(states)
+        query = "SELECT seq, run_id, state FROM runs"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY seq LIMIT ?"
+        args.append(page_size + 1)
+
+        rows = self._connect().execute(query, args).fetchall()
+        next_page_token = (
+            str(rows[page_size - 1]["seq"]) if len(rows) > page_size else ""
+        )
+        return [
+            {"run_id": r["run_id"], "state": r["state"]} for r in rows[:page_size]
+        ], next_page_token
+
+    def archivable(
+        self,
+        before: float,
+        limit: int = 100,
+        after: tuple[float, str] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Return finished runs last updated before the given time, oldest first.
+
+        Pass the updated time and run_id of the last run of a page as
+        after to get the next one.
+        """
+        return [
+            dict(row)
+            for row in self._connect().execute(
+                "SELECT run_id, updated FROM runs WHERE updated < ? "
+                "AND (updated, run_id) > (?, ?) AND archive IS NULL "
+                "AND state IN (%s) ORDER BY updated, run_id LIMIT ?"
+                % ",".join("?" * len(FINAL_STATES)),
+                (before, *(after or (float("-inf"), "")), *FINAL_STATES, limit),
+            )
+        ]
+
+    def set_archive(self, run_id: str, archive: str, size: int) -> bool:
+        """Record the archive of a run, returning False if it was already archived."""
+        cur = self._connect().execute(
+            "UPDATE runs SET archive = ?, archive_size = ? "
+            "WHERE run_id = ? AND archive IS NULL",
+            (archive, size, run_id),
+        )
+        return cur.rowcount > 0
+
+    def archived(
+        self, before: float | None = None, limit: int = 100
+    ) -> list[dict[str, Any]]:
+        """Return archived runs (last updated before the given time), oldest first."""
+        return [
+            dict(row)
+            for row in self._connect().execute(
+                "SELECT run_id, archive, archive_size FROM runs "
+                "WHERE archive IS NOT NULL AND updated < ? ORDER BY updated LIMIT ?",
+                (before if before is not None else float("inf"), limit),
+            )
+        ]
+
+    def archive_size(self) -> int:
+        """Return the total size of the run archives."""
+        row = self._connect().execute("SELECT total(archive_size) FROM runs").fetchone()
+        return int(row[0])
+
+    def remove(self, run_id: str) -> None:
+        """Forget a run."""
+        self._connect().execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+    def populate(self, workflows_dir: str, getstate: Callable[[str], str]) -> None:
+        """
+        Index run directories created before the index existed.
+
+        Runs are ordered by the modification time of their directory.
+        This is only needed once, when upgrading an existing installation.
+        """
+        if not os.path.isdir(workflows_dir):
+            return
+        entries = [
+            (entry.stat().st_mtime, entry.name)
+            for entry in iter_run_dirs(workflows_dir)
+        ]
+        for mtime, run_id in sorted(entries):
+            self.add(run_id, getstate(run_id), created=mtime)
@@ -0,0 +1,320 @@
+"""
+Run a workflow engine and record how it exited.
+
+The local backends do not start the engine directly, they start this
+monitor, which starts the engine, waits for it and writes ``exit.json``
+to the run directory.  The exit status is therefore recorded even if the
+server process that submitted the run has gone away, and any server
+process (or replica) sharing ``workflows/`` can determine the state of
+a run without being the parent of the engine.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess  # nosec B404
+import sys
+import time
+from types import FrameType
+from typing import Any
+
+from wes_service import metrics
+from wes_service.run_index import RunIndex
+from wes_service.supervisor import exit_code_from_status, rusage_dict
+from wes_service.util import atomic_write
+
+
+def process_start_ticks(pid: int) -> int | None:
+    """Return the start time of pid in clock ticks since boot, if known."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name is in parentheses and may contain spaces.
+    fields = stat[stat.rindex(")") + 2 :].split()
+    if fields[0] == "Z":
+        return None
+    return int(fields[19])
+
+
+def pid_alive(pid: int, start_ticks: int | None = None) -> bool:
+    """
+    Check whether pid is a running process on this host.
+
+    When start_ticks is given, a process that reuses the pid of the
+    original one is not mistaken for it.
+    """
+    if os.path.isdir("/proc/self"):
+        ticks = process_start_ticks(pid)
+        return ticks is not None and (start_ticks is None or ticks == start_ticks)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_monitor_info(workdir: str, pid: int) -> None:
+    """Record where the monitor for a run is running."""
+    atomic_write(
+        os.path.join(workdir, "monitor.json"),
+        json.dumps(
+            {
+                "host": socket.gethostname(),
+                "pid": pid,
+                "start_ticks": process_start_ticks(pid),
+                "start_time": time.time(),
+            }
+        ),
+    )
+
+
+def read_monitor_info(workdir: str) -> dict[str, Any] | None:
+    """Return where the monitor for a run was started, if it was."""
+    try:
+        with open(os.path.join(workdir, "monitor.json")) as f:
+            return json.load(f)  # type: ignore[no-any-return]
+    except FileNotFoundError:
+        return None
+
+
+def monitor_alive(workdir: str) -> bool | None:
+    """
+    Check whether the monitor of a run is still running.
+
+    Returns None if that cannot be determined from this host, or if the
+    run was not started through a monitor.
+    """
+    info = read_monitor_info(workdir)
+    if info is None or info["host"] != socket.gethostname():
+        return None
+    return pid_alive(info["pid"], info["start_ticks"])
+
+
+def monitor_elsewhere(workdir: str) -> bool:
+    """Check whether the monitor of a run is running on another host."""
+    info = read_monitor_info(workdir)
+    return (
+        info is not None
+        and info["host"] != socket.gethostname()
+        and read_exit(workdir) is None
+    )
+
+
+def write_exit(
+    workdir: str,
+    exit_code: int,
+    rusage: dict[str, float],
+    end_time: float,
+    start_time: float | None = None,
+) -> None:
+    """Atomically record the exit status of a run."""
+    atomic_write(
+        os.path.join(workdir, "exit.json"),
+        json.dumps(
+            {
+                "exit_code": exit_code,
+                "start_time": start_time,
+                "end_time": end_time,
+                "rusage": rusage,
+            }
+        ),
+    )
+
+
+def record_lost_exit(
+    workdir: str, exit_code: int, rusage: dict[str, float], end_time: float
+) -> None:
+    """Record the exit of a monitor that died without recording the engine's."""
+    info = read_monitor_info(workdir) or {}
+    write_exit(workdir, exit_code, rusage, end_time, info.get("start_time"))
+
+
+def read_exit(workdir: str) -> dict[str, Any] | None:
+    """Return the recorded exit status of a run, if it has exited."""
+    try:
+        with open(os.path.join(workdir, "exit.json")) as f:
+            return json.load(f)  # type: ignore[no-any-return]
+    except FileNotFoundError:
+        return None
+
+
+def iso_time(t: float | None) -> str:
+    """Format a timestamp as WES does, or return "" if it is unknown."""
+    if t is None:
+        return ""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+
+
+def resources(rusage: dict[str, float]) -> dict[str, float]:
+    """Describe the resources used by the engine of a run, for its run_log."""
+    if not rusage:
+        return {}
+    return {
+        "cpu_user_seconds": rusage["utime"],
+        "cpu_system_seconds": rusage["stime"],
+        # ru_maxrss is in kilobytes on Linux.
+        "max_rss_bytes": int(rusage["maxrss"]) * 1024,
+        "block_input_operations": int(rusage["inblock"]),
+        "block_output_operations": int(rusage["oublock"]),
+    }
+
+
+def run_log_times(workdir: str) -> dict[str, Any]:
+    """
+    Return the start_time, end_time and resources of a run for its run_log.
+
+    The resources are those of the engine and of every process it
+    waited for, and are only known once the engine has exited.
+    """
+    exit_info = read_exit(workdir) or {}
+    start_time = exit_info.get("start_time")
+    if start_time is None:
+        start_time = (read_monitor_info(workdir) or {}).get("start_time")
+    return {
+        "start_time": iso_time(start_time),
+        "end_time": iso_time(exit_info.get("end_time")),
+        "resources": resources(exit_info.get("rusage") or {}),
+    }
+
+
+def observe_run(workdir: str) -> None:
+    """Add the resources used by a run that exited to the metrics."""
+    exit_info = read_exit(workdir)
+    if exit_info is None:
+        return
+    rusage = exit_info.get("rusage") or {}
+    if rusage:
+        metrics.RUN_CPU_SECONDS.inc(rusage["utime"], mode="user")
+        metrics.RUN_CPU_SECONDS.inc(rusage["stime"], mode="system")
+        metrics.RUN_BLOCK_IO.inc(rusage["inblock"], direction="read")
+        metrics.RUN_BLOCK_IO.inc(rusage["oublock"], direction="write")
+        metrics.RUN_MAX_RSS.observe(rusage["maxrss"] * 1024)
+    start_time = exit_info.get("start_time")
+    if start_time is not None:
+        metrics.RUN_DURATION.observe(exit_info["end_time"] - start_time)
+
+
+def request_cancel(workdir: str) -> None:
+    """Record that the run is being canceled, before any process is signalled."""
+    atomic_write(os.path.join(workdir, "cancel"), json.dumps({"time": time.time()}))
+
+
+def withdraw_cancel(workdir: str) -> None:
+    """Forget a cancel request for a run that finished before it was canceled."""
+    try:
+        os.unlink(os.path.join(workdir, "cancel"))
+    except FileNotFoundError:
+        pass
+
+
+def cancel_state(workdir: str) -> str | None:
+    """Return CANCELING or CANCELED if the run was canceled, None otherwise."""
+    if not os.path.exists(os.path.join(workdir, "cancel")):
+        return None
+    if read_exit(workdir) is None and monitor_alive(workdir):
+        return "CANCELING"
+    return "CANCELED"
+
+
+def terminate(workdir: str, grace: float = 10.0) -> bool:
+    """
+    Stop the monitor of a run and every process in its process group.
+
+    The monitor is started in a session of its own, so its pid is also
+    the id of the process group of the engine and of the workers the
+    engine starts on this host.  The group is sent SIGTERM, then SIGKILL
+    if any of it is still there after grace seconds.  The exit of a
+    monitor that was killed before recording it is recorded as 128+9.
+
+    Returns False, without doing anything, if the monitor is running on
+    another host, where it can only be stopped from.
+    """
+    if monitor_elsewhere(workdir):
+        return False
+    if monitor_alive(workdir):
+        with open(os.path.join(workdir, "monitor.json")) as f:
+            pgid = json.load(f)["pid"]
+        for sig, wait in ((signal.SIGTERM, grace), (signal.SIGKILL, 5.0)):
+            try:
+                os.killpg(pgid, sig)
+            except ProcessLookupError:
+                break
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline and process_group_alive(pgid):
+                time.sleep(0.1)
+            if not process_group_alive(pgid):
+                break
+    if read_exit(workdir) is None and monitor_alive(workdir) is False:
+        record_lost_exit(workdir, 128 + signal.SIGKILL, {}, time.time())
+    return True
+
+
+def process_group_alive(pgid: int) -> bool:
+    """Check whether any process of the group pgid is left."""
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def monitor_command(
+    workdir: str, run_id: str, index: RunIndex | None, cmd: list[str]
+) -> list[str]:
+    """Return the command line that runs cmd under a monitor."""
+    args = [sys.executable, "-m", "wes_service.run_monitor", "--workdir", workdir]
+    args += ["--run-id", run_id]
+    if index is not None:
+        args += ["--index", index.path]
+    return args + ["--"] + cmd
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Run the command, then record its exit status."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workdir", required=True)
+    parser.add_argument("--run-id", required=True)
+    parser.add_argument("--index", default=None)
+    parser.add_argument("cmd", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    cmd = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+
+    start_time = time.time()
+    try:
+        proc = subprocess.Popen(cmd, close_fds=True)  # nosec B603
+    except OSError as e:
+        print(f"Failed to start {cmd[0]!r}: {e}", file=sys.stderr)
+        exit_code = 127
+        write_exit(args.workdir, exit_code, {}, time.time(), start_time)
+        if args.index:
+            RunIndex(args.index).set_state(args.run_id, "EXECUTOR_ERROR")
+        return exit_code
+
+    def forward(signum: int, frame: FrameType | None) -> None:
+        proc.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    _pid, status, ru = os.wait4(proc.pid, 0)
+    proc.returncode = exit_code = exit_code_from_status(status)
+    write_exit(args.workdir, exit_code, rusage_dict(ru), time.time(), start_time)
+    if args.index:
+        RunIndex(args.index).set_state(
+            args.run_id,
+            cancel_state(args.workdir)
+            or ("COMPLETE" if exit_code == 0 else "EXECUTOR_ERROR"),
+        )
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
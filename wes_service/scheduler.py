@@ -0,0 +1,96 @@
+"""Admission control for the local backends."""
+
+import logging
+import threading
+from collections.abc import Callable
+
+from wes_service.run_index import RunIndex
+
+
+class QueueFull(Exception):
+    """Raised when a run is submitted while the queue is at capacity."""
+
+    def __init__(self, retry_after: int) -> None:
+        """Record how many seconds the client should wait before retrying."""
+        super().__init__("Too many queued workflow runs, try again later")
+        self.retry_after = retry_after
+
+
+class RunScheduler:
+    """
+    Start queued runs without exceeding a limit on concurrent runs.
+
+    Runs are queued in the run index, so every server process sharing
+    the index shares the queue and the limit.  Each process runs a
+    dispatcher thread which claims queued runs from the index and calls
+    start for them.  The dispatcher is woken when a run is submitted
+    locally and otherwise checks the index every poll_interval seconds,
+    which picks up runs that finished or were queued elsewhere.
+    """
+
+    def __init__(
+        self,
+        index: RunIndex,
+        start: Callable[[str], None],
+        max_active: int = 0,
+        max_queued: int = 0,
+        retry_after: int = 60,
+        poll_interval: float = 1.0,
+        poll: Callable[[], None] | None = None,
+    ) -> None:
+        """
+        Start the dispatcher thread.
+
+        :param index: The run index holding the queue.
+        :param start: Called with the run_id of each run to start.
+        :param max_active: Maximum number of initializing or running runs,
+            0 for no limit.
+        :param max_queued: Maximum number of queued runs, 0 for no limit.
+        :param retry_after: Seconds a client is asked to wait when the queue is full.
+        :param poll_interval: Seconds between checks of the index.
+        :param poll: Also called by the dispatcher thread at every check.
+        """
+        self.index = index
+        self.start = start
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.retry_after = retry_after
+        self.poll_interval = poll_interval
+        self.poll = poll
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop, name="wes-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def check_admission(self, count: int = 1) -> None:
+        """Raise QueueFull if count more runs cannot be queued right now."""
+        if self.max_queued and self.index.count(["QUEUED"]) + count > self.max_queued:
+            raise QueueFull(self.retry_after)
+
+    def wake(self) -> None:
+        """Look for runs to start now instead of at the next poll."""
+        self._wakeup.set()
+
+    def _loop(self) -> None:
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self.dispatch()
+            except Exception:
+                logging.exception("Failed to dispatch queued workflow runs")
+            if self.poll is not None:
+                try:
+                    self.poll()
+                except Exception:
+                    logging.exception("Failed to check the index")
+
+    def dispatch(self) -> None:
+        """Start queued runs until the queue is empty or the limit is reached."""
+        while (run_id := self.index.claim_next(self.max_active)) is not None:
+            try:
+                self.start(run_id)
+            except Exception:
+                logging.exception("Workflow %s: failed to start", run_id)
+                self.index.set_state(run_id, "SYSTEM_ERROR")
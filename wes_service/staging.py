@@ -0,0 +1,112 @@
+"""
+Stream multipart attachments to disk as they are received.
+
+By default connexion buffers the whole request body in memory to
+validate it, and werkzeug then spools each file part to a temporary
+file which collect_attachments copies into the run directory.  With
+the request class and validator here each part is written once, in
+chunks, to a file in a staging directory on the same filesystem as the
+run directories, and collect_attachments only has to rename it.
+"""
+
+import os
+import shutil
+import tempfile
+from typing import IO, Any
+
+import flask
+from connexion.datastructures import MediaTypeDict  # type: ignore[import-untyped]
+from connexion.validators import (  # type: ignore[import-untyped]
+    VALIDATOR_MAP,
+    AbstractRequestBodyValidator,
+)
+from starlette.types import Receive, Scope
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from wes_service.placement import VolumePlacement
+from wes_service.util import StagedFile, WESBackend, parse_size
+
+
+class StagingRequest(flask.Request):
+    """A request that streams file parts to the staging directory."""
+
+    placement: VolumePlacement | None = None
+    max_file_size: int | None = None
+    _request_staging_dir: str | None = None
+
+    def _get_file_stream(
+        self,
+        total_content_length: int | None,
+        content_type: str | None,
+        filename: str | None = None,
+        content_length: int | None = None,
+    ) -> IO[bytes]:
+        if (
+            self.max_file_size is not None
+            and (content_length or 0) > self.max_file_size
+        ):
+            raise RequestEntityTooLarge(
+                f"Attachment exceeds the limit of {self.max_file_size} bytes"
+            )
+        if self._request_staging_dir is None:
+            # All the parts of a request go to the same volume.
+            staging_dir = (
+                self.placement.staging_dir(self.placement.choose())
+                if self.placement is not None
+                else None
+            )
+            self._request_staging_dir = tempfile.mkdtemp(
+                prefix="upload", dir=staging_dir
+            )
+        fd, path = tempfile.mkstemp(dir=self._request_staging_dir)
+        os.close(fd)
+        return StagedFile(path, self.max_file_size)
+
+    def close(self) -> None:
+        """Close the request and remove any attachments that were not claimed."""
+        super().close()
+        if self._request_staging_dir is not None:
+            shutil.rmtree(self._request_staging_dir, ignore_errors=True)
+            self._request_staging_dir = None
+
+
+class StreamingMultiPartValidator(AbstractRequestBodyValidator):  # type: ignore[misc]
+    """
+    Pass multipart bodies through without buffering them.
+
+    The required fields of RunWorkflow are checked by collect_attachments.
+    """
+
+    async def wrap_receive(
+        self, receive: Receive, *, scope: Scope
+    ) -> tuple[Receive, Scope]:
+        return receive, scope
+
+
+def validator_map() -> dict[str, Any]:
+    """Return the connexion validators to use with StagingRequest."""
+    body = MediaTypeDict(VALIDATOR_MAP["body"])
+    body["multipart/form-data"] = StreamingMultiPartValidator
+    return {"body": body}
+
+
+def setup_staging(flask_app: flask.Flask, backend: WESBackend) -> None:
+    """
+    Stream uploads to disk, enforcing the size limits set in the backend options.
+
+    max_attachment_size: largest single attachment, e.g. 20G
+    max_request_size: largest RunWorkflow request, all attachments included
+    staging_dir: where attachments are received (default: the system temp dir)
+    volume: where attachments are received and runs placed, see placement.py
+    """
+    flask_app.config["MAX_CONTENT_LENGTH"] = parse_size(
+        backend.getopt("max_request_size")
+    )
+    flask_app.request_class = type(
+        "StagingRequest",
+        (StagingRequest,),
+        {
+            "placement": backend.placement,
+            "max_file_size": parse_size(backend.getopt("max_attachment_size")),
+        },
+    )
@@ -0,0 +1,133 @@
+"""Reap workflow engine processes as soon as they exit."""
+
+import logging
+import os
+import resource
+import selectors
+import subprocess  # nosec B404
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+ExitCallback = Callable[[int, dict[str, float], float], None]
+
+
+def exit_code_from_status(status: int) -> int:
+    """Convert a wait status to an exit code, using 128+N for signal N."""
+    code = os.waitstatus_to_exitcode(status)
+    return 128 - code if code < 0 else code
+
+
+def rusage_dict(ru: resource.struct_rusage | None) -> dict[str, float]:
+    """Extract the interesting fields of a struct_rusage."""
+    if ru is None:
+        return {}
+    return {
+        "utime": ru.ru_utime,
+        "stime": ru.ru_stime,
+        "maxrss": ru.ru_maxrss,
+        "inblock": ru.ru_inblock,
+        "oublock": ru.ru_oublock,
+    }
+
+
+class ProcessSupervisor:
+    """
+    Wait for child processes from a single background thread.
+
+    Each watched process is reaped as soon as it exits, and its callback
+    receives the exit code, resource usage and the time it was reaped.
+    Exits are detected with pidfds where the platform supports them and
+    by polling ``wait4(WNOHANG)`` every poll_interval seconds otherwise.
+    """
+
+    def __init__(self, poll_interval: float = 1.0) -> None:
+        """Start the supervisor thread."""
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._watched: dict[int, tuple["subprocess.Popen[Any]", ExitCallback]] = {}
+        self._pending: list[int] = []
+        self._polled: set[int] = set()
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._thread = threading.Thread(
+            target=self._loop, name="wes-supervisor", daemon=True
+        )
+        self._thread.start()
+
+    def watch(self, proc: "subprocess.Popen[Any]", callback: ExitCallback) -> None:
+        """Reap proc when it exits and call callback from the supervisor thread."""
+        with self._lock:
+            self._watched[proc.pid] = (proc, callback)
+            self._pending.append(proc.pid)
+        os.write(self._wake_w, b"\0")
+
+    def is_watching(self, pid: int) -> bool:
+        """Return True if pid is a child that has not been reaped yet."""
+        with self._lock:
+            return pid in self._watched
+
+    def _register_pending(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for pid in pending:
+            try:
+                pidfd = os.pidfd_open(pid)
+            except (AttributeError, OSError):
+                self._polled.add(pid)
+            else:
+                self._selector.register(pidfd, selectors.EVENT_READ, pid)
+
+    def _loop(self) -> None:
+        while True:
+            timeout = self.poll_interval if self._polled else None
+            for key, _events in self._selector.select(timeout):
+                if key.fd == self._wake_r:
+                    os.read(self._wake_r, 4096)
+                    continue
+                self._selector.unregister(key.fd)
+                os.close(key.fd)
+                self._reap(key.data, 0)
+            for pid in list(self._polled):
+                self._reap(pid, os.WNOHANG)
+            self._register_pending()
+
+    def _reap(self, pid: int, options: int) -> None:
+        try:
+            wpid, status, ru = os.wait4(pid, options)
+        except ChildProcessError:
+            # Somebody else reaped it, the exit status is lost.
+            wpid, status, ru = pid, 255 << 8, None
+        if wpid == 0:
+            return
+        self._polled.discard(pid)
+        with self._lock:
+            proc, callback = self._watched[pid]
+        proc.returncode = exit_code_from_status(status)
+        try:
+            callback(proc.returncode, rusage_dict(ru), time.time())
+        except Exception:
+            logging.exception("Failed to record exit of process %s", pid)
+        # Only forget the process once its exit has been recorded, so that
+        # is_watching() never reports a process that is neither running
+        # nor recorded.
+        with self._lock:
+            del self._watched[pid]
+
+
+_supervisor: ProcessSupervisor | None = None
+_supervisor_pid: int | None = None
+_supervisor_lock = threading.Lock()
+
+
+def get_supervisor() -> ProcessSupervisor:
+    """Return the supervisor for this process, starting it if needed."""
+    global _supervisor, _supervisor_pid
+    with _supervisor_lock:
+        if _supervisor is None or _supervisor_pid != os.getpid():
+            _supervisor = ProcessSupervisor()
+            _supervisor_pid = os.getpid()
+        return _supervisor
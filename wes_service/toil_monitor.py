@@ -0,0 +1,101 @@
+"""Track the state of running Toil workflows from a background thread."""
+
+import logging
+import threading
+import time
+from collections.abc import Callable
+
+from wes_service.run_index import RunIndex
+
+
+class ToilMonitor:
+    """
+    Keep the state of running Toil workflows up to date in the run index.
+
+    Status requests are answered from the index, never by looking at the
+    runs themselves.  Every poll_interval seconds the monitor looks at
+    each running run, which costs a few stats and reading what was
+    appended to its stderr, and records the runs that finished.  Asking
+    Toil about a jobstore starts a whole interpreter, so it is only done
+    for runs whose runner cannot be watched from this host, and at most
+    every jobstore_interval seconds for each of them.  Finished runs are
+    then handed to the finished callback, so that slow work on their
+    outputs is done here rather than in a request.
+    """
+
+    def __init__(
+        self,
+        index: RunIndex,
+        getstate: Callable[[str, bool], str],
+        finished: Callable[[str], None] | None = None,
+        poll_interval: float = 1.0,
+        jobstore_interval: float = 60.0,
+    ) -> None:
+        """
+        Set up the monitor; call start to begin monitoring.
+
+        :param index: The run index.
+        :param getstate: Returns the current state of a run, also
+            checking its jobstore if the second argument is True.
+        :param finished: Called from the monitor thread with each run
+            seen to leave the RUNNING state.
+        :param poll_interval: Seconds between checks of the running runs.
+        :param jobstore_interval: Minimum seconds between two checks of
+            the jobstore of a run.
+        """
+        self.index = index
+        self.getstate = getstate
+        self.finished = finished or (lambda run_id: None)
+        self.poll_interval = poll_interval
+        self.jobstore_interval = jobstore_interval
+        self._jobstore_checked: dict[str, float] = {}
+        self._running: set[str] = set()
+        self._thread = threading.Thread(
+            target=self._loop, name="wes-toil-monitor", daemon=True
+        )
+
+    def start(self) -> None:
+        """Check the running runs every poll_interval seconds."""
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logging.exception("Failed to check running Toil workflows")
+            time.sleep(self.poll_interval)
+
+    def check(self) -> None:
+        """Record the state of every running run."""
+        seen = set(self.index.in_states(["RUNNING"]))
+        running = set(seen)
+        now = time.monotonic()
+        for run_id in sorted(seen):
+            # A new run has no jobstore worth asking about yet.
+            last = self._jobstore_checked.setdefault(run_id, now)
+            check_jobstore = now - last >= self.jobstore_interval
+            if check_jobstore:
+                self._jobstore_checked[run_id] = now
+            try:
+                state = self.getstate(run_id, check_jobstore)
+            except Exception:
+                logging.exception("Workflow %s: failed to get the state", run_id)
+                continue
+            if state != "RUNNING":
+                self.index.set_state(run_id, state)
+                running.discard(run_id)
+        for run_id in set(self._jobstore_checked) - running:
+            del self._jobstore_checked[run_id]
+
+        finished = (self._running | seen) - running
+        self._running = running
+        if finished:
+            # Most runs are recorded as finished by their run monitor, in
+            # another process: wake up the status waiters.
+            self.index.notify()
+        for run_id in sorted(finished):
+            try:
+                self.finished(run_id)
+            except Exception:
+                logging.exception("Workflow %s: failed to finalize", run_id)
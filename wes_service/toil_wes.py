@@ -1,47 +1,108 @@
 """Toil backed for the WES service."""
 
-import errno
+import hashlib
 import json
 import logging
 import os
 import shutil
+import socket
 import subprocess  # nosec B404
+import tempfile
+import threading
 import time
-import uuid
-from multiprocessing import Process
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, cast
 
-from wes_service.util import WESBackend
+from wes_service import metrics
+from wes_service.layout import run_dir
+from wes_service.local_backend import LocalBackend
+from wes_service.log_scanner import LogScanner
+from wes_service.run_index import RunIndex
+from wes_service.run_monitor import (
+    cancel_state,
+    iso_time,
+    monitor_alive,
+    monitor_command,
+    observe_run,
+    pid_alive,
+    process_start_ticks,
+    read_exit,
+    record_lost_exit,
+    run_log_times,
+    terminate,
+    write_monitor_info,
+)
+from wes_service.supervisor import get_supervisor
+from wes_service.toil_monitor import ToilMonitor
+from wes_service.util import WESBackend, atomic_write
 
 logging.basicConfig(level=logging.INFO)
 
+# Lines in the stderr of Toil which mean that the workflow failed.
+TOIL_FAILURES = ("Traceback (most recent call last)",)
+
+# Threads hashing the outputs of a completed run.
+FINALIZE_WORKERS = 4
+
+# Seconds between two checks for the output manifest of a run that another
+# process is writing.
+FINALIZE_POLL_INTERVAL = 0.5
+
+# The process writing the output manifest of a run touches its claim at
+# least ten times in this many seconds.  A claim left untouched for longer
+# is taken over, which is the only way to tell that a process on another
+# host is gone.
+FINALIZE_CLAIM_TIMEOUT = 300.0
+
+
+def output_file(outdir: str, path: str) -> dict[str, Any]:
+    """Describe an output file, with its size and checksum."""
+    sha1 = hashlib.sha1()  # nosec B324
+    size = 0
+    with open(os.path.join(outdir, path), "rb") as f:
+        while chunk := f.read(1 << 20):
+            sha1.update(chunk)
+            size += len(chunk)
+    return {
+        "location": path,
+        "size": size,
+        "checksum": "sha1$" + sha1.hexdigest(),
+        "class": "File",
+    }
+
 
 class ToilWorkflow:
-    def __init__(self, run_id: str) -> None:
+    def __init__(
+        self, run_id: str, index: RunIndex | None = None, workdir: str | None = None
+    ) -> None:
         """
         Represents a toil workflow.
 
         :param run_id: A uuid string.  Used to name the folder that contains
             all of the files containing this particular workflow instance's information.
+        :param index: The run index to record state transitions in.
+        :param workdir: The run directory (default: found by run_id).
+
+        Nothing is written until the run is queued.
         """
         super().__init__()
         self.run_id = run_id
+        self.index = index
 
-        self.workdir = os.path.join(os.getcwd(), "workflows", self.run_id)
+        self.workdir = workdir or run_dir(self.run_id)
         self.outdir = os.path.join(self.workdir, "outdir")
-        if not os.path.exists(self.outdir):
-            os.makedirs(self.outdir)
 
         self.outfile = os.path.join(self.workdir, "stdout")
         self.errfile = os.path.join(self.workdir, "stderr")
-        self.starttime = os.path.join(self.workdir, "starttime")
-        self.endtime = os.path.join(self.workdir, "endtime")
         self.pidfile = os.path.join(self.workdir, "pid")
         self.statcompletefile = os.path.join(self.workdir, "status_completed")
         self.staterrorfile = os.path.join(self.workdir, "status_error")
         self.cmdfile = os.path.join(self.workdir, "cmd")
         self.jobstorefile = os.path.join(self.workdir, "jobstore")
+        self.manifestfile = os.path.join(self.workdir, "outputs.json")
+        self.finalizingfile = os.path.join(self.workdir, "finalizing")
         self.request_json = os.path.join(self.workdir, "request.json")
+        self.queuedfile = os.path.join(self.workdir, "queued")
         self.input_json = os.path.join(self.workdir, "wes_input.json")
         self.jobstore_default = "file:" + os.path.join(self.workdir, "toiljobstore")
         self.jobstore: str | None = None
@@ -136,23 +197,77 @@ class ToilWorkflow:
         with open(self.cmdfile, "w") as f:
             f.write(str(cmd))
         stdout = open(self.outfile, "w")
-        stderr = open(self.errfile, "w")
+        # Appended to what was logged while staging the attachments.
+        stderr = open(self.errfile, "a")
         logging.info(
             "Calling: %s, with outfile: %s and errfile: %s",
             (" ".join(cmd)),
             self.outfile,
             self.errfile,
         )
+        if isinstance(cmd, str):
+            cmd = [cmd]
+        metrics.SUBPROCESS_STARTS.inc(command=os.path.basename(cmd[0]))
         process = subprocess.Popen(  # nosec B603
-            cmd, stdout=stdout, stderr=stderr, close_fds=True, cwd=cwd
+            monitor_command(
+                self.workdir,
+                self.run_id,
+                self.index,
+                cmd,
+            ),
+            stdout=stdout,
+            stderr=stderr,
+            close_fds=True,
+            cwd=cwd,
+            start_new_session=True,
         )
         stdout.close()
         stderr.close()
+        write_monitor_info(self.workdir, process.pid)
+        get_supervisor().watch(process, self.record_exit)
 
         return process.pid
 
-    def cancel(self) -> None:
-        """Cancel the run (currently a no-op for Toil)."""
+    def record_exit(
+        self, exit_code: int, rusage: dict[str, float], end_time: float
+    ) -> None:
+        """
+        Reap the run monitor.
+
+        The monitor records the exit status of the runner itself, this
+        only records a failure if the monitor died without doing so.
+        """
+        if read_exit(self.workdir) is None:
+            record_lost_exit(self.workdir, exit_code or 255, rusage, end_time)
+            if self.index is not None:
+                self.index.set_state(
+                    self.run_id, cancel_state(self.workdir) or "EXECUTOR_ERROR"
+                )
+        elif self.index is not None:
+            # The monitor has updated the index, wake up anyone waiting for it.
+            self.index.notify()
+        observe_run(self.workdir)
+
+    def cancel(self, grace: float = 10.0) -> bool:
+        """
+        Stop the processes of the run and remove its jobstore and partial outputs.
+
+        Returns False if they run on another host, from where the run
+        must be canceled.
+        """
+        if not terminate(self.workdir, grace):
+            return False
+        try:
+            with open(self.jobstorefile) as f:
+                jobstore = f.read().rstrip()
+        except FileNotFoundError:
+            jobstore = ""
+        # Jobstores elsewhere than on the local filesystem are left to
+        # `toil clean`.
+        if jobstore.startswith("file:"):
+            shutil.rmtree(jobstore[5:], ignore_errors=True)
+        shutil.rmtree(self.outdir, ignore_errors=True)
+        return True
 
     def fetch(self, filename: str) -> str:
         """Retrieve a files contents, if it exists."""
@@ -168,27 +283,20 @@ class ToilWorkflow:
         with open(self.request_json) as f:
             request = json.load(f)
 
-        with open(self.jobstorefile) as f:
-            self.jobstore = f.read()
+        # Only written once the run is started.
+        self.jobstore = self.fetch(self.jobstorefile) or None
 
         stderr = self.fetch(self.errfile)
-        starttime = self.fetch(self.starttime)
-        endtime = self.fetch(self.endtime)
         cmd = [self.fetch(self.cmdfile)]
 
-        outputobj = {}
-        if state == "COMPLETE":
-            # only tested locally
-            if self.jobstore.startswith("file:"):
-                for f2 in os.listdir(self.outdir):
-                    if f2.startswith("out_tmpdir"):
-                        shutil.rmtree(os.path.join(self.outdir, f2))
-                for f3 in os.listdir(self.outdir):
-                    outputobj[f3] = {
-                        "location": os.path.join(self.outdir, f3),
-                        "size": os.stat(os.path.join(self.outdir, f3)).st_size,
-                        "class": "File",
-                    }
+        outputobj = self.outputs() if state == "COMPLETE" else {}
+
+        times = run_log_times(self.workdir)
+        # Runs started by older versions recorded their times in these files.
+        for key, filename in (("start_time", "starttime"), ("end_time", "endtime")):
+            if not times[key]:
+                legacy = self.fetch(os.path.join(self.workdir, filename))
+                times[key] = iso_time(float(legacy)) if legacy else ""
 
         return {
             "run_id": self.run_id,
@@ -196,16 +304,189 @@ class ToilWorkflow:
             "state": state,
             "run_log": {
                 "cmd": cmd,
-                "start_time": starttime,
-                "end_time": endtime,
                 "stdout": "",
                 "stderr": stderr,
                 "exit_code": exit_code,
+                **times,
             },
             "task_logs": [],
             "outputs": outputobj,
         }
 
+    def outputs(self) -> dict[str, Any]:
+        """
+        Return the outputs of a completed run, from its manifest.
+
+        The manifest is written first if no other process is writing it,
+        otherwise this waits for it.  Locations are kept relative to the
+        outdir in the manifest, so that the run directory can be moved.
+        """
+        while True:
+            try:
+                with open(self.manifestfile) as f:
+                    outputs = cast(dict[str, Any], json.load(f))
+                break
+            except FileNotFoundError:
+                pass
+            written = self.finalize()
+            if written is not None:
+                outputs = written
+                break
+            time.sleep(FINALIZE_POLL_INTERVAL)
+        return {
+            name: dict(entry, location=os.path.join(self.outdir, entry["location"]))
+            for name, entry in outputs.items()
+        }
+
+    def claim_finalize(self) -> bool:
+        """
+        Claim the writing of the output manifest for this process.
+
+        Returns False once the manifest is written, or while another
+        process holds the claim.  The claim of a process that died on this
+        host, or that was not touched for FINALIZE_CLAIM_TIMEOUT seconds,
+        is taken over.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.workdir, prefix=".finalizing")
+        with os.fdopen(fd, "w") as f:
+            json.dump(
+                {
+                    "host": socket.gethostname(),
+                    "pid": os.getpid(),
+                    "start_ticks": process_start_ticks(os.getpid()),
+                },
+                f,
+            )
+        try:
+            # Linking the complete file only succeeds if there is no claim.
+            os.link(tmp, self.finalizingfile)
+        except FileExistsError:
+            pass
+        else:
+            if not os.path.exists(self.manifestfile):
+                return True
+            # Written by the process that held the claim before.
+            os.unlink(self.finalizingfile)
+            return False
+        finally:
+            os.unlink(tmp)
+        try:
+            with open(self.finalizingfile) as f:
+                claim = json.load(f)
+                touched = os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            # Released in the meantime, the manifest should be there.
+            return False
+        stale = time.time() - touched > FINALIZE_CLAIM_TIMEOUT
+        if not stale and (
+            claim["host"] != socket.gethostname()
+            or pid_alive(claim["pid"], claim["start_ticks"])
+        ):
+            return False
+        logging.info("Workflow %s: taking over its finalization", self.run_id)
+        try:
+            os.unlink(self.finalizingfile)
+        except FileNotFoundError:
+            pass
+        return self.claim_finalize()
+
+    def finalize(self) -> dict[str, Any] | None:
+        """
+        Clean up the outputs of a completed run and record them in its manifest.
+
+        Returns None, without doing anything, if the manifest is already
+        written or another process is writing it.
+        """
+        if not self.claim_finalize():
+            return None
+        done = threading.Event()
+        threading.Thread(
+            target=self.keep_claim,
+            args=(done,),
+            name=f"wes-finalize-{self.run_id}",
+            daemon=True,
+        ).start()
+        try:
+            return self.list_outputs()
+        finally:
+            done.set()
+            os.unlink(self.finalizingfile)
+
+    def keep_claim(self, done: threading.Event) -> None:
+        """Touch the claim on the output manifest until done is set."""
+        while not done.wait(FINALIZE_CLAIM_TIMEOUT / 10):
+            try:
+                os.utime(self.finalizingfile)
+            except FileNotFoundError:
+                return
+
+    def list_outputs(self) -> dict[str, Any]:
+        """
+        Write the output manifest of the run and return it.
+
+        Outputs are only listed for jobstores on the local filesystem.
+        """
+        with open(self.jobstorefile) as f:
+            jobstore = f.read()
+        outputs: dict[str, Any] = {}
+        if jobstore.startswith("file:") and os.path.isdir(self.outdir):
+            for name in os.listdir(self.outdir):
+                if name.startswith("out_tmpdir"):
+                    shutil.rmtree(os.path.join(self.outdir, name), ignore_errors=True)
+            paths = sorted(
+                os.path.relpath(os.path.join(root, name), self.outdir)
+                for root, _dirs, files in os.walk(self.outdir)
+                for name in files
+                if os.path.isfile(os.path.join(root, name))
+            )
+            with ThreadPoolExecutor(FINALIZE_WORKERS) as pool:
+                entries = pool.map(output_file, [self.outdir] * len(paths), paths)
+                outputs = dict(zip(paths, entries))
+        atomic_write(self.manifestfile, json.dumps(outputs))
+        return outputs
+
+    def check_request(self, request: dict[str, Any]) -> None:
+        """Raise ValueError if the workflow type or version is not supported."""
+        wftype = request["workflow_type"].lower().strip()
+        version = request["workflow_type_version"]
+
+        if wftype == "cwl" and version not in ("v1.0", "v1.1", "v1.2"):
+            raise ValueError(
+                'workflow_type "cwl" requires '
+                '"workflow_type_version" to be "v1.[012]": ' + str(version)
+            )
+        if version != "2.7" and wftype == "py":
+            raise ValueError(
+                'workflow_type "py" requires '
+                '"workflow_type_version" to be "2.7": ' + str(version)
+            )
+
+    def queue(self, request: dict[str, Any], tempdir: str) -> None:
+        """Persist the request so that the run can be started later."""
+        self.check_request(request)
+        os.makedirs(self.outdir, exist_ok=True)
+        with open(self.request_json, "w") as f:
+            json.dump(request, f)
+        with open(self.queuedfile, "w") as f:
+            json.dump({"tempdir": tempdir}, f)
+
+    def start(self, opts: WESBackend) -> None:
+        """Start a queued run."""
+        with open(self.request_json) as f:
+            request = json.load(f)
+        with open(self.queuedfile) as f:
+            tempdir = json.load(f)["tempdir"]
+        if cancel_state(self.workdir):
+            return
+        self.run(request, tempdir, opts)
+        # Keep track of the staged attachments for the retention policy.
+        os.replace(self.queuedfile, os.path.join(self.workdir, "tempdir.json"))
+        if self.index is not None:
+            self.index.set_state(self.run_id, "RUNNING", from_states=["INITIALIZING"])
+        if cancel_state(self.workdir):
+            # Canceled while it was starting.
+            self.cancel()
+
     def run(
         self, request: dict[str, Any], tempdir: str, opts: WESBackend
     ) -> dict[str, str]:
@@ -232,23 +513,9 @@ class ToilWorkflow:
         :return: {"run_id": self.run_id, "state": state}
         """
         wftype = request["workflow_type"].lower().strip()
-        version = request["workflow_type_version"]
-
-        if wftype == "cwl" and version not in ("v1.0", "v1.1", "v1.2"):
-            raise RuntimeError(
-                'workflow_type "cwl" requires '
-                '"workflow_type_version" to be "v1.[012]": ' + str(version)
-            )
-        if version != "2.7" and wftype == "py":
-            raise RuntimeError(
-                'workflow_type "py" requires '
-                '"workflow_type_version" to be "2.7": ' + str(version)
-            )
 
         logging.info("Beginning Toil Workflow ID: " + str(self.run_id))
 
-        with open(self.starttime, "w") as f:
-            f.write(str(time.time()))
         with open(self.request_json, "w") as f:
             json.dump(request, f)
         with open(self.input_json, "w") as inputtemp:
@@ -257,22 +524,32 @@ class ToilWorkflow:
         command_args = self.write_workflow(request, opts, tempdir, wftype=wftype)
         pid = self.call_cmd(command_args, tempdir)
 
-        with open(self.endtime, "w") as f:
-            f.write(str(time.time()))
         with open(self.pidfile, "w") as f:
             f.write(str(pid))
 
         return self.getstatus()
 
-    def getstate(self) -> tuple[str, int]:
+    def getstate(self, check_jobstore: bool = False) -> tuple[str, int]:
         """
         Returns QUEUED,          -1
                 INITIALIZING,    -1
                 RUNNING,         -1
+                CANCELING,       -1
+                CANCELED,        the exit code if it exited
                 COMPLETE,         0
                 or
                 EXECUTOR_ERROR, 255
+
+        Only files in the run directory are looked at, unless
+        check_jobstore is set and the runner cannot be watched from this
+        host, in which case Toil is asked whether the workflow completed.
         """
+        canceled = cancel_state(self.workdir)
+        if canceled is not None:
+            logging.info("Workflow " + self.run_id + ": " + canceled)
+            exit_info = read_exit(self.workdir)
+            return canceled, exit_info["exit_code"] if exit_info else -1
+
         # the jobstore never existed
         if not os.path.exists(self.jobstorefile):
             logging.info("Workflow " + self.run_id + ": QUEUED")
@@ -288,60 +565,64 @@ class ToilWorkflow:
             logging.info("Workflow " + self.run_id + ": EXECUTOR_ERROR")
             return "EXECUTOR_ERROR", 255
 
+        # the runner exited, as recorded by the run monitor
+        exit_info = read_exit(self.workdir)
+        alive = monitor_alive(self.workdir)
+        if exit_info is None and alive is False:
+            # The monitor writes exit.json before it exits, check again
+            # in case it exited after the first check.
+            exit_info = read_exit(self.workdir) or {"exit_code": 255}
+        if exit_info is not None:
+            if exit_info["exit_code"] == 0:
+                logging.info("Workflow " + self.run_id + ": COMPLETE")
+                open(self.statcompletefile, "a").close()
+                return "COMPLETE", 0
+            logging.info("Workflow " + self.run_id + ": EXECUTOR_ERROR")
+            open(self.staterrorfile, "a").close()
+            return "EXECUTOR_ERROR", 255
+
         # the workflow is staged but has not run yet
         if not os.path.exists(self.errfile):
             logging.info("Workflow " + self.run_id + ": INITIALIZING")
             return "INITIALIZING", -1
 
-        completed = False
-        with open(self.errfile) as f:
-            for line in f:
-                if "Traceback (most recent call last)" in line:
-                    logging.info("Workflow " + self.run_id + ": EXECUTOR_ERROR")
-                    open(self.staterrorfile, "a").close()
-                    return "EXECUTOR_ERROR", 255
+        if self.stderr_scanner().scan() is not None:
+            logging.info("Workflow " + self.run_id + ": EXECUTOR_ERROR")
+            open(self.staterrorfile, "a").close()
+            return "EXECUTOR_ERROR", 255
+
+        # the runner is on another host, or was started without a monitor
+        if check_jobstore and alive is None and self.jobstore_complete():
+            logging.info("Workflow " + self.run_id + ": COMPLETE")
+            open(self.statcompletefile, "a").close()
+            return "COMPLETE", 0
 
-        # get the jobstore
+        logging.info("Workflow " + self.run_id + ": RUNNING")
+        return "RUNNING", -1
+
+    def jobstore_complete(self) -> bool:
+        """Ask Toil whether the workflow in the jobstore has completed."""
         with open(self.jobstorefile) as f:
             jobstore = f.read().rstrip()
-        if (
+        metrics.SUBPROCESS_STARTS.inc(command="toil status")
+        return (
             subprocess.run(  # nosec B603
                 [
                     shutil.which("toil") or "toil",
                     "status",
                     "--failIfNotComplete",
                     jobstore,
-                ]
+                ],
+                stdout=subprocess.DEVNULL,
             ).returncode
             == 0
-        ):
-            # Get the PID of the running process
-            with open(self.pidfile) as f:
-                pid = int(f.read())
-            try:
-                os.kill(pid, 0)
-            except OSError as e:
-                if e.errno == errno.ESRCH:
-                    # Process is no longer running, could be completed
-                    completed = True
-                    # Reap zombie child processes in a non-blocking manner
-                    # os.WNOHANG still raises an error if no child processes exist
-                    try:
-                        os.waitpid(pid, os.WNOHANG)
-                    except OSError as e:
-                        if e.errno != errno.ECHILD:
-                            raise
-                else:
-                    raise
-            # If no exception, process is still running
-            # We can't rely on toil status as the process may not have created the jobstore yet
-        if completed:
-            logging.info("Workflow " + self.run_id + ": COMPLETE")
-            open(self.statcompletefile, "a").close()
-            return "COMPLETE", 0
+        )
 
-        logging.info("Workflow " + self.run_id + ": RUNNING")
-        return "RUNNING", -1
+    def stderr_scanner(self) -> LogScanner:
+        """Return the scanner looking for failures in the stderr of the run."""
+        return LogScanner(
+            self.errfile, os.path.join(self.workdir, "stderr.scan"), TOIL_FAILURES
+        )
 
     def getstatus(self) -> dict[str, Any]:
         """Report the current status."""
@@ -350,8 +631,63 @@ class ToilWorkflow:
         return {"run_id": self.run_id, "state": state}
 
 
-class ToilBackend(WESBackend):
-    processes: dict[str, Process] = {}
+class ToilBackend(LocalBackend):
+    """
+    Run workflows with Toil on this host.
+
+    Runners are started from the scheduler thread, without forking the
+    server, and reaped by the process supervisor as soon as they exit.
+    The outputs of completed runs are listed by a thread of their own, so
+    that the monitor keeps up with the other runs meanwhile.
+    Options, in addition to those of LocalBackend:
+
+    toil_poll_interval: seconds between checks of the running runs
+        (default 1)
+    toil_status_interval: minimum seconds between two ``toil status``
+        calls for a run whose runner cannot be watched from this host
+        (default 60)
+    """
+
+    def __init__(self, opts: list[str]) -> None:
+        """Set up the local backend and start monitoring the running runs."""
+        super().__init__(opts)
+        self.finalizer = ThreadPoolExecutor(1, thread_name_prefix="wes-toil-finalize")
+        self.monitor = ToilMonitor(
+            self.index,
+            lambda run_id, check_jobstore: self.workflow(run_id).getstate(
+                check_jobstore
+            )[0],
+            finished=self.finalize,
+            poll_interval=float(self.getopt("toil_poll_interval", default="1") or 1),
+            jobstore_interval=float(
+                self.getopt("toil_status_interval", default="60") or 60
+            ),
+        )
+        self.monitor.start()
+
+    def workflow(self, run_id: str, workdir: str | None = None) -> ToilWorkflow:
+        """Return the object representing run_id."""
+        return ToilWorkflow(run_id, self.index, workdir or self.run_dir(run_id))
+
+    def finalize(self, run_id: str) -> None:
+        """Have the output manifest of a run that just finished written."""
+        self.finalizer.submit(self.write_outputs, run_id)
+
+    def write_outputs(self, run_id: str) -> None:
+        """Write the output manifest of a run, if it completed."""
+        try:
+            job = self.workflow(run_id)
+            if job.getstate()[0] == "COMPLETE":
+                job.finalize()
+        except Exception:
+            logging.exception("Workflow %s: failed to finalize", run_id)
+
+    def run_status(self, run_id: str) -> dict[str, Any] | None:
+        """Return the status of a run as last recorded by the monitor."""
+        entry = self.index.get(run_id)
+        if entry is None:
+            return None
+        return {"run_id": run_id, "state": entry["state"]}
 
     def GetServiceInfo(self) -> dict[str, Any]:
         """Report about this WES endpoint."""
@@ -364,53 +700,10 @@ class ToilBackend(WESBackend):
             "supported_wes_versions": ["0.3.0", "1.0.0"],
             "supported_filesystem_protocols": ["file", "http", "https"],
             "workflow_engine_versions": ["3.16.0"],
-            "system_state_counts": {},
+            "system_state_counts": self.index.state_counts(),
             "key_values": {},
         }
 
-    def ListRuns(
-        self, page_size: Any = None, page_token: Any = None, state_search: Any = None
-    ) -> dict[str, Any]:
-        """List the known workflow runs."""
-        # FIXME #15 results don't page
-        if not os.path.exists(os.path.join(os.getcwd(), "workflows")):
-            return {"workflows": [], "next_page_token": ""}
-        wf = []
-        for entry in os.listdir(os.path.join(os.getcwd(), "workflows")):
-            if os.path.isdir(os.path.join(os.getcwd(), "workflows", entry)):
-                wf.append(ToilWorkflow(entry))
-
-        workflows = [{"run_id": w.run_id, "state": w.getstate()[0]} for w in wf]  # NOQA
-        return {"workflows": workflows, "next_page_token": ""}
-
-    def RunWorkflow(self, **args: str) -> dict[str, str]:
-        """Submit the workflow run request."""
-        tempdir, body = self.collect_attachments(args)
-
-        run_id = uuid.uuid4().hex
-        job = ToilWorkflow(run_id)
-        p = Process(target=job.run, args=(body, tempdir, self))
-        p.start()
-        self.processes[run_id] = p
-        return {"run_id": run_id}
-
-    def GetRunLog(self, run_id: str) -> dict[str, Any]:
-        """Get the log for a particular workflow run."""
-        job = ToilWorkflow(run_id)
-        return job.getlog()
-
-    def CancelRun(self, run_id: str) -> dict[str, str]:
-        """Cancel a submitted run."""
-        # should this block with `p.is_alive()`?
-        if run_id in self.processes:
-            self.processes[run_id].terminate()
-        return {"run_id": run_id}
-
-    def GetRunStatus(self, run_id: str) -> dict[str, str]:
-        """Determine the status for a given run."""
-        job = ToilWorkflow(run_id)
-        return job.getstatus()
-
 
 def create_backend(app: Any, opts: list[str]) -> ToilBackend:
     """Instantiate a ToilBackend."""
@@ -1,12 +1,25 @@
+import errno
+import hashlib
+import io
 import json
 import logging
 import os
+import shutil
+import subprocess  # nosec B404
 import tempfile
+import threading
+import time
+from collections import OrderedDict
 from collections.abc import Callable
-from typing import Any
+from typing import Any, Generic, TypeVar, cast
 
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
+from wes_service import metrics
+from wes_service.attachment_store import AttachmentStore, file_digest
+from wes_service.placement import VolumePlacement
+
 
 def visit(d: Any, op: Callable[[Any], Any]) -> None:
     """Recursively call op(d) for all list subelements and dictionary 'values' that d may have."""
@@ -19,6 +32,147 @@ def visit(d: Any, op: Callable[[Any], Any]) -> None:
             visit(i, op)
 
 
+def atomic_write(path: str, content: str) -> None:
+    """Write content to path so that readers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix="." + os.path.basename(path)
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def parse_state_search(state_search: Any) -> list[str] | None:
+    """Split a comma separated state_search parameter into a list of states."""
+    if not state_search:
+        return None
+    if isinstance(state_search, str):
+        state_search = state_search.split(",")
+    return [s.strip().upper() for s in state_search if s.strip()]
+
+
+_SIZE_SUFFIXES = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(value: str | None) -> int | None:
+    """Parse a size such as "500M" or "20G" into bytes; None or 0 means no limit."""
+    if not value:
+        return None
+    value = value.strip().upper().removesuffix("B")
+    multiplier = _SIZE_SUFFIXES.get(value[-1:], 1)
+    if value[-1:] in _SIZE_SUFFIXES:
+        value = value[:-1]
+    return int(float(value) * multiplier) or None
+
+
+_DURATION_SUFFIXES = {"S": 1, "M": 60, "H": 3600, "D": 86400, "W": 604800}
+
+
+def parse_duration(value: str | None) -> float | None:
+    """Parse a duration such as "90m" or "30d" into seconds; None or 0 means never."""
+    if not value:
+        return None
+    value = value.strip().upper()
+    multiplier = _DURATION_SUFFIXES.get(value[-1:], 1)
+    if value[-1:] in _DURATION_SUFFIXES:
+        value = value[:-1]
+    return float(value) * multiplier or None
+
+
+class StagedFile(io.FileIO):
+    """A file part being written to the staging directory."""
+
+    def __init__(self, path: str, max_size: int | None = None) -> None:
+        """Create path, refusing to write more than max_size bytes to it."""
+        super().__init__(path, "w+")
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.started = time.monotonic()
+        self.finished = self.started
+
+    def write(self, b: Any) -> int:
+        """Write a chunk, enforcing the size limit."""
+        self.size += len(b)
+        if self.max_size is not None and self.size > self.max_size:
+            raise RequestEntityTooLarge(
+                f"Attachment exceeds the limit of {self.max_size} bytes"
+            )
+        self.sha256.update(b)
+        n = super().write(b)
+        self.finished = time.monotonic()
+        return n or 0
+
+    def elapsed(self) -> float:
+        """Seconds spent receiving the file."""
+        return self.finished - self.started
+
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    A thread-safe cache which forgets the least recently used entries.
+
+    Each entry may be stored with a token, such as an mtime or a
+    generation number; a lookup with a different token is a miss.  With
+    a ttl, entries unused for that many seconds are forgotten too.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None) -> None:
+        """Create a cache holding up to maxsize entries."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[K, tuple[Any, V, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K, token: Any = None) -> V | None:
+        """Return the value stored for key with token, or None."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != token:
+                return None
+            self._entries[key] = (entry[0], entry[1], now)
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: K, value: V, token: Any = None) -> None:
+        """Store value for key."""
+        if self.maxsize <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (token, value, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._expire(now)
+
+    def pop(self, key: K) -> None:
+        """Forget key."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _expire(self, now: float) -> None:
+        # Entries are in order of last use, so the expired ones come first.
+        if self.ttl is None:
+            return
+        while self._entries:
+            key, (_token, _value, used) = next(iter(self._entries.items()))
+            if now - used < self.ttl:
+                break
+            del self._entries[key]
+
+
 class WESBackend:
     """Stores and retrieves options.  Intended to be inherited."""
 
@@ -28,6 +182,19 @@ class WESBackend:
         for o in opts if opts else []:
             k, v = o.split("=", 1)
             self.pairs.append((k, v))
+        store = self.getopt("attachment_store")
+        self.attachment_store = (
+            AttachmentStore(store, parse_size(self.getopt("attachment_store_size")))
+            if store
+            else None
+        )
+        self.placement = VolumePlacement(
+            self.getoptlist("volume"),
+            self.getopt("staging_dir"),
+            cast(str, self.getopt("placement", default="balanced")),
+        )
+        self._engine_versions: dict[str, tuple[tuple[int, int, int], float, str]] = {}
+        self._engine_versions_lock = threading.Lock()
 
     def getopt(self, p: str, default: str | None = None) -> str | None:
         """Returns the first option value stored that matches p or default."""
@@ -44,58 +211,225 @@ class WESBackend:
                 optlist.append(v)
         return optlist
 
+    def engine_version(self, executable: str) -> str:
+        """
+        Returns what "executable --version" prints on stderr.
+
+        The result is cached for "service_info_ttl" seconds (default
+        300), or until the executable is replaced.
+        """
+        path = shutil.which(executable) or executable
+        try:
+            st = os.stat(path)
+            key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            key = (0, 0, 0)
+        ttl = float(self.getopt("service_info_ttl", default="300") or 0)
+        with self._engine_versions_lock:
+            cached = self._engine_versions.get(path)
+            if cached is not None and cached[0] == key and cached[1] > time.time():
+                return cached[2]
+            metrics.SUBPROCESS_STARTS.inc(command=os.path.basename(path) + " --version")
+            stdout, stderr = subprocess.Popen(  # nosec B603
+                [path, "--version"], stderr=subprocess.PIPE
+            ).communicate()
+            version = str(stderr)
+            self._engine_versions[path] = (key, time.time() + ttl, version)
+            return version
+
+    def get_page_size(self, page_size: Any) -> int:
+        """
+        Returns the page size to use for a ListRuns request.
+
+        Defaults to, and is capped by, the "max_page_size" option.
+        """
+        max_page_size = int(self.getopt("max_page_size", default="100") or 100)
+        if page_size is None:
+            return max_page_size
+        if int(page_size) < 1:
+            raise ValueError("page_size must be a positive integer")
+        return min(int(page_size), max_page_size)
+
+    def StreamEvents(self, **args: Any) -> tuple[dict[str, Any], int]:
+        """
+        Refuse to stream run state changes.
+
+        The stream is served by EventStreamMiddleware, in front of the API,
+        for the backends that support it.
+        """
+        msg = "This backend does not stream events"
+        return {"msg": msg, "status_code": 501}, 501
+
     def log_for_run(self, run_id: str | None, message: str) -> None:
         """Report the log for a given run."""
         logging.info("Workflow %s: %s", run_id, message)
 
+    def stage_attachment(
+        self, run_id: str | None, file: Any, tempdir: str, dest: str
+    ) -> None:
+        """
+        Move an uploaded attachment to dest in tempdir.
+
+        Attachments that were streamed to a StagedFile are renamed into
+        place, anything else is copied.  With an attachment store, dest
+        is instead linked to the stored copy of the content.
+        """
+        stream = file.stream
+        if not isinstance(stream, StagedFile):
+            file.save(dest)
+            metrics.ATTACHMENT_BYTES.inc(os.path.getsize(dest))
+            if self.attachment_store is not None:
+                self.attachment_store.materialize(
+                    dest, file_digest(dest), dest, tempdir
+                )
+            return
+        stream.flush()
+        metrics.ATTACHMENT_BYTES.inc(stream.size)
+        if self.attachment_store is not None:
+            known = self.attachment_store.materialize(
+                stream.path, stream.sha256.hexdigest(), dest, tempdir
+            )
+            if known:
+                self.log_for_run(
+                    run_id, f"Attachment {file.filename!r} is already stored"
+                )
+        else:
+            try:
+                os.rename(stream.path, dest)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(stream.path, dest)
+        elapsed = stream.elapsed()
+        rate = stream.size / elapsed / 1e6 if elapsed > 0 else float("inf")
+        self.log_for_run(
+            run_id,
+            f"Received attachment {file.filename!r}: {stream.size} bytes "
+            f"in {elapsed:.2f}s ({rate:.1f} MB/s)",
+        )
+
+    def staging_dir_for(self, args: dict[str, Any]) -> str | None:
+        """Return where to collect the attachments in args, on the volume they were received on."""
+        for file in args.get("workflow_attachment") or []:
+            if isinstance(file.stream, StagedFile):
+                volume = self.placement.volume_of(file.stream.path)
+                return self.placement.staging_dir(volume)
+        return self.placement.staging_dir(self.placement.choose())
+
     def collect_attachments(
         self, args: dict[str, Any], run_id: str | None = None
     ) -> tuple[str, dict[str, str]]:
-        """Stage all attachments to a temporary directory."""
-        tempdir = tempfile.mkdtemp()
-        body: dict[str, str] = {}
-        has_attachments = False
-        for k, v in args.items():
-            if k == "workflow_attachment":
-                for file in v or []:
-                    sp = file.filename.split("/")
-                    fn = []
-                    for p in sp:
-                        if p not in ("", ".", ".."):
-                            fn.append(secure_filename(p))
-                    dest = os.path.join(tempdir, *fn)
-                    if not os.path.isdir(os.path.dirname(dest)):
-                        os.makedirs(os.path.dirname(dest))
-                    self.log_for_run(
-                        run_id,
-                        f"Staging attachment {file.filename!r} to {dest!r}",
-                    )
-                    file.save(dest)
-                    has_attachments = True
-                    body["workflow_attachment"] = (
-                        "file://%s" % tempdir
-                    )  # Reference to temp working dir.
-            elif k in ("workflow_params", "tags", "workflow_engine_parameters"):
-                if v is not None:
-                    body[k] = json.loads(v)
-            else:
-                body[k] = v
-        if "workflow_url" in body:
-            if ":" not in body["workflow_url"]:
-                if not has_attachments:
-                    raise ValueError(
-                        "Relative 'workflow_url' but missing 'workflow_attachment'"
+        """
+        Stage all attachments to a temporary directory.
+
+        The directory is removed again if the request is refused.
+        """
+        tempdir = tempfile.mkdtemp(dir=self.staging_dir_for(args))
+        try:
+            body: dict[str, str] = {}
+            has_attachments = False
+            for k, v in args.items():
+                if k == "workflow_attachment":
+                    for file in v or []:
+                        sp = file.filename.split("/")
+                        fn = []
+                        for p in sp:
+                            if p not in ("", ".", ".."):
+                                fn.append(secure_filename(p))
+                        dest = os.path.join(tempdir, *fn)
+                        if not os.path.isdir(os.path.dirname(dest)):
+                            os.makedirs(os.path.dirname(dest))
+                        self.log_for_run(
+                            run_id,
+                            f"Staging attachment {file.filename!r} to {dest!r}",
+                        )
+                        self.stage_attachment(run_id, file, tempdir, dest)
+                        has_attachments = True
+                        body["workflow_attachment"] = (
+                            "file://%s" % tempdir
+                        )  # Reference to temp working dir.
+                elif k in ("workflow_params", "tags", "workflow_engine_parameters"):
+                    if v is not None:
+                        body[k] = json.loads(v)
+                else:
+                    body[k] = v
+            if "workflow_url" in body:
+                if ":" not in body["workflow_url"]:
+                    if not has_attachments:
+                        raise ValueError(
+                            "Relative 'workflow_url' but missing 'workflow_attachment'"
+                        )
+                    body["workflow_url"] = "file://%s" % os.path.join(
+                        tempdir, secure_filename(body["workflow_url"])
                     )
-                body["workflow_url"] = "file://%s" % os.path.join(
-                    tempdir, secure_filename(body["workflow_url"])
+                self.log_for_run(
+                    run_id, "Using workflow_url '%s'" % body.get("workflow_url")
                 )
-            self.log_for_run(
-                run_id, "Using workflow_url '%s'" % body.get("workflow_url")
-            )
-        else:
-            raise ValueError("Missing 'workflow_url' in submission")
+            else:
+                raise ValueError("Missing 'workflow_url' in submission")
 
-        if "workflow_params" not in body:
-            raise ValueError("Missing 'workflow_params' in submission")
+            if "workflow_params" not in body:
+                raise ValueError("Missing 'workflow_params' in submission")
+        except BaseException:
+            # Nothing refers to the staged attachments yet.
+            self.remove_attachments(tempdir)
+            raise
 
         return tempdir, body
+
+    def collect_params_list(self, args: dict[str, Any]) -> list[dict[str, Any]]:
+        """
+        Remove and return the parameter sets of a bulk submission from args.
+
+        They are either a JSON array in "workflow_params" or a file in
+        "workflow_params_jsonl" with one JSON object per line.  At most
+        "max_bulk_runs" (default 1000) sets are accepted.
+        """
+        params = args.pop("workflow_params", None)
+        jsonl = args.pop("workflow_params_jsonl", None)
+        if params is not None:
+            params_list = json.loads(params)
+        elif jsonl is not None:
+            if isinstance(jsonl, list):
+                jsonl = jsonl[0]
+            params_list = [json.loads(line) for line in jsonl.stream if line.strip()]
+        else:
+            raise ValueError(
+                "Missing 'workflow_params' or 'workflow_params_jsonl' in submission"
+            )
+        if not isinstance(params_list, list) or not all(
+            isinstance(p, dict) for p in params_list
+        ):
+            raise ValueError("'workflow_params' must be a list of JSON objects")
+        if not params_list:
+            raise ValueError("'workflow_params' must not be empty")
+        max_runs = int(self.getopt("max_bulk_runs", default="1000") or 0)
+        if max_runs and len(params_list) > max_runs:
+            raise ValueError(f"At most {max_runs} runs can be submitted at once")
+        return params_list
+
+    def remove_attachments(self, tempdir: str) -> None:
+        """Remove a directory of collected attachments and its store references."""
+        shutil.rmtree(tempdir, ignore_errors=True)
+        if self.attachment_store is not None:
+            self.attachment_store.release(tempdir)
+
+    def clone_attachments(
+        self, tempdir: str, body: dict[str, Any], workflow_params: dict[str, Any]
+    ) -> tuple[str, dict[str, Any]]:
+        """
+        Give one run of a bulk submission its own copy of tempdir.
+
+        The staged files are hardlinked rather than copied, so every run
+        shares the same data.  Returns the new directory and the request
+        body with workflow_params and the references to tempdir replaced.
+        """
+        clone = tempfile.mkdtemp(dir=os.path.dirname(tempdir))
+        shutil.copytree(tempdir, clone, copy_function=os.link, dirs_exist_ok=True)
+        if self.attachment_store is not None:
+            self.attachment_store.share(tempdir, clone)
+        body = dict(body, workflow_params=workflow_params)
+        for k in ("workflow_url", "workflow_attachment"):
+            if str(body.get(k, "")).startswith("file://" + tempdir):
+                body[k] = "file://" + clone + body[k][len("file://" + tempdir) :]
+        return clone, body
@@ -9,8 +9,14 @@ from typing import cast
 import connexion  # type: ignore[import-untyped]
 import connexion.utils as utils  # type: ignore[import-untyped]
 import ruamel.yaml
+from connexion.middleware import MiddlewarePosition  # type: ignore[import-untyped]
 from connexion.resolver import Resolver  # type: ignore[import-untyped]
 
+from wes_service import metrics
+from wes_service.events import EventStreamMiddleware
+from wes_service.local_backend import LocalBackend
+from wes_service.staging import setup_staging, validator_map
+
 logging.basicConfig(level=logging.INFO)
 
 
@@ -36,11 +42,31 @@ def setup(args: argparse.Namespace | None = None) -> connexion.App:
         app, args.opt
     )
 
+    setup_staging(app.app, backend)
+
     def rs(x: str) -> str:
-        return cast(str, getattr(backend, x.split(".")[-1]))
+        operation = x.split(".")[-1]
+        return cast(str, metrics.instrument(operation, getattr(backend, operation)))
 
     app.add_api(
-        "openapi/workflow_execution_service.swagger.yaml", resolver=Resolver(rs)
+        "openapi/workflow_execution_service.swagger.yaml",
+        resolver=Resolver(rs),
+        validator_map=validator_map(),
+    )
+    if isinstance(backend, LocalBackend):
+        app.add_middleware(
+            EventStreamMiddleware,
+            position=MiddlewarePosition.BEFORE_SWAGGER,
+            index=backend.index,
+        )
+    app.app.add_url_rule(
+        "/metrics",
+        "metrics",
+        lambda: (
+            metrics.REGISTRY.render(),
+            200,
+            {"Content-Type": metrics.CONTENT_TYPE},
+        ),
     )
 
     return app